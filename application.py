@@ -8,29 +8,51 @@ Date: May 29, 2020
 """
 
 #--------------------------------------------Imports----------------------------------------------------------------
-import dash
-import dash_core_components as dcc
-import dash_html_components as html
-import dash_auth
-import plotly.graph_objs as go
-import plotly.express as px
-import pandas as pd
+import startup_profile   #first, so the startup phases below are timed (set CAS_STARTUP_REPORT to see them)
+
+with startup_profile.phase("import dash"):
+    import dash
+    import dash_core_components as dcc
+    import dash_html_components as html
+    import dash_auth
+with startup_profile.phase("import plotly"):
+    import plotly.graph_objs as go
+    import plotly.express as px
 from datetime import datetime as dt
 from datetime import timedelta
-import pathlib
-import ast
-import json
+import os
+import functools
+import flask
 
-from dash.dependencies import Input, Output, State
+from dash.dependencies import Input, Output, State, ClientsideFunction
+from dash.exceptions import PreventUpdate
 
+with startup_profile.phase("import datastore"):   #pandas and numpy
+    import datastore
+import figure_cache
+import generations
+import http_cache
+import downsample
+import metrics
+import precompute
+import serialization
 
-#--------------------------------------------Server,  file path, and tokens----------------------------------------------
+
+#--------------------------------------------Server and tokens----------------------------------------------
 
 app = dash.Dash(
-    __name__, meta_tags=[{"name": "viewport", "content": "width=device-width"}]
+    __name__, meta_tags=[{"name": "viewport", "content": "width=device-width"}],
+    suppress_callback_exceptions=True,  #the components of a tab are only in the layout once the tab is rendered
+    compress=False                      #compressed with brotli or gzip by http_cache below
 )
 application = app.server
 
+#brotli/gzip compression of the responses over CAS_COMPRESS_MIN_SIZE bytes, see http_cache.py
+http_cache.init_compression(application)
+
+#responses are json encoded with serialization.FastJSONEncoder (orjson, no copy of the figures) instead of plotly's
+serialization.install()
+
 # Optional Authentication
 # VALID_USERNAME_PASSWORD_PAIRS = {
 #     'username': 'password'
@@ -40,72 +62,45 @@ application = app.server
 #     VALID_USERNAME_PASSWORD_PAIRS
 # )
 
-PATH = pathlib.Path(__file__).parent
-
-DATA_PATH = PATH.joinpath("data").resolve()
-
 #mapbox authentication
 mapbox_token="mymapbox token"  #my mapbox token
 
-#--------------------------------------------data processing----------------------------------------------------------
-
-#process data
-df  = pd.read_csv(DATA_PATH.joinpath("emailStat.csv"))
-df2 = pd.read_csv(DATA_PATH.joinpath("webStat.csv"))
-df3 = pd.read_csv(DATA_PATH.joinpath("wechatFollower.csv"))
-df4 = pd.read_csv(DATA_PATH.joinpath("wechatTotalReads.csv"))
-df5 = pd.read_csv(DATA_PATH.joinpath("wechatArticleSource.csv"))
-
-
-# Email - get a list of email article types for the dropdown box
-article_types = df['article_type'].unique()
-
-# Website - table for all country codes
-country_code=pd.read_csv("data/country_codes.csv")
-
-# Website - load the countries_geo_json file for plotting the Choropleth map
-with open('data/world_geo_json.json') as f:
-    countries_geo_json = json.load(f)
+#clientside chart mode. When "1", the web trend and WeChat follower/article series are sent to the browser once in a
+#dcc.Store, and their charts are drawn by clientside callbacks (assets/clientside.js) without a server round trip
+CLIENTSIDE_CHARTS = os.environ.get("CAS_CLIENTSIDE_CHARTS", "0") == "1"
 
-# Website - get a list of webstats.
-# daily stats
-webStatsList= ['requests_all', 'threats_all', 'pageviews_all','unique_visitors', 'pageview_per_visitor']
-# cumulative stats
-webCumStatsList= ['requests_all', 'threats_all', 'pageviews_all','unique_visitors']
+#load every dataset when the app starts, instead of when its tab is first opened
+PRELOAD_DATA = os.environ.get("CAS_PRELOAD_DATA", "0") == "1"
 
-# Website - numEtries will be used for the sliderbar
-numEntries=df2.shape[0]
-lst1=[i for i in range (0, numEntries)]
-lst2=df2.date
-markDict={key:str(value) for (key,value) in zip(lst1, lst2)}
+#"1" when the app is imported by a server that forks its workers afterwards (set by gunicorn.conf.py). The background
+#threads (data watcher, figure precompute) are then started in every worker after the fork, not here in the master
+PREFORK_SERVER = os.environ.get("CAS_PREFORK_SERVER", "0") == "1"
 
-# General - function to get max date in the dataframe for date range picker
-def get_max_date(dateCol):
-    """
-    Get the max date in the data set
-    :param dateCol: A single pandas dataframe column containing the date information in YYYY-MM-DD format
-    :return: maxDate in python datetime format
-    """
-    maxYear, maxMonth, maxDate = [int(x) for x in max(dateCol).split('-')]  # we read from csv so the date is actually string!
-    maxDate=dt(maxYear, maxMonth, maxDate)  # use the max dates to set the date picker. Min date is 2020-05-15
-    return maxDate
+#--------------------------------------------data processing----------------------------------------------------------
 
-# Website - get max date for date range picker
-webMaxDate=get_max_date(df2.date)
+# All data is read through the data store, see datastore.py. Callbacks get the current snapshot of a dataset with
+# store.get("email"), store.get("web") or store.get("wechat"), and read the derived values from it.
+# With CAS_SHARED_DATA, the server processes share one memory mapped copy of the data, see generations.py
+store = datastore.DataStore(datastore.DATASETS, generations=generations.make_generations(datastore.DATA_PATH))
 
-# Website - get the max and min requests for country. Use these 2 numbers to set the range of the gradient bar in Geo chart
-countryReqDictList=[ast.literal_eval(countryDict) for countryDict in df2.requests_country.ravel()]
-maxReq=max([max(countryReqDict.values()) for countryReqDict in countryReqDictList])
-minReq=min([min(countryReqDict.values()) for countryReqDict in countryReqDictList])
+# Figures returned by the callbacks are cached per (callback, inputs, data version), see figure_cache.py
+figureCache = figure_cache.make_figure_cache(store)
 
-# WeChat - Use the previous function I defined to get max date for the date range picker
-wechatMaxDate=get_max_date(df3.date)
+# ETags of the callback responses (keyed by the data versions) and of the pages, long-lived caching of the assets
+httpCache = http_cache.HttpCache(app, store)
 
-# WeChat - get a list of wechat follower stats
-wechatFollowerStatsList=["new","unfollowed","net_increase","total"]
+# Website and WeChat - the lists of stats for the dropdown boxes
+from datastore import webStatsList, webCumStatsList, wechatFollowerStatsList, wechatArticleStatsList
 
-# WeChat - get a list of wechat article stats
-wechatArticleStatsList=["reads","shares","jump_to_original","saves"]
+# Default views: the values of the controls when a tab is opened. Their figures are precomputed first, see precompute.py
+EMAIL_DEFAULT_VIEW = ('newsletter', 'unique_opens', 'Percent')   #article type, y axis, y axis type
+WEB_START_DATE = dt(2020, 5, 15)
+WEB_DEFAULT_STATS = ['pageviews_all', 'unique_visitors']       #daily and cumulative website stats
+WECHAT_START_DATE = dt(2016, 8, 15)
+WECHAT_FOLLOWER_DEFAULT_STATS = ['net_increase', 'total']
+WECHAT_ARTICLE_START_DATE = dt(2017, 1, 1)
+WECHAT_ARTICLE_DEFAULT_STATS = ['reads', 'shares']
+GRANULARITIES = ['day', 'week', 'month']                       #the first one is the default
 
 #--------------------------------------------Layout and styles ------------------------------------------------------
 
@@ -126,6 +121,65 @@ general_layout={
     }
 }
 
+#Website - the Choropleth map figure. It is built ONCE per snapshot (with the geo json) and sent with the page layout.
+#Slider moves only replace `locations` and `z` in the browser, see updateWebTrafficGeo()
+def build_geo_figure(web):
+    """
+    Build the Choropleth map figure for the website traffic geo chart
+    :param web: snapshot of the web dataset
+    :return: plotly figure, showing the default slider position
+    """
+    geoFrame = web.geoFrames[web.numEntries//2]
+
+    # create a figure
+    fig=go.Figure()
+
+    # add trace. Note that the names for arugments are different from the px.choropleth_mapbox() function.
+    # Read the go.Choroplethmapbox() documentation for details!
+    fig.add_trace(
+        go.Choroplethmapbox(geojson=web.geoShapes.to_geo_json(),        # geo json file in json format
+                            locations=geoFrame['locations'],            # 3_letter fips code of each country
+                            z=geoFrame['z'],                            # total number of requests from each country
+                            zmin=web.minReq,                            # if a shared colobar is used, you can specify the global min on the color bar
+                            zmax=web.maxReq,                            # if a shared colobar is used, you can specify the global min on the color bar
+                            colorscale="Plasma")                        # color map to use
+    )
+
+    # update the mapbox layout.
+    # Note that the names for arugments are different from the px.choropleth_mapbox() function.
+    # specifically, you need to add `mapbox_` to the mapbox parameters!
+    fig.update_layout(
+        mapbox_accesstoken=mapbox_token,                    # your mapbox token
+        mapbox_style="carto-positron",                      # mapbox style
+        mapbox_center={"lat": 41.141478, "lon": 3.169980},  # center on mediterranean sea
+        mapbox_zoom=1                                       # zoom 1
+    )
+
+    # update the graph layout
+    fig.update_layout(
+        autosize=True,
+        margin=dict(t=0, b=20, l=2, r=2),
+        uirevision="web-traffic-geo"    # keep the user's pan/zoom when the slider patches the figure
+    )
+
+    return fig
+
+#the figure of the current web snapshot, built by each server process from the shared geo shapes: the geo json is
+#too big to be copied into the generations or the figure cache
+geoFigures = {}   # dataKey -> figure
+
+def geo_figure(web):
+    """
+    :param web: snapshot of the web dataset
+    :return: the Choropleth map figure of the snapshot, see build_geo_figure()
+    """
+    figure = geoFigures.get(web.dataKey)
+    if figure is None:
+        figure = build_geo_figure(web)
+        geoFigures.clear()   # only the figure of the current snapshot is kept
+        geoFigures[web.dataKey] = figure
+    return figure
+
 #Layout  for tabs
 #this is the layout for the tabs GROUP
 # tabs_styles = {
@@ -145,478 +199,664 @@ tab_selected_style = {
     'color': 'white',
     'padding': '24px'
 }
-#--------------------------------------------Main app -----------------------------------------------------------------
 
-#App Layout
-app.layout = html.Div(
+#the controls of the tabs keep the user's choices for the browser session. A tab is rendered again, with the default
+#values, every time it is opened, see render_tab()
+CONTROL_PERSISTENCE = {"persistence": True, "persistence_type": "session"}
+
+#Granularity selector of the daily charts. The weekly and monthly levels are served from the rollups of the datasets
+def granularity_selector(id):
+    """
+    :param id: ID of the dcc.RadioItems, for the callback
+    :return: list of the header and the radio items
+    """
+    return [
+        html.H6("Granularity"),
+        dcc.RadioItems(
+            id=id,
+            **CONTROL_PERSISTENCE,
+            options=[{'label': label, 'value': level} for label, level in zip(['daily', 'weekly', 'monthly'], GRANULARITIES)],
+            value=GRANULARITIES[0],
+            labelStyle={'display': 'inline-block'}
+        ),
+    ]
+
+#Series of the clientside charts: {level: {"date": [...], <stat>: [...], ...}}, for every granularity level
+def series_levels(rollups):
+    """
+    :param rollups: timeseries.Rollups of a dataset
+    :return: dict for a dcc.Store
+    """
+    return {level: rollups[level].to_dict() for level in rollups.levels}
 
-    children=[
+#--------------------------------------------Main app -----------------------------------------------------------------
 
-        # Top Banner
+# ----------------------------------------------------------------------------------------------------------
+#                                           1st tab - Email campaign
+# ----------------------------------------------------------------------------------------------------------
+def email_tab(email):
+    """
+    Layout of the email campaign tab
+    :param email: snapshot of the email dataset
+    :return: html.Div with the content of the tab
+    """
+    return html.Div(
+            children=[
+        # body pannel - Email campaign
         html.Div(
-            className="study-browser-banner row",
+            className="row app-body",
             children=[
-                html.H2(className="h2-title", children="Analytics Dashboard for Chinese Antibody Society's Media Platforms"), #set widescreen title here!
-                html.Div(
-                    className="div-logo",
-                    children=html.Img(
-                        className="logo", src=app.get_asset_url("dash-logo-new.png")
-                    ),
-                ),
-                html.H2(className="h2-title-mobile", children="CAS Analytics Dashboard"), #set mobile title here!
-            ],
-        ),
 
-        # Define a list of tabs
-        dcc.Tabs([
-
-            # ----------------------------------------------------------------------------------------------------------
-            #                                            1st tab - Email campaign
-            # ----------------------------------------------------------------------------------------------------------
-            dcc.Tab(label='Email Campaigns', style=tab_style, selected_style=tab_selected_style,   #apply my custom styles as specifid in this app (not in CSS!)
-                    children=[
-                # body pannel - Email campaign
+                # User control box - Email Campaigns
                 html.Div(
-                    className="row app-body",
+                    className="four columns card",  #4 column here, so it is 4:8 split
                     children=[
-
-                        # User control box - Email Campaigns
                         html.Div(
-                            className="four columns card",  #4 column here, so it is 4:8 split
+                            className="bg-white user-control",
                             children=[
                                 html.Div(
-                                    className="bg-white user-control",
-                                    children=[
-                                        html.Div(
-                                        className="padding-top-bot",
-                                        children=[
-                                            #section header
-                                            html.H4("Email Campaigns"),
-                                            #specify dropdown box content
-                                            html.H6("Select Type of Email Campaign"),
-                                            dcc.Dropdown(
-                                                id='article-type-dd',  #use this ID for call-back
-                                                options=[{'label': i, 'value': i} for i in article_types],
-                                                value='newsletter'
-                                            ),
-
-                                            # specify dropdown box content
-                                            html.H6("Y axis"),
-                                            dcc.Dropdown(
-                                                id='y-axis',          #use this ID for call-back
-                                                options=[
-                                                    {'label': 'unique opens', 'value': 'unique_opens'},  #value needs to match column header
-                                                    {'label': 'unique clicks', 'value':'unique_clicks'}
-                                                ],
-                                                value='unique_opens'  #must be the same as the value specified above
-                                            ),
-
-                                            # specify dropdown box content
-                                            html.H6("Y axis type"),
-                                            dcc.RadioItems(
-                                                id='y-axis-dt',       #use this ID for call-back
-                                                options=[{'label': i, 'value': i} for i in ['Percent', 'Total']],
-                                                value='Percent',
-                                                labelStyle={'display': 'inline-block'}
-                                            )
+                                className="padding-top-bot",
+                                children=[
+                                    #section header
+                                    html.H4("Email Campaigns"),
+                                    #specify dropdown box content
+                                    html.H6("Select Type of Email Campaign"),
+                                    dcc.Dropdown(
+                                        id='article-type-dd',  #use this ID for call-back
+                                        **CONTROL_PERSISTENCE,
+                                        options=[{'label': i, 'value': i} for i in email.article_types],
+                                        value=EMAIL_DEFAULT_VIEW[0]
+                                    ),
+
+                                    # specify dropdown box content
+                                    html.H6("Y axis"),
+                                    dcc.Dropdown(
+                                        id='y-axis',          #use this ID for call-back
+                                        **CONTROL_PERSISTENCE,
+                                        options=[
+                                            {'label': 'unique opens', 'value': 'unique_opens'},  #value needs to match column header
+                                            {'label': 'unique clicks', 'value':'unique_clicks'}
                                         ],
-                                        )
-                                    ]
+                                        value=EMAIL_DEFAULT_VIEW[1]  #must be the same as the value specified above
+                                    ),
+
+                                    # specify dropdown box content
+                                    html.H6("Y axis type"),
+                                    dcc.RadioItems(
+                                        id='y-axis-dt',       #use this ID for call-back
+                                        **CONTROL_PERSISTENCE,
+                                        options=[{'label': i, 'value': i} for i in ['Percent', 'Total']],
+                                        value=EMAIL_DEFAULT_VIEW[2],
+                                        labelStyle={'display': 'inline-block'}
+                                    )
+                                ],
                                 )
                             ]
-                        ),
+                        )
+                    ]
+                ),
 
-                        # 1st Graph - Email Campaigns
+                # 1st Graph - Email Campaigns
+                html.Div(
+                    className="eight columns card-left",  #8 column here, so it is 4:8 split
+                    children=[
                         html.Div(
-                            className="eight columns card-left",  #8 column here, so it is 4:8 split
+                            className="bg-white",
                             children=[
-                                html.Div(
-                                    className="bg-white",
-                                    children=[
-                                        html.H4("Email Reader Engagement Trends"),
-                                        dcc.Graph(id="email-trend-plot"),             #use id for callback
-                                    ],
-                                )
+                                html.H4("Email Reader Engagement Trends"),
+                                dcc.Graph(id="email-trend-plot"),             #use id for callback
                             ],
-                        ),
-                    ]
+                        )
+                    ],
                 ),
-            ]),
+            ]
+        ),
+    ])
 
-            # ----------------------------------------------------------------------------------------------------------
-            #                                                   2nd tab - Website Traffic
-            # ----------------------------------------------------------------------------------------------------------
-            dcc.Tab(label='Website Traffic', style=tab_style, selected_style=tab_selected_style,
-                    children=[
 
-                # 1st row body pannel - small container cards for web data - Website traffic
+# ----------------------------------------------------------------------------------------------------------
+#                                          2nd tab - Website Traffic
+# ----------------------------------------------------------------------------------------------------------
+def web_tab(web):
+    """
+    Layout of the website traffic tab
+    :param web: snapshot of the web dataset
+    :return: html.Div with the content of the tab
+    """
+    return html.Div(
+            children=[
+
+        # 1st row body pannel - small container cards for web data - Website traffic
+        html.Div(
+            className="row app-body",
+            children=[
+
+                # 1st container card for Website traffic
                 html.Div(
-                    className="row app-body",
+                    className="four columns card-statsbox",  # 4 column here. Use my layout for stats box
                     children=[
-
-                        # 1st container card for Website traffic
                         html.Div(
-                            className="four columns card-statsbox",  # 4 column here. Use my layout for stats box
+                            className="bg-white-container", # use my layout for contents WITHIN the small container box.
                             children=[
-                                html.Div(
-                                    className="bg-white-container", # use my layout for contents WITHIN the small container box.
-                                    children=[
-                                        html.H4("Avg Unique Visitors /Day", style={'text-align': 'center'}),
-                                        html.H1(id="avgVisitorText",children=["No Data"], style={'text-align': 'center'}),  #"No Data" is the default text to show if data can't be retrieved
-                                    ],
-                                )
+                                html.H4("Avg Unique Visitors /Day", style={'text-align': 'center'}),
+                                html.H1(id="avgVisitorText",children=["No Data"], style={'text-align': 'center'}),  #"No Data" is the default text to show if data can't be retrieved
                             ],
-                        ),
+                        )
+                    ],
+                ),
 
-                        # 2nd container card for Website traffic
+                # 2nd container card for Website traffic
+                html.Div(
+                    className="four columns card-statsbox",  # 4 column here
+                    children=[
                         html.Div(
-                            className="four columns card-statsbox",  # 4 column here
+                            className="bg-white-container",
                             children=[
-                                html.Div(
-                                    className="bg-white-container",
-                                    children=[
-                                        html.H4("Avg Page Views /Day", style={'text-align': 'center'}),
-                                        html.H1(id="avgPagePerDay", children=["No Data"], style={'text-align': 'center'}),
-                                        # "No Data" is the default text to show if data can't be retrieved
-                                    ],
-                                )
+                                html.H4("Avg Page Views /Day", style={'text-align': 'center'}),
+                                html.H1(id="avgPagePerDay", children=["No Data"], style={'text-align': 'center'}),
+                                # "No Data" is the default text to show if data can't be retrieved
                             ],
-                        ),
+                        )
+                    ],
+                ),
 
-                        # 3rd container card for Website traffic
+                # 3rd container card for Website traffic
+                html.Div(
+                    className="four columns card-statsbox",  # 4 column here
+                    children=[
                         html.Div(
-                            className="four columns card-statsbox",  # 4 column here
+                            className="bg-white-container",
                             children=[
-                                html.Div(
-                                    className="bg-white-container",
-                                    children=[
-                                        html.H4("Avg Page Views /Visitor", style={'text-align': 'center'}),
-                                        html.H1(id="avgPagePerVisit", children=["No Data"],
-                                                style={'text-align': 'center'}),
-                                        # "No Data" is the default text to show if data can't be retrieved
-                                    ],
-                                )
+                                html.H4("Avg Page Views /Visitor", style={'text-align': 'center'}),
+                                html.H1(id="avgPagePerVisit", children=["No Data"],
+                                        style={'text-align': 'center'}),
+                                # "No Data" is the default text to show if data can't be retrieved
                             ],
-                        ),
-
-                    ]
+                        )
+                    ],
                 ),
 
-                # 2nd row body pannel - Daily website traffic
+            ]
+        ),
+
+        # 2nd row body pannel - Daily website traffic
+        html.Div(
+            className="row app-body",
+            children=[
+                # user control box - Website traffic
                 html.Div(
-                    className="row app-body",
+                    className="four columns card",  # 4 column here, so it is 4:8 split
                     children=[
-                        # user control box - Website traffic
                         html.Div(
-                            className="four columns card",  # 4 column here, so it is 4:8 split
+                            className="bg-white user-control",
                             children=[
                                 html.Div(
-                                    className="bg-white user-control",
+                                    className="padding-top-bot",
                                     children=[
-                                        html.Div(
-                                            className="padding-top-bot",
-                                            children=[
-                                                # section header
-                                                html.H4("Daily Website Stats"),
-                                                # specify dropdown box content
-                                                html.H6("Select (multiple) stats to view"),
-                                                dcc.Dropdown(
-                                                    id='web-stats-type',  # use this ID for call-back
-                                                    options=[{'label': i, 'value': i} for i in webStatsList],
-                                                    value=['pageviews_all', 'unique_visitors'],
-                                                    multi=True,
-                                                )
-                                            ],
-                                        )
-                                    ]
+                                        # section header
+                                        html.H4("Daily Website Stats"),
+                                        # specify dropdown box content
+                                        html.H6("Select (multiple) stats to view"),
+                                        dcc.Dropdown(
+                                            id='web-stats-type',  # use this ID for call-back
+                                            **CONTROL_PERSISTENCE,
+                                            options=[{'label': i, 'value': i} for i in webStatsList],
+                                            value=WEB_DEFAULT_STATS,
+                                            multi=True,
+                                        ),
+                                    ] + granularity_selector('web-granularity'),
                                 )
                             ]
-                        ),
+                        )
+                    ]
+                ),
 
-                        # Graph - Daily website traffic
+                # Graph - Daily website traffic
+                html.Div(
+                    className="eight columns card-left",  # 8 column here, so it is 4:8 split
+                    children=[
                         html.Div(
-                            className="eight columns card-left",  # 8 column here, so it is 4:8 split
+                            className="bg-white",
                             children=[
-                                html.Div(
-                                    className="bg-white",
-                                    children=[
-                                        html.H4("Daily Stats on Website Traffic"),
-                                        dcc.Graph(id="web-trend-plot"),  # use id for callback
-                                    ],
-                                )
+                                html.H4("Daily Stats on Website Traffic"),
+                                dcc.Graph(id="web-trend-plot"),  # use id for callback
                             ],
-                        ),
-                    ]
+                        )
+                    ],
                 ),
+            ]
+        ),
 
-                # 3rd row body pannel -  Cumulative website stats
-                html.Div(
-                    className="row app-body",
+        # 3rd row body pannel -  Cumulative website stats
+        html.Div(
+            className="row app-body",
+            children=[
+                html.Div( className="four columns card",  #4 column here, so it is 4:8 split,
                     children=[
-                        html.Div( className="four columns card",  #4 column here, so it is 4:8 split,
+                        html.Div(
+                            className="bg-white user-control",
                             children=[
                                 html.Div(
-                                    className="bg-white user-control",
-                                    children=[
-                                        html.Div(
-                                        className="padding-top-bot",
-                                        children=[
-                                            #section header
-                                            html.H4("Cumulative Website Stats"),
-                                            html.H6("Select a time period. The earliest is 2020-05-15"),
-
-                                            #select date range
-                                            dcc.DatePickerRange(
-                                                id='web-date-picker',
-                                                display_format='YYYY-MM-DD',
-                                                start_date_placeholder_text='YYYY-MM-DD',
-                                                min_date_allowed=dt(2020, 5, 15),             #must pass python datetime variable!
-                                                max_date_allowed=webMaxDate+timedelta(1),     #the max date is grayed out. so I need to add 1 day
-                                                start_date=dt(2020, 5, 15),                   #default start_date
-                                                end_date=webMaxDate,                          #default end_date
-                                            ),
-
-                                            #multi select dropdown box
-                                            html.H6("Select (multiple) stats to view"),
-                                            dcc.Dropdown(
-                                                    id='web-cumstats-type',  # use this ID for call-back
-                                                    options=[{'label': i, 'value': i} for i in webCumStatsList],
-                                                    value=['pageviews_all', 'unique_visitors'],
-                                                    multi=True,
-                                            ),
-
-                                            #notes section
-                                        ],
-                                        )
-                                    ]
+                                className="padding-top-bot",
+                                children=[
+                                    #section header
+                                    html.H4("Cumulative Website Stats"),
+                                    html.H6("Select a time period. The earliest is 2020-05-15"),
+
+                                    #select date range
+                                    dcc.DatePickerRange(
+                                        id='web-date-picker',
+                                        **CONTROL_PERSISTENCE,
+                                        display_format='YYYY-MM-DD',
+                                        start_date_placeholder_text='YYYY-MM-DD',
+                                        min_date_allowed=dt(2020, 5, 15),             #must pass python datetime variable!
+                                        max_date_allowed=web.webMaxDate+timedelta(1), #the max date is grayed out. so I need to add 1 day
+                                        start_date=WEB_START_DATE,                    #default start_date
+                                        end_date=web.webMaxDate,                      #default end_date
+                                    ),
+
+                                    #multi select dropdown box
+                                    html.H6("Select (multiple) stats to view"),
+                                    dcc.Dropdown(
+                                            id='web-cumstats-type',  # use this ID for call-back
+                                            **CONTROL_PERSISTENCE,
+                                            options=[{'label': i, 'value': i} for i in webCumStatsList],
+                                            value=WEB_DEFAULT_STATS,
+                                            multi=True,
+                                    ),
+
+                                    #notes section
+                                ],
                                 )
                             ]
-                        ),
+                        )
+                    ]
+                ),
 
-                        # Graph for cumulative web stats
+                # Graph for cumulative web stats
+                html.Div(
+                    className="eight columns card-left",  # 8 column here, so it is 4:8 split
+                    children=[
                         html.Div(
-                            className="eight columns card-left",  # 8 column here, so it is 4:8 split
+                            className="bg-white",
                             children=[
-                                html.Div(
-                                    className="bg-white",
-                                    children=[
-                                        html.H4("Cumulative Stats on Website Traffic"),
-                                        dcc.Graph(id="web-cumstats-chart"),  # use id for callback
-                                    ],
-                                )
+                                html.H4("Cumulative Stats on Website Traffic"),
+                                dcc.Graph(id="web-cumstats-chart"),  # use id for callback
                             ],
-                        ),
-                    ]
+                        )
+                    ],
                 ),
+            ]
+        ),
 
 
 
-                # 4rd row body pannel - Website traffic geo data
+        # 4rd row body pannel - Website traffic geo data
+        html.Div(
+            className="row app-body",
+            children=[
+
+                # 2rd Graph - Website traffic
                 html.Div(
-                    className="row app-body",
+                    className="card-center",  # 12 column here
                     children=[
-
-                        # 2rd Graph - Website traffic
                         html.Div(
-                            className="card-center",  # 12 column here
+                            className="bg-white-alt",
                             children=[
-                                html.Div(
-                                    className="bg-white-alt",
-                                    children=[
-                                        html.H4("Total Number of Requests Per Day by Geography"),
-                                        dcc.Graph(id="web-traffic-geo", style={"width":"100%", 'padding': '0px'}),  # use id for callback
-                                        dcc.Slider(
-                                            id='web-traffic-slider',
-                                            min=0,               #note that the slider returns numbers, not text!!
-                                            max=numEntries-1,
-                                            value=numEntries//2, #default slider position
-                                            # marks=markDict,
-                                            step=1,
-                                            updatemode="drag",
-                                            persistence="true",
-                                        ),
-                                        html.H6(id="web-traffic-legend", style={'text-align': 'center', 'margin-top': 0, 'padding-top': 0}),
-                                    ],
-                                )
+                                html.H4("Total Number of Requests Per Day by Geography"),
+                                dcc.Graph(id="web-traffic-geo", figure=geo_figure(web), style={"width":"100%", 'padding': '0px'}),  # use id for callback
+                                dcc.Store(id="web-traffic-frame"),  # the frame of the selected date, see updateWebTrafficGeo()
+                                dcc.Slider(
+                                    id='web-traffic-slider',
+                                    min=0,               #note that the slider returns numbers, not text!!
+                                    max=web.numEntries-1,
+                                    value=web.numEntries//2, #default slider position
+                                    # marks=markDict,
+                                    step=1,
+                                    updatemode="drag",
+                                    persistence="true",
+                                ),
+                                html.H6(id="web-traffic-legend", style={'text-align': 'center', 'margin-top': 0, 'padding-top': 0}),
                             ],
-                        ),
-                    ]
+                        )
+                    ],
                 ),
+            ]
+        ),
+
+        # Series for the clientside charts, sent once with the layout. Only used when CLIENTSIDE_CHARTS is on
+        html.Div(
+            children=[
+                dcc.Store(id='web-series', data=series_levels(web.webRollups)),
+            ] if CLIENTSIDE_CHARTS else []
+        ),
 
-            ]),
+    ])
 
-            #----------------------------------------------------------------------------------------------------------
-            #                                                   3rd tab - WeChat
-            #----------------------------------------------------------------------------------------------------------
-            dcc.Tab(label='WeChat', style=tab_style, selected_style=tab_selected_style,
-                children=[
 
+# ----------------------------------------------------------------------------------------------------------
+#                                               3rd tab - WeChat
+# ----------------------------------------------------------------------------------------------------------
+def wechat_tab(wechat):
+    """
+    Layout of the WeChat tab
+    :param wechat: snapshot of the wechat dataset
+    :return: html.Div with the content of the tab
+    """
+    return html.Div(
+        children=[
 
-                    # 1st row body pannel - WeChat follower
-                    html.Div(
-                        className="row app-body",
+
+            # 1st row body pannel - WeChat follower
+            html.Div(
+                className="row app-body",
+                children=[
+                    html.Div( className="four columns card",  #4 column here, so it is 4:8 split,
                         children=[
-                            html.Div( className="four columns card",  #4 column here, so it is 4:8 split,
+                            html.Div(
+                                className="bg-white user-control",
                                 children=[
                                     html.Div(
-                                        className="bg-white user-control",
-                                        children=[
-                                            html.Div(
-                                            className="padding-top-bot",
-                                            children=[
-                                                #section header
-                                                html.H4("WeChat Follower Stats"),
-                                                html.H6("Select a time period. The earliest is 2016-08-15"),
-
-                                                #select date range
-                                                dcc.DatePickerRange(
-                                                    id='wechat-date-picker',
-                                                    display_format='YYYY-MM-DD',
-                                                    start_date_placeholder_text='YYYY-MM-DD',
-                                                    min_date_allowed=dt(2016, 8, 15),             #must pass python datetime variable!
-                                                    max_date_allowed=wechatMaxDate+timedelta(1),  #the max date is grayed out. so I need to add 1 day
-                                                    start_date=dt(2016, 8, 15),                   #default start_date
-                                                    end_date=wechatMaxDate,                       #default end_date
-                                                ),
-
-                                                #multi select dropdown box
-                                                html.H6("Select (multiple) stats to view"),
-                                                dcc.Dropdown(
-                                                    id='wechat-follower-stats-type',  # use this ID for call-back
-                                                    options=[{'label': i, 'value': i} for i in wechatFollowerStatsList],
-                                                    value=['net_increase', 'total'],
-                                                    multi=True,
-                                                ),
-
-                                                #notes section
-                                                html.H6("Notes: "),
-                                                html.Span("new-新增人数, unfollowed-取消关注人数, net_increase-净增人数, total-累计关注人数")
-
-                                            ],
-                                            )
-                                        ]
+                                    className="padding-top-bot",
+                                    children=[
+                                        #section header
+                                        html.H4("WeChat Follower Stats"),
+                                        html.H6("Select a time period. The earliest is 2016-08-15"),
+
+                                        #select date range
+                                        dcc.DatePickerRange(
+                                            id='wechat-date-picker',
+                                            **CONTROL_PERSISTENCE,
+                                            display_format='YYYY-MM-DD',
+                                            start_date_placeholder_text='YYYY-MM-DD',
+                                            min_date_allowed=dt(2016, 8, 15),             #must pass python datetime variable!
+                                            max_date_allowed=wechat.wechatMaxDate+timedelta(1),  #the max date is grayed out. so I need to add 1 day
+                                            start_date=WECHAT_START_DATE,                 #default start_date
+                                            end_date=wechat.wechatMaxDate,                #default end_date
+                                        ),
+
+                                        #multi select dropdown box
+                                        html.H6("Select (multiple) stats to view"),
+                                        dcc.Dropdown(
+                                            id='wechat-follower-stats-type',  # use this ID for call-back
+                                            **CONTROL_PERSISTENCE,
+                                            options=[{'label': i, 'value': i} for i in wechatFollowerStatsList],
+                                            value=WECHAT_FOLLOWER_DEFAULT_STATS,
+                                            multi=True,
+                                        ),
+
+                                        *granularity_selector('wechat-follower-granularity'),
+
+                                        #notes section
+                                        html.H6("Notes: "),
+                                        html.Span("new-新增人数, unfollowed-取消关注人数, net_increase-净增人数, total-累计关注人数")
+
+                                    ],
                                     )
                                 ]
-                            ),
+                            )
+                        ]
+                    ),
 
-                            #Graph for wechat follower chart
+                    #Graph for wechat follower chart
+                    html.Div(
+                        className="eight columns card-left",  # 8 column here, so it is 4:8 split
+                        children=[
                             html.Div(
-                                className="eight columns card-left",  # 8 column here, so it is 4:8 split
+                                className="bg-white",
                                 children=[
-                                    html.Div(
-                                        className="bg-white",
-                                        children=[
-                                            html.H4("Number of WeChat Followers Over Time, Measured Daily"),
-                                            dcc.Graph(id="wechat-follower-chart"),  # use id for callback
-                                        ],
-                                    )
+                                    html.H4("Number of WeChat Followers Over Time, Measured Daily"),
+                                    dcc.Graph(id="wechat-follower-chart"),  # use id for callback
                                 ],
-                            ),
-                        ]
+                            )
+                        ],
                     ),
+                ]
+            ),
 
-                    #2nd row body pannel - wechat article
-                    html.Div(
-                        className="row app-body",
+            #2nd row body pannel - wechat article
+            html.Div(
+                className="row app-body",
+                children=[
+                    html.Div( className="four columns card",  #4 column here, so it is 4:8 split,
                         children=[
-                            html.Div( className="four columns card",  #4 column here, so it is 4:8 split,
+                            html.Div(
+                                className="bg-white user-control",
                                 children=[
                                     html.Div(
-                                        className="bg-white user-control",
-                                        children=[
-                                            html.Div(
-                                            className="padding-top-bot",
-                                            children=[
-                                                #section header
-                                                html.H4("WeChat Article Stats"),
-                                                html.H6("Select a time period. The earliest is 2017-01-01"),
-
-                                                #select date range
-                                                dcc.DatePickerRange(
-                                                    id='wechat-article-date-picker',
-                                                    display_format='YYYY-MM-DD',
-                                                    start_date_placeholder_text='YYYY-MM-DD',
-                                                    min_date_allowed=dt(2017, 1, 1),              #must pass python datetime variable!
-                                                    max_date_allowed=wechatMaxDate+timedelta(1),  #the max date is smae as the follwer max date - they're from the sam esource!
-                                                    start_date=dt(2017, 1, 1),                    #default start_date
-                                                    end_date=wechatMaxDate,                       #default end_date
-                                                ),
-
-                                                #multi select dropdown box
-                                                html.H6("Select (multiple) stats to view"),
-                                                dcc.Dropdown(
-                                                    id='wechat-article-stats-type',  # use this ID for call-back
-                                                    options=[{'label': i, 'value': i} for i in wechatArticleStatsList],
-                                                    value=["reads","shares"],
-                                                    multi=True,
-                                                ),
-
-                                                # notes section
-                                                html.H6("Notes: "),
-                                                html.Span(
-                                                    "reads-阅读次数, shares-分享次数, saves-收藏次数, jump_to_original-转跳原文次数")
-                                            ],
-                                            )
-                                        ]
+                                    className="padding-top-bot",
+                                    children=[
+                                        #section header
+                                        html.H4("WeChat Article Stats"),
+                                        html.H6("Select a time period. The earliest is 2017-01-01"),
+
+                                        #select date range
+                                        dcc.DatePickerRange(
+                                            id='wechat-article-date-picker',
+                                            **CONTROL_PERSISTENCE,
+                                            display_format='YYYY-MM-DD',
+                                            start_date_placeholder_text='YYYY-MM-DD',
+                                            min_date_allowed=dt(2017, 1, 1),              #must pass python datetime variable!
+                                            max_date_allowed=wechat.wechatMaxDate+timedelta(1),  #the max date is smae as the follwer max date - they're from the sam esource!
+                                            start_date=WECHAT_ARTICLE_START_DATE,         #default start_date
+                                            end_date=wechat.wechatMaxDate,                #default end_date
+                                        ),
+
+                                        #multi select dropdown box
+                                        html.H6("Select (multiple) stats to view"),
+                                        dcc.Dropdown(
+                                            id='wechat-article-stats-type',  # use this ID for call-back
+                                            **CONTROL_PERSISTENCE,
+                                            options=[{'label': i, 'value': i} for i in wechatArticleStatsList],
+                                            value=WECHAT_ARTICLE_DEFAULT_STATS,
+                                            multi=True,
+                                        ),
+
+                                        *granularity_selector('wechat-article-granularity'),
+
+                                        # notes section
+                                        html.H6("Notes: "),
+                                        html.Span(
+                                            "reads-阅读次数, shares-分享次数, saves-收藏次数, jump_to_original-转跳原文次数")
+                                    ],
                                     )
                                 ]
-                            ),
+                            )
+                        ]
+                    ),
 
-                            #Graph for wechat article stats
+                    #Graph for wechat article stats
+                    html.Div(
+                        className="eight columns card-left",  # 8 column here, so it is 4:8 split
+                        children=[
                             html.Div(
-                                className="eight columns card-left",  # 8 column here, so it is 4:8 split
+                                className="bg-white",
                                 children=[
-                                    html.Div(
-                                        className="bg-white",
-                                        children=[
-                                            html.H4("Total Article Reads, Shares, Saves, and Jump to Originals, Measured Daily"),
-                                            dcc.Graph(id="wechat-article-chart"),  # use id for callback
-                                        ],
-                                    )
+                                    html.H4("Total Article Reads, Shares, Saves, and Jump to Originals, Measured Daily"),
+                                    dcc.Graph(id="wechat-article-chart"),  # use id for callback
                                 ],
-                            ),
-                        ]
+                            )
+                        ],
                     ),
+                ]
+            ),
 
-                    # 3rd row body pannel - Source of article: How did WeChat readers found the article?
-                    html.Div(
-                    className="row app-body",
-                    children=[
+            # 3rd row body pannel - Source of article: How did WeChat readers found the article?
+            html.Div(
+            className="row app-body",
+            children=[
 
-                        # Chart for source of WeChat article
+                # Chart for source of WeChat article
+                html.Div(
+                    className="card-tight-top",  # 12 column here
+                    children=[
                         html.Div(
-                            className="card-tight-top",  # 12 column here
+                            className="bg-white",
                             children=[
-                                html.Div(
-                                    className="bg-white",
-                                    children=[
-                                        html.H4("How did readers find out about this (these) article(s)? - 传播渠道分析"),
-                                        html.P("Use lasso or box tool in the chart above to select individual point(s) for analysis here. Default analysis (upon page load/refresh) is the average of all data since 2017-01-01"),
-                                        dcc.Graph(id='wechatSource'),
-                                    ],
-                                )
+                                html.H4("How did readers find out about this (these) article(s)? - 传播渠道分析"),
+                                html.P("Use lasso or box tool in the chart above to select individual point(s) for analysis here. Default analysis (upon page load/refresh) is the average of all data since 2017-01-01"),
+                                dcc.Graph(id='wechatSource'),
                             ],
-                        ),
-                    ]
+                        )
+                    ],
                 ),
+            ]
+        ),
+
+            # Series for the clientside charts, sent once with the layout. Only used when CLIENTSIDE_CHARTS is on
+            html.Div(
+                children=[
+                    dcc.Store(id='wechat-follower-series', data=series_levels(wechat.followerRollups)),
+                    dcc.Store(id='wechat-article-series', data=series_levels(wechat.articleRollups)),
+                ] if CLIENTSIDE_CHARTS else []
+            ),
+
+        ]
+    )
+
+
+#App Layout. Dash calls serve_layout() on every page load, so a page refresh picks up reloaded data (date ranges,
+#dropdown options, slider length) without restarting the server
+def serve_layout():
+    """
+    Build the page layout. The content of the tabs is rendered by render_tab() from the current data snapshots
+    :return: the root html.Div
+    """
+    return html.Div(
+
+        children=[
+
+            # Top Banner
+            html.Div(
+                className="study-browser-banner row",
+                children=[
+                    html.H2(className="h2-title", children="Analytics Dashboard for Chinese Antibody Society's Media Platforms"), #set widescreen title here!
+                    html.Div(
+                        className="div-logo",
+                        children=html.Img(
+                            className="logo", src=http_cache.asset_url(app, "dash-logo-new.png")   #fingerprinted, cached by the browser
+                        ),
+                    ),
+                    html.H2(className="h2-title-mobile", children="CAS Analytics Dashboard"), #set mobile title here!
+                ],
+            ),
 
+            # Define a list of tabs. Only the selected tab is rendered (and its dataset loaded), see render_tab()
+            dcc.Tabs(
+                id='tabs',
+                value='email',
+                children=[
+                    dcc.Tab(label='Email Campaigns', value='email', style=tab_style, selected_style=tab_selected_style),   #apply my custom styles as specifid in this app (not in CSS!)
+                    dcc.Tab(label='Website Traffic', value='web', style=tab_style, selected_style=tab_selected_style),
+                    dcc.Tab(label='WeChat', value='wechat', style=tab_style, selected_style=tab_selected_style),
                 ]
             ),
-        ]),
+            html.Div(id='tab-content'),
 
+            # Layout of the clientside charts. Only used when CLIENTSIDE_CHARTS is on
+            html.Div(
+                children=[
+                    dcc.Store(id='general-layout', data=general_layout),
+                ] if CLIENTSIDE_CHARTS else []
+            ),
 
-        # Footer
-        html.Div(
-            className="study-browser-banner row",
-            children=[
-                html.P("Chinese Antibody Society 2020."), #set widescreen title here!
-            ],
-        ),
+            # Footer
+            html.Div(
+                className="study-browser-banner row",
+                children=[
+                    html.P("Chinese Antibody Society 2020."), #set widescreen title here!
+                ],
+            ),
+
+        ]
+    )
+
+app.layout = serve_layout
+
+#--------------------------------------------Call backs ---------------------------------------------------------------
+
+#layout function of every tab, by tab value. The dataset of a tab has the same name
+TAB_LAYOUTS = {
+    'email': email_tab,
+    'web': web_tab,
+    'wechat': wechat_tab,
+}
 
+#call back for the tabs. A tab is rendered when it is selected, and its dataset is loaded on first use
+@app.callback(
+    Output('tab-content', 'children'),
+    [
+        Input('tabs', 'value')
     ]
 )
+def render_tab(tab):
+    return TAB_LAYOUTS[tab](store.get(tab))
+
+
+def zoomable(func):
+    """
+    Decorator for the callbacks of the downsampled charts. The last input of the callback is the `relayoutData` of its
+    graph. The function gets the visible (first day, last day) instead, or None when the whole series is shown
+    """
+    @functools.wraps(func)
+    def callback(*args):
+        return func(*args[:-1], downsample.visible_range(args[-1]))
+    return callback
+
+
+def reset_zoom_on(graph_id, inputs):
+    """
+    Forget the zoom of a downsampled chart when other inputs (e.g. its date picker) change. The figure gets a new
+    uirevision then, so plotly resets the axes, and the stale `relayoutData` must not restrict the data anymore
+    :param graph_id: ID of the dcc.Graph
+    :param inputs: list of dash Inputs that reset the zoom
+    """
+    app.clientside_callback(
+        ClientsideFunction(namespace='cas', function_name='resetZoom'),
+        Output(graph_id, 'relayoutData'),
+        inputs
+    )
+
+
+def chart_window(startDate, endDate, window):
+    """
+    :param startDate: first day of the date picker
+    :param endDate: last day of the date picker
+    :param window: visible (first day, last day) of the chart, or None
+    :return: (first day, last day) of the points to send
+    """
+    if window is None:
+        return startDate, endDate
+    return max(startDate[:10], window[0]), min(endDate[:10], window[1])
+
+
+def chart_callback(output, inputs, series_id, function_name, reset_zoom=()):
+    """
+    Register a chart callback on the server, or as a clientside callback when CLIENTSIDE_CHARTS is on.
+    Use it like @app.callback. The clientside function gets the same inputs, then the series store data and the layout.
+    On the server, the chart is downsampled: the python function gets the visible x range as an extra last argument,
+    see zoomable()
+    :param output: dash Output of the chart
+    :param inputs: list of dash Inputs, same as for @app.callback
+    :param series_id: ID of the dcc.Store with the series of the chart, e.g. 'web-series'
+    :param function_name: name of the function in the `cas` namespace of assets/clientside.js
+    :param reset_zoom: list of the dash Inputs that reset the zoom of the chart, see reset_zoom_on()
+    :return: decorator. The decorated python function is returned unchanged
+    """
+    def register(func):
+        if CLIENTSIDE_CHARTS:
+            app.clientside_callback(
+                ClientsideFunction(namespace='cas', function_name=function_name),
+                output,
+                inputs + [Input(series_id, 'data'), Input('general-layout', 'data')]
+            )
+        else:
+            app.callback(output, inputs + [Input(output.component_id, 'relayoutData')])(zoomable(func))
+            if reset_zoom:
+                reset_zoom_on(output.component_id, list(reset_zoom))
+        return func
+    return register
 
-#--------------------------------------------Call backs ---------------------------------------------------------------
 
 
 #call back for the email-campaign chart
@@ -631,6 +871,7 @@ app.layout = html.Div(
         Input('y-axis-dt', 'value')         # "Total" or "Percent" for Y axis
     ]
 )
+@figureCache.memoize("update_graph", ["email"])
 def update_graph(email_type, open_or_click, number_or_ratio):
     """
     Link email campaign graph to callback above
@@ -639,7 +880,14 @@ def update_graph(email_type, open_or_click, number_or_ratio):
     :param number_or_ratio: user-input value of y-axis-dt in callback
     :return: x and y axis data in dict format
     """
-    dff=df[df['article_type']==email_type]
+    if open_or_click is None:
+        raise PreventUpdate   # no column to draw
+
+    #the campaigns of the selected article type, grouped once when the data is loaded. A cleared dropdown (None), or
+    #a type that is gone after a data reload, draws empty lines
+    series = store.get("email").emailSeries.get(email_type)
+    if series is None:
+        series = datastore.empty_email_series()
 
     #if user wants to see percent, calculate percent
     if number_or_ratio=="Percent":
@@ -649,8 +897,8 @@ def update_graph(email_type, open_or_click, number_or_ratio):
             return {
                 'data':[
                     {
-                        "x": dff['send_time_date'],  # var must be named x
-                        "y": dff[open_or_click] / dff["delivered"],
+                        "x": series.labels,  # var must be named x
+                        "y": series[open_or_click + "_rate"],
                         "mode": 'lines+markers',
                         "name": "unique open rate",
                         "marker": {  # marker style
@@ -660,8 +908,8 @@ def update_graph(email_type, open_or_click, number_or_ratio):
                         }
                     },
                     {
-                        "x": dff['send_time_date'],  # var must be named x
-                        "y": dff["ind_open_rate"],   #load industry open rate
+                        "x": series.labels,  # var must be named x
+                        "y": series["ind_open_rate"],   #load industry open rate
                         "mode": 'lines+markers',
                         "name": "industry open rate",
                         "marker": {  # marker style
@@ -680,8 +928,8 @@ def update_graph(email_type, open_or_click, number_or_ratio):
             return {
                 'data': [
                     {
-                        "x": dff['send_time_date'],  # var must be named x
-                        "y": dff[open_or_click] / dff["delivered"],
+                        "x": series.labels,  # var must be named x
+                        "y": series[open_or_click + "_rate"],
                         "mode": 'lines+markers',
                         "name": "unique click rate",
                         "marker": {  # marker style
@@ -691,8 +939,8 @@ def update_graph(email_type, open_or_click, number_or_ratio):
                         }
                     },
                     {
-                        "x": dff['send_time_date'],  # var must be named x
-                        "y": dff["ind_click_rate"],  # load industry avg click rate
+                        "x": series.labels,  # var must be named x
+                        "y": series["ind_click_rate"],  # load industry avg click rate
                         "mode": 'lines+markers',
                         "name": "industry click rate",
                         "marker": {  # marker style
@@ -712,8 +960,8 @@ def update_graph(email_type, open_or_click, number_or_ratio):
         return {
             'data': [                               # must be named 'data'
                 {
-                    "x": dff['send_time_date'],     # var must be named x
-                    "y": dff['delivered'],          # var must be named y
+                    "x": series.labels,     # var must be named x
+                    "y": series['delivered'],          # var must be named y
                     "mode": 'markers',              # graph mode, line or markers. Must be named "mode"
                     "name": "total delivered",      # legend name. Must be named "name"
                     "marker": {                     # marker style. Must be named "marker"
@@ -724,8 +972,8 @@ def update_graph(email_type, open_or_click, number_or_ratio):
                 },
 
                 {
-                    "x":dff['send_time_date'],  # var must be named x
-                    "y":dff[open_or_click],  # var must be named y
+                    "x":series.labels,  # var must be named x
+                    "y":series[open_or_click],  # var must be named y
                     "mode": 'lines+markers',  # graph mode, line or maker
                     "name": "unique opens/clicks",
                     "marker":{  # marker style
@@ -740,28 +988,40 @@ def update_graph(email_type, open_or_click, number_or_ratio):
 
 
 #call back for the web-stats chart
-@app.callback(
+@chart_callback(
 
     Output('web-trend-plot', 'figure'), #OUTPUT SYNTAX: (dcc.Graph ID, 'figure') 'figure' is required here
 
     [
         #INPUT SYNTAX: (dcc.Dropdown or dcc.Radio ID, 'value). 'value is required here
         Input('web-stats-type', 'value'),  #column ['requests_all', 'threats_all', 'pageviews_all','unique_visitors', 'pageview_per_visitor']
-    ]
+        Input('web-granularity', 'value'),  #'day', 'week' or 'month'
+    ],
+    series_id='web-series',
+    function_name='statChart'
 )
-def update_webstat_graph(stat_types):
+@figureCache.memoize("update_webstat_graph", ["web"])
+def update_webstat_graph(stat_types, granularity, window=None):
     """
     updates website stat trends chart above
     :param stat_types: columns selected by the user, in a list. webStatsList= ['requests_all', 'threats_all', 'pageviews_all','unique_visitors', 'pageview_per_visitor']
+    :param granularity: 'day', 'week' or 'month'. Weeks and months come from the rollups of the web dataset
+    :param window: visible (first day, last day) of the chart after a zoom, or None for all the dates
     :return: data for plotting
     """
 
+    rollups = store.get("web").webRollups
+    series = rollups[granularity]
+    if window is not None:
+        series = rollups.between(granularity, *window)   #only the points in the visible x range are sent
+
     webstat_data=[]  # use this as the return value for 'data' - a list of dict, where each dict is a line
 
     for stat in stat_types:  #iterate through hte list of columns that the user has chosen
+        x, y = downsample.downsample(series.dates, series[stat], labels=series.labels)  #at most CAS_CHART_POINTS points per line
         dat_dict={
-                    "x": df2['date'],  # var must be named x
-                    "y": df2[stat],  # var must be named y
+                    "x": x,  # var must be named x
+                    "y": y,  # var must be named y
                     "mode": 'markers+lines',  # graph mode, line or markers. Must be named "mode"
                     "name": stat,  # legend name. Must be named "name".
                     "marker": {  # marker style. Must be named "marker"
@@ -774,7 +1034,7 @@ def update_webstat_graph(stat_types):
 
     return{
         'data':webstat_data,  #this is a list of dicts, where each dict is a line,
-        'layout': general_layout
+        'layout': dict(general_layout, uirevision='web-trend-plot')   #keep the user's zoom when the figure is replaced
     }
 
 
@@ -792,10 +1052,12 @@ def update_webstat_graph(stat_types):
 )
 def updateWebStatText(stat_types):
 
+    webSeries = store.get("web").webSeries   #the daily stats. The source dataframe is not kept by every server process
+
     #do some calc here
-    avgVisitorPerDay=round(df2["unique_visitors"].sum()/df2.shape[0], 0)
-    avgPagePerDay=round(df2['pageviews_all'].sum()/df2.shape[0], 0)
-    avgPagePerVisit=round(df2['pageviews_all'].sum()/df2["unique_visitors"].sum(), 1)
+    avgVisitorPerDay=round(webSeries["unique_visitors"].sum()/len(webSeries), 0)
+    avgPagePerDay=round(webSeries['pageviews_all'].sum()/len(webSeries), 0)
+    avgPagePerVisit=round(webSeries['pageviews_all'].sum()/webSeries["unique_visitors"].sum(), 1)
 
     #each returning var matches to an output destination in the call back. For example,`avgVisitorPerDay` matches to `Output('avgVisitorText', 'children')`
     return avgVisitorPerDay,avgPagePerDay, avgPagePerVisit
@@ -809,37 +1071,36 @@ def updateWebStatText(stat_types):
         #For date range picker, there are 2 inputs from user. BOTH inputs are returned to the program as STRINGS in the format user entered. This format is specified in dcc.DatePickerRange{display_format='YYYY-MM-DD'}. i.e. here, the user input is returend as "2020-01-01"
         Input('web-date-picker', 'start_date'),
         Input ('web-date-picker', "end_date") ,    #`web-date-picker` is the ID of the date pikcer. `start_date` and `end_date` are fixed expression you must use
-        Input('web-cumstats-type', 'value')  #columns ['requests_all', 'threats_all', 'pageviews_all','unique_visitors']
+        Input('web-cumstats-type', 'value'),  #columns ['requests_all', 'threats_all', 'pageviews_all','unique_visitors']
+        Input('web-cumstats-chart', 'relayoutData')  #zoom and pan of the chart, see zoomable()
     ]
 )
-def webCumStats(startDate, endDate, statsList):    #startDate = start_date in the input, endDate = end_date in the input. BOTH ARE STRINGS
-
-    #filter by the date range
-    criteria = (df2.date >= startDate) & (df2.date <= endDate)
-    df2f=df2[criteria]
-
-    #calculate cumulative stats columns
-    def get_cum_stats(colName):
-        """
-        add a cumulative stats column
-        :param colName: STR, original column name, such as `requests_all`
-        :return: STR, column name for the new cumulative stat. Note that the new stat column is added to df2f directly
-        """
-        newColName=colName+'_cumsum'
-        df2f[newColName] = df2f[colName].cumsum()
-        return newColName
+@zoomable
+@figureCache.memoize("webCumStats", ["web"])
+def webCumStats(startDate, endDate, statsList, window=None):    #startDate = start_date in the input, endDate = end_date in the input. BOTH ARE STRINGS
+
+    web = store.get("web")
+
+    #find the rows in the date range: 2 binary searches in the sorted dates
+    rows = web.webSeries.range(startDate, endDate)
+
+    #only the points in the visible x range are sent
+    visible = web.webSeries.range(*chart_window(startDate, endDate, window))
+    dates = web.webSeries.dates[visible]
+    labels = web.webSeries.labels[visible]
+
+    #cumulative stats from the start date: the prefix sums of the visible rows minus the prefix sum before the range
+    cumSums = datastore.running_sums(web.webCumSums, rows, visible)
 
     #iterate through the stats list that the user selected, add them to the `data` list
     webCumStats_data=[]
     for stat in statsList:
 
-        # get a cumulative stat
-        cumStatColName= get_cum_stats(stat)
-
         # add trace data to the list of dicts
+        x, y = downsample.downsample(dates, cumSums[:, webCumStatsList.index(stat)], labels=labels)  #at most CAS_CHART_POINTS points per line
         data_dict = {
-            "x": df2f['date'],  # var must be named x
-            "y": df2f[cumStatColName],  # var must be named y
+            "x": x,  # var must be named x
+            "y": y,  # var must be named y
             "mode": 'markers+lines',  # graph mode, line or markers. Must be named "mode"
             "name": stat,  # legend name. Must be named "name".
             "marker": {  # marker style. Must be named "marker"
@@ -852,14 +1113,19 @@ def webCumStats(startDate, endDate, statsList):    #startDate = start_date in th
 
     return {
         'data': webCumStats_data,  # this is a list of dicts, where each dict is a line graph
-        'layout': general_layout
+        'layout': dict(general_layout, uirevision=startDate + endDate)   #keep the user's zoom until the dates change
     }
 
 
-#call back for web trafic geo
+#a new date range resets the zoom of the cumulative chart
+reset_zoom_on('web-cumstats-chart', [Input('web-date-picker', 'start_date'), Input('web-date-picker', 'end_date')])
+
+
+#call back for web trafic geo. Only the small per-date frame goes over the wire. The clientside callback below
+#patches it into the figure that is already in the browser, so the geo json polygons are shipped once with the layout
 @app.callback(
     [
-        Output('web-traffic-geo', 'figure'),
+        Output('web-traffic-frame', 'data'),
         Output('web-traffic-legend', 'children')
     ],
     [
@@ -868,89 +1134,59 @@ def webCumStats(startDate, endDate, statsList):    #startDate = start_date in th
 )
 def updateWebTrafficGeo(whatDate):
 
-    # filter using the user-selected date
-    df2f=df2[df2["date"]==markDict[whatDate]]
-
-    # extract the country requests dict
-    countryDict=ast.literal_eval(df2f.requests_country.ravel()[0])
-    countryDf = pd.DataFrame({
-        "country": list(countryDict.keys()),
-        "requests": list(countryDict.values())  #total number of requests from each country
-    })
-
-    # combine `countryDf` dataframe (containing the reqeusts) with `country_code` dataframe (containing standard country codes in 2/3 letters)
-    mergedCountryDf = pd.merge(countryDf, country_code, left_on="country", right_on="2_letter")
-
-    # create a figure
-    fig=go.Figure()
-
-    # add trace. Note that the names for arugments are different from the px.choropleth_mapbox() function.
-    # Read the go.Choroplethmapbox() documentation for details!
-    fig.add_trace(
-        go.Choroplethmapbox(geojson=countries_geo_json,                 # geo json file in json format
-                            locations=mergedCountryDf['3_letter'],      # column in the dataframe with the 3_letter fips code
-                            z=mergedCountryDf['requests'],              # column in the dataframe with the stats you want to plot
-                            zmin=minReq,                                # if a shared colobar is used, you can specify the global min on the color bar
-                            zmax=maxReq,                                # if a shared colobar is used, you can specify the global min on the color bar
-                            colorscale="Plasma")                        # color map to use
-    )
+    web = store.get("web")
 
-    # update the mapbox layout.
-    # Note that the names for arugments are different from the px.choropleth_mapbox() function.
-    # specifically, you need to add `mapbox_` to the mapbox parameters!
-    fig.update_layout(
-        mapbox_accesstoken=mapbox_token,                    # your mapbox token
-        mapbox_style="carto-positron",                      # mapbox style
-        mapbox_center={"lat": 41.141478, "lon": 3.169980},  # center on mediterranean sea
-        mapbox_zoom=1                                       # zoom 1
-    )
+    # the page was loaded before a reload that removed rows. The user needs to refresh the page
+    if whatDate >= web.numEntries:
+        raise PreventUpdate
 
-    # update the graph layout
-    fig.update_layout(
-        autosize=True,
-        margin=dict(t=0, b=20, l=2, r=2)
-    )
+    # look up the precomputed frame of the user-selected date. The slider value is the row number in webStat.csv
+    geoFrame = web.geoFrames[whatDate]
 
-    # another way to write the layout...
-    # mapbox_layout = {
-    #     "hovermode": "compare",
-    #     "autosize": True,
-    #     "margin": dict(t=0, b=2, l=2, r=2),
-    #     "mapbox": {
-    #         "accesstoken": mapbox_token,
-    #         "center": {"lat": 40.363062, "lon": 178.253897},  # center on the north pacific ocean
-    #         "zoom": 0.5,
-    #         "mapbox_style": "carto-positron"
-    #     }
-    # }
+    mapLegend="Move slider or use keyboard arrow to select date. Currently date = " + web.markDict[whatDate]
 
-    mapLegend="Move slider or use keyboard arrow to select date. Currently date = " + markDict[whatDate]
+    return geoFrame, mapLegend    #return 2 things here! {"locations": [...], "z": [...]} and the legend text
 
-    return fig, mapLegend    #return 2 things here! Direclty return the fig object
+#replace `locations` and `z` of the choropleth with the frame above. See assets/clientside.js
+app.clientside_callback(
+    ClientsideFunction(namespace='cas', function_name='applyGeoFrame'),
+    Output('web-traffic-geo', 'figure'),
+    [
+        Input('web-traffic-frame', 'data'),
+    ],
+    [
+        State('web-traffic-geo', 'figure'),   #the current figure, which holds the geo json
+    ]
+)
 
 #call back for wechat follower
-@app.callback(
+@chart_callback(
     Output('wechat-follower-chart', 'figure'),
 
     [
         #For date range picker, there are 2 inputs from user. BOTH inputs are returned to the program as STRINGS in the format user entered. This format is specified in dcc.DatePickerRange{display_format='YYYY-MM-DD'}. i.e. here, the user input is returend as "2020-01-01"
         Input('wechat-date-picker', 'start_date'),
         Input ('wechat-date-picker', "end_date") ,    #`wechat-date-picker` is the ID of the date pikcer. `start_date` and `end_date` are fixed expression you must use
-        Input('wechat-follower-stats-type', 'value')  #columns ["new","unfollowed","net_increase","total"]
-    ]
+        Input('wechat-follower-stats-type', 'value'),  #columns ["new","unfollowed","net_increase","total"]
+        Input('wechat-follower-granularity', 'value')  #'day', 'week' or 'month'
+    ],
+    series_id='wechat-follower-series',
+    function_name='dateRangeChart',
+    reset_zoom=[Input('wechat-date-picker', 'start_date'), Input('wechat-date-picker', 'end_date')]  #a new date range resets the zoom
 )
-def wechatFollwer(startDate, endDate, statsList):    #startDate = start_date in the input, endDate = end_date in the input. BOTH ARE STRINGS
+@figureCache.memoize("wechatFollwer", ["wechat"])
+def wechatFollwer(startDate, endDate, statsList, granularity, window=None):    #startDate = start_date in the input, endDate = end_date in the input. BOTH ARE STRINGS
 
-    #filter by the date range
-    criteria = (df3.date >= startDate) & (df3.date <= endDate)
-    df3f=df3[criteria]
+    #the date range, or the visible part of it, as views of the date indexed series of the granularity
+    series = store.get("wechat").followerRollups.between(granularity, *chart_window(startDate, endDate, window))
 
     #iterate through the stats list that the user selected, add them to the `data` list
     follower_data=[]
     for stat in statsList:
+        x, y = downsample.downsample(series.dates, series[stat], labels=series.labels)  #at most CAS_CHART_POINTS points per line
         data_dict = {
-            "x": df3f['date'],  # var must be named x
-            "y": df3f[stat],  # var must be named y
+            "x": x,  # var must be named x
+            "y": y,  # var must be named y
             "mode": 'markers+lines',  # graph mode, line or markers. Must be named "mode"
             "name": stat,  # legend name. Must be named "name".
             "marker": {  # marker style. Must be named "marker"
@@ -963,32 +1199,39 @@ def wechatFollwer(startDate, endDate, statsList):    #startDate = start_date in
 
     return {
         'data': follower_data,  # this is a list of dicts, where each dict is a line,
-        'layout': general_layout
+        'layout': dict(general_layout, uirevision=startDate + endDate)   #keep the user's zoom until the dates change
     }
 
 #call back for wechat article
-@app.callback(
+@chart_callback(
     Output('wechat-article-chart', 'figure'),
 
     [
         #For date range picker, there are 2 inputs from user. BOTH inputs are returned to the program as STRINGS in the format user entered. This format is specified in dcc.DatePickerRange{display_format='YYYY-MM-DD'}. i.e. here, the user input is returend as "2020-01-01"
         Input('wechat-article-date-picker', 'start_date'),
         Input ('wechat-article-date-picker', "end_date") ,    #`start_date` and `end_date` are fixed expression you must use
-        Input('wechat-article-stats-type', 'value')           #columns ["reads","shares","jump_to_original","saves"]
-    ]
+        Input('wechat-article-stats-type', 'value'),           #columns ["reads","shares","jump_to_original","saves"]
+        Input('wechat-article-granularity', 'value')  #'day', 'week' or 'month'
+    ],
+    series_id='wechat-article-series',
+    function_name='dateRangeChart',
+    reset_zoom=[Input('wechat-article-date-picker', 'start_date'), Input('wechat-article-date-picker', 'end_date')]  #a new date range resets the zoom
 )
-def wechatArticle(startDate, endDate, statsList):    #startDate = start_date in the input, endDate = end_date in the input. BOTH ARE STRINGS
+@figureCache.memoize("wechatArticle", ["wechat"])
+def wechatArticle(startDate, endDate, statsList, granularity, window=None):    #startDate = start_date in the input, endDate = end_date in the input. BOTH ARE STRINGS
 
-    #filter by the date range
-    criteria = (df4.date >= startDate) & (df4.date <= endDate)
-    df4f=df4[criteria]
+    #the date range, or the visible part of it, as views of the date indexed series of the granularity
+    series = store.get("wechat").articleRollups.between(granularity, *chart_window(startDate, endDate, window))
 
     #iterate through the stats list that the user selected, add them to the `data` list
     article_data=[]
     for stat in statsList:
+        #every point, NOT downsampled: the points selected with the lasso are the dates summed by the article source
+        #chart, see wechatArticleSource(). A point left out would be a date left out of the sums
+        x, y = series.labels, series[stat]
         data_dict = {
-            "x": df4f['date'],  # var must be named x
-            "y": df4f[stat],  # var must be named y
+            "x": x,  # var must be named x
+            "y": y,  # var must be named y
             "mode": 'markers+lines',  # graph mode, line or markers. Must be named "mode"
             "name": stat,  # legend name. Must be named "name".
             "marker": {  # marker style. Must be named "marker"
@@ -1001,17 +1244,39 @@ def wechatArticle(startDate, endDate, statsList):    #startDate = start_date in
 
     return {
         'data': article_data,  # this is a list of dicts, where each dict is a line,
-        'layout': general_layout
+        'layout': dict(general_layout, uirevision=startDate + endDate)   #keep the user's zoom until the dates change
     }
 
+#Only the dates of the selected points matter to the wechat article source chart. Used as the cache key
+def selected_dates(selectedData):
+    """
+    :param selectedData: `selectedData` of the wechat article chart, or None
+    :return: sorted list of the distinct selected dates, or None if nothing is selected
+    """
+    if selectedData is None:
+        return None
+    return sorted({point["x"] for point in selectedData["points"]})
+
+def selected_buckets(selectedData, granularity):
+    """
+    :param selectedData: `selectedData` of the wechat article chart, or None
+    :param granularity: granularity of the wechat article chart when the points were selected
+    :return: [selected dates, granularity], the cache key of the wechat article source chart
+    """
+    return [selected_dates(selectedData), granularity]
+
 #Call back for the wechat article source chart
 @app.callback(
     Output('wechatSource', 'figure'),
     [
         Input('wechat-article-chart', 'selectedData')  #`wechat-article-chart` is the figure ID. `selectedData` is s fixed expression you must use.
+    ],
+    [
+        State('wechat-article-granularity', 'value')  #a selected point of a weekly/monthly chart stands for all the days of its week/month
     ]
 )
-def wechatArticleSource(selectedData):   #selectedData is returned as a dict, like below:
+@figureCache.memoize("wechatArticleSource", ["wechat"], normalize=selected_buckets)
+def wechatArticleSource(selectedData, granularity):   #selectedData is returned as a dict, like below:
     """
     {
   "points": [    #Points is a list of dict. Each dict is a single selected point. "x" is the value of the x axis, and "y" the "y axis" of that point. If nothing is selected, it will return "null". Therefore you can set an default option to show if the user doesn't click on anything.
@@ -1037,65 +1302,148 @@ def wechatArticleSource(selectedData):   #selectedData is returned as a dict, li
   }
 }
     :param selectedData:
+    :param granularity: 'day', 'week' or 'month'. For weeks and months, the x values are the first days of the buckets
     :return:
     """
-    ch=['公众号消息', '其它', '历史消息', '搜一搜', '朋友圈', '朋友在看', '看一看精选', '聊天会话']  #list of possible channels
-
-    data_dict = {
-        'channels': ch,
-        'percent': [],
-    }
+    wechat = store.get("wechat")
 
     if selectedData!= None:               #if points are selected
-        pointList=selectedData["points"]  #a list of dicts
-        dateList=[]                       #a list of lasso selected x values (which is date)
-        for point in pointList:           #get the x value (date) of the points the user selected
-            dateList.append(point["x"])
-
-        df5f = df5[df5['date'].isin(dateList)]    #filter through the df5 for only the dates that the user selected
-
-        # for each channel, sum up the numbers, then divide by total to get the percentage. Round to the 4th decimal so the numbers sum up to 1
-        total = df5f['全部'].sum()
-        for channel in data_dict['channels']:
-            data_dict['percent'].append(round(df5f[channel].sum() / total, 4))
-
-        dataDf=pd.DataFrame(data_dict)    #put the data in a clean dict for plotting using px
-
-        fig = px.bar(dataDf, x='channels', y='percent', color='channels')  #color each by by channel
-
-        fig.update_layout(           #update the layout
-            autosize=True,
-            template="plotly_white", #get rid of the default light blue background
-            margin=dict(t=20, b=35, l=10, r=10),
-            showlegend=False  #legend is the color code, we don't need it
-        )
-
-        return fig     #just return the fig
-
-    else:  #if no points are selected, it will return an empty dict {}, we will show the graph with averaged across all datapoints
+        # sum the date rows of the lasso selected x values (which are dates), then divide by total to get the percentage
+        shares = datastore.channel_shares(wechat.articleChannels, selected_dates(selectedData), granularity)
+        margin = dict(t=20, b=35, l=10, r=10)
+        height = None
+
+    else:  #if no points are selected, show the graph with averaged across all datapoints. Computed once per data version
+        shares = wechat.allChannelShares
+        margin = dict(t=20, b=20, l=40, r=10)
+        height = 300      #still responsive. no worries!
+
+    #one bar trace per channel, so each channel gets its own color
+    colors = px.colors.qualitative.Plotly
+    fig = go.Figure([
+        go.Bar(x=[channel], y=[share], name=channel, marker_color=colors[i % len(colors)])
+        for i, (channel, share) in enumerate(zip(datastore.wechatSourceChannelsList, shares))
+    ])
+
+    fig.update_layout(           #update the layout
+        autosize=True,
+        template="plotly_white", #get rid of the default light blue background
+        margin=margin,
+        height=height,
+        barmode='relative',      #one bar per x value, full width
+        xaxis_title='channels',
+        yaxis_title='percent',
+        showlegend=False  #legend is the color code, we don't need it
+    )
 
-        total = df5['全部'].sum()
-        for channel in data_dict['channels']:
-            data_dict['percent'].append(round(df5[channel].sum() / total, 4))  #keeep 4 digits otherwise the numbers might not add up to 1
+    return fig
 
-        dataDf=pd.DataFrame(data_dict)
+#
+#
+#
 
-        fig = px.bar(dataDf, x='channels', y='percent', color='channels')  #color each by by channel
+#--------------------------------------------Precomputed figures------------------------------------------------------
 
-        fig.update_layout(
-            autosize=True,
-            template="plotly_white", #get rid of the default light blue background
-            margin=dict(t=20, b=20, l=40, r=10),
-            #margin=dict(t=20, b=35, l=10, r=10),
-            height=300,       #still responsive. no worries!
-            showlegend=False,  #legend is the color code, we don't need it
-        )
+# After every load (or reload) of a dataset, the figures of its common views are computed in the background, default
+# views first, and stored in the figure cache. The first viewer after a deploy or a data refresh gets them from the
+# cache. See precompute.py
+precomputer = precompute.Precomputer(store, figureCache)
 
-        return fig
+def granularity_views(function, args, defaultStats, statsList):
+    """
+    Views of a chart with a stats dropdown and a granularity selector, called as function(*args, stats, granularity, None)
+    :param function: the memoized chart function
+    :param args: the arguments before the stats, e.g. the default dates
+    :param defaultStats: default value of the stats dropdown
+    :param statsList: options of the stats dropdown
+    :return: list of (priority, function, args)
+    """
+    views = []
+    for priority, stats in precompute.stat_lists(defaultStats, statsList):
+        for granularity in GRANULARITIES:
+            viewPriority = priority if granularity == GRANULARITIES[0] else max(priority, precompute.NEAR_VIEW)
+            views.append((viewPriority, function, tuple(args) + (stats, granularity, None)))   #None: not zoomed
+    return views
+
+@precomputer.views("email")
+def email_views(email):
+    views = []
+    for articleType in email.article_types:
+        for openOrClick in ['unique_opens', 'unique_clicks']:
+            for numberOrRatio in ['Percent', 'Total']:
+                view = (articleType, openOrClick, numberOrRatio)
+                priority = precompute.DEFAULT_VIEW if view == EMAIL_DEFAULT_VIEW else precompute.NEAR_VIEW
+                views.append((priority, update_graph, view))
+    return views
+
+@precomputer.views("web")
+def web_views(web):
+    #the date pickers send their dates back as json, e.g. "2020-05-15T00:00:00"
+    dates = (precompute.as_sent(WEB_START_DATE), precompute.as_sent(web.webMaxDate))
+    views = [(priority, webCumStats, dates + (stats, None))
+             for priority, stats in precompute.stat_lists(WEB_DEFAULT_STATS, webCumStatsList)]
+    if not CLIENTSIDE_CHARTS:   #these charts are drawn in the browser then
+        views += granularity_views(update_webstat_graph, (), WEB_DEFAULT_STATS, webStatsList)
+    return views
+
+@precomputer.views("wechat")
+def wechat_views(wechat):
+    views = [(precompute.DEFAULT_VIEW if granularity == GRANULARITIES[0] else precompute.NEAR_VIEW,
+              wechatArticleSource, (None, granularity))   #nothing selected: the average of all the articles
+             for granularity in GRANULARITIES]
+    if not CLIENTSIDE_CHARTS:
+        endDate = precompute.as_sent(wechat.wechatMaxDate)
+        views += granularity_views(wechatFollwer, (precompute.as_sent(WECHAT_START_DATE), endDate),
+                                   WECHAT_FOLLOWER_DEFAULT_STATS, wechatFollowerStatsList)
+        views += granularity_views(wechatArticle, (precompute.as_sent(WECHAT_ARTICLE_START_DATE), endDate),
+                                   WECHAT_ARTICLE_DEFAULT_STATS, wechatArticleStatsList)
+    return views
 
 #
 #
 #
 
+#Metrics of every server callback above: latency, response size, input cardinality, figure cache hits
+callbackMetrics = metrics.CallbackMetrics(figureCache)
+if metrics.METRICS:
+    callbackMetrics.instrument(app)
+
+#Callback metrics of this server process, in the Prometheus text format
+@application.route("/metrics")
+def prometheus_metrics():
+    return flask.Response(callbackMetrics.render() + precomputer.render_metrics() + httpCache.render_metrics(),
+                          mimetype="text/plain; version=0.0.4")
+
+#Where the time of the profiled callback calls goes (CAS_PROFILE_SAMPLE)
+@application.route("/metrics/profile")
+def profile_report():
+    return flask.Response(callbackMetrics.render_profile(), mimetype="text/plain")
+
+#Readiness check for the load balancer: 200 once every dataset is loaded (or right away when they are loaded lazily), 503 before
+@application.route("/ready")
+def ready():
+    status = store.status()
+    isReady = not PRELOAD_DATA or all(dataset["loaded"] for dataset in status.values())
+    return flask.jsonify(ready=isReady, datasets=status), 200 if isReady else 503
+
+# datasets are loaded when their tab is first opened. With CAS_PRELOAD_DATA=1 (set by gunicorn.conf.py) every dataset
+# is loaded now instead, once in the master before the workers are forked, and the figures of the common views are
+# computed right away: the workers inherit them in their figure cache. Then watch the loaded files for changes, and
+# precompute the figures of the reloaded data in the background.
+# Under gunicorn the master never starts these threads: it serves no request, and a fork while one of them holds a lock
+# of the data store would leave the lock held forever in the new worker. Every worker starts its own in post_fork
+if PRELOAD_DATA:
+    with startup_profile.phase("load data"):
+        store.load_all()
+    with startup_profile.phase("precompute figures"):
+        precomputer.run_pending()
+if not PREFORK_SERVER:
+    store.start_watcher()
+    precomputer.start()
+
+# the app is ready: write the startup report (CAS_STARTUP_REPORT), and fail if it took too long (CAS_STARTUP_BUDGET)
+startup_profile.PROFILE.finish()
+
+#development server. In production, run gunicorn with gunicorn.conf.py (see the Procfile)
 if __name__ == "__main__":
     application.run(debug=True, port=8080)
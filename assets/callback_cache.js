@@ -0,0 +1,57 @@
+/*
+Conditional callback requests. Browsers never revalidate a POST, so the last callback responses are kept here with
+their ETag, and a request with the same body sends it in If-None-Match. The server answers 304 when the data and the
+code did not change since (see http_cache.py), and the kept response is used.
+Dash loads every .js file in `assets/` automatically, before the app starts.
+*/
+
+(function() {
+    var MAX_ENTRIES = 30;          // responses kept, least recently used dropped first
+    var MAX_LENGTH = 2000000;      // larger responses are not kept, to spare the memory of phones
+
+    var entries = new Map();       // request body -> {etag, body}
+    var originalFetch = window.fetch;
+    if (!originalFetch || !window.Map || !window.Headers || !window.Response) {
+        return;
+    }
+
+    function remember(key, entry) {
+        entries.delete(key);
+        entries.set(key, entry);   // Map keeps the insertion order: the most recently used is last
+        if (entries.size > MAX_ENTRIES) {
+            entries.delete(entries.keys().next().value);
+        }
+    }
+
+    window.fetch = function(url, options) {
+        if (!options || options.method !== 'POST' || typeof options.body !== 'string' ||
+                String(url).indexOf('_dash-update-component') === -1) {
+            return originalFetch.apply(this, arguments);
+        }
+        var key = options.body;
+        var entry = entries.get(key);
+        if (entry) {
+            var headers = new Headers(options.headers);
+            headers.set('If-None-Match', entry.etag);
+            options = Object.assign({}, options, {headers: headers});
+        }
+        return originalFetch.call(this, url, options).then(function(response) {
+            if (response.status === 304 && entry) {
+                remember(key, entry);
+                return new Response(entry.body, {status: 200, headers: {'Content-Type': 'application/json'}});
+            }
+            var etag = response.headers.get('ETag');
+            if (response.status !== 200 || !etag) {
+                return response;
+            }
+            return response.text().then(function(body) {
+                if (body.length <= MAX_LENGTH) {
+                    remember(key, {etag: etag, body: body});
+                } else {
+                    entries.delete(key);
+                }
+                return new Response(body, {status: 200, statusText: response.statusText, headers: response.headers});
+            });
+        });
+    };
+})();
@@ -0,0 +1,90 @@
+/*
+Clientside callbacks for the dashboard. Dash loads every .js file in `assets/` automatically.
+The functions are registered in application.py with ClientsideFunction(namespace='cas', function_name=...)
+*/
+
+// one line of a daily stats chart. Same style as the charts drawn on the server
+function casStatTrace(x, y, name) {
+    return {
+        x: x,
+        y: y,
+        mode: 'markers+lines',
+        name: name,
+        marker: {
+            size: 15,
+            opacity: 0.5,
+            line: {width: 0.5, color: 'white'}
+        }
+    };
+}
+
+// first day of the week (Monday) or month of a "YYYY-MM-DD" date, same as timeseries.bucket_starts()
+function casBucketStart(date, granularity) {
+    if (granularity === 'month') {
+        return date.slice(0, 8) + '01';
+    }
+    if (granularity === 'week') {
+        var day = new Date(date + 'T00:00:00Z');
+        day.setUTCDate(day.getUTCDate() - (day.getUTCDay() + 6) % 7);
+        return day.toISOString().slice(0, 10);
+    }
+    return date;
+}
+
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    cas: {
+
+        // Website - patch the `locations` and `z` of the geo chart with the frame of the selected date.
+        // The figure (and its geo json) stays in the browser, only the frame comes from the server
+        applyGeoFrame: function(frame, figure) {
+            if (!frame || !figure) {
+                return window.dash_clientside.no_update;
+            }
+            var trace = Object.assign({}, figure.data[0], {locations: frame.locations, z: frame.z});
+            return Object.assign({}, figure, {data: [trace]});
+        },
+
+        // Downsampled charts - forget the zoom when the date range changes, see reset_zoom_on() in application.py
+        resetZoom: function() {
+            return null;
+        },
+
+        // Website - daily stats chart (CLIENTSIDE_CHARTS mode). `levels` is {day: series, week: series, month: series},
+        // and a series is {date: [...], <stat>: [...], ...}
+        statChart: function(statsList, granularity, levels, layout) {
+            var series = levels[granularity || 'day'];
+            return {
+                data: (statsList || []).map(function(stat) {
+                    return casStatTrace(series.date, series[stat], stat);
+                }),
+                layout: layout
+            };
+        },
+
+        // WeChat - follower and article charts filtered by the date range picker (CLIENTSIDE_CHARTS mode).
+        // The picker returns "YYYY-MM-DD" or "YYYY-MM-DDT00:00:00", so only the date part is compared.
+        // Weekly and monthly points are dated with the first day of their bucket: the bucket of the start date is kept
+        dateRangeChart: function(startDate, endDate, statsList, granularity, levels, layout) {
+            var series = levels[granularity || 'day'];
+            var start = startDate ? casBucketStart(startDate.slice(0, 10), granularity) : '';
+            var end = endDate ? endDate.slice(0, 10) : '9999-12-31';
+
+            var rows = [];
+            for (var i = 0; i < series.date.length; i++) {
+                if (series.date[i] >= start && series.date[i] <= end) {
+                    rows.push(i);
+                }
+            }
+            var pick = function(column) {
+                return rows.map(function(i) { return column[i]; });
+            };
+
+            return {
+                data: (statsList || []).map(function(stat) {
+                    return casStatTrace(pick(series.date), pick(series[stat]), stat);
+                }),
+                layout: layout
+            };
+        }
+    }
+});
@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+
+"""
+Load test: simulated dashboard viewers against a running server.
+Every viewer loads the page, then repeats interaction sessions like a person would: switching tabs, dragging the geo
+slider (one request per slider step, like `updatemode="drag"`), lasso selections on the WeChat article chart and
+date range changes, with a think time between actions. Like dash-renderer, a change fires every server callback that
+has the changed property as an input, with the current values of the other inputs.
+
+The number of concurrent viewers is increased step by step, and each step reports the throughput, the p50/p95/p99
+latency and the error rate of the callback requests.
+
+    python benchmarks/loadtest.py --url http://127.0.0.1:8000 --users 1,4,16,64 --duration 30
+    python benchmarks/loadtest.py --years 5 --countries 150 --workers 4 --users 1,4,16,64
+
+Without --url, gunicorn (gunicorn.conf.py) is started on a free port, on synthetic data if --years is given.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import argparse
+import collections
+import datetime
+import json
+import os
+import pathlib
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+BENCHMARKS = pathlib.Path(__file__).resolve().parent
+ROOT = BENCHMARKS.parent
+sys.path.insert(0, str(BENCHMARKS))
+
+import synthetic
+from run import request_body
+
+#--------------------------------------------Settings---------------------------------------------------------------
+
+#properties of the layout components that are callback inputs or bound the simulated actions
+TRACKED_PROPS = ["value", "start_date", "end_date", "min", "max", "min_date_allowed", "max_date_allowed"]
+
+#weights of the actions on each tab. A tab switch can happen on every tab
+ACTIONS = {
+    "email": {"tab": 1},
+    "web": {"tab": 1, "slider": 3, "dates": 2},
+    "wechat": {"tab": 1, "lasso": 2, "dates": 2},
+}
+
+#date pickers of each tab
+DATE_PICKERS = {
+    "email": [],
+    "web": ["web-date-picker"],
+    "wechat": ["wechat-date-picker", "wechat-article-date-picker"],
+}
+
+#--------------------------------------------HTTP-------------------------------------------------------------------
+
+class Recorder(object):
+    """
+    Latency and outcome of every request, by action. Shared by the viewer threads
+    """
+
+    def __init__(self):
+        self.latencies = collections.defaultdict(list)   # action -> seconds of the answered requests
+        self.errors = collections.Counter()              # action -> failed requests
+        self._lock = threading.Lock()
+
+    def add(self, action, seconds, ok):
+        with self._lock:
+            if ok:
+                self.latencies[action].append(seconds)
+            else:
+                self.errors[action] += 1
+
+
+def request(url, recorder, action, body=None, timeout=60):
+    """
+    :param url: full url
+    :param recorder: Recorder of the request
+    :param action: action name the request is recorded under
+    :param body: json body of a POST, or None for a GET
+    :return: the decoded json answer, or None (no update, or a failed request)
+    """
+    data = None if body is None else json.dumps(body).encode("utf-8")
+    headers = {"Content-Type": "application/json"} if body is not None else {}
+    start = time.perf_counter()
+    try:
+        with urllib.request.urlopen(urllib.request.Request(url, data=data, headers=headers), timeout=timeout) as response:
+            payload = response.read()
+            status = response.status
+    except urllib.error.HTTPError as error:
+        error.read()
+        status, payload = error.code, b""
+    except (urllib.error.URLError, OSError):
+        status, payload = None, b""
+    recorder.add(action, time.perf_counter() - start, status is not None and status < 400)
+    if status != 200 or not payload or not payload.lstrip().startswith((b"{", b"[")):
+        return None     # 204 (PreventUpdate), an error, or html
+    return json.loads(payload.decode("utf-8"))
+
+#--------------------------------------------Viewer-----------------------------------------------------------------
+
+def components(tree):
+    """
+    :param tree: json of a Dash layout, e.g. the children returned by render_tab
+    :return: dict of component id -> its props
+    """
+    found = {}
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, list):
+            stack.extend(node)
+        elif isinstance(node, dict) and "props" in node:
+            props = node["props"]
+            if "id" in props:
+                found[props["id"]] = props
+            stack.append(props.get("children"))
+    return found
+
+
+class Viewer(object):
+    """
+    One simulated viewer: the current value of the input properties, and the actions of a person on the page
+    """
+
+    def __init__(self, url, dependencies, recorder, rng, dragInterval):
+        """
+        :param url: base url of the app, e.g. "http://127.0.0.1:8000"
+        :param dependencies: json of /_dash-dependencies
+        :param recorder: Recorder of the requests
+        :param rng: random.Random of this viewer
+        :param dragInterval: seconds between 2 slider steps of a drag
+        """
+        self.url = url.rstrip("/")
+        self.dependencies = [item for item in dependencies if item.get("clientside_function") is None]
+        self.recorder = recorder
+        self.rng = rng
+        self.dragInterval = dragInterval
+        self.props = {}      # "component id.property" -> value
+        self.layout = {}     # component id -> props of the components of the open tab
+        self.tab = None
+
+    def fire(self, action, changed):
+        """
+        Call the server callbacks that have a changed property as input, like dash-renderer
+        :param action: action name the requests are recorded under
+        :param changed: list of the changed "component id.property"
+        """
+        for dependency in self.dependencies:
+            inputs = ["%s.%s" % (item["id"], item["property"]) for item in dependency["inputs"]]
+            if not set(inputs) & set(changed):
+                continue
+            if any(item["id"] not in self.layout and item["id"] != "tabs" for item in dependency["inputs"]):
+                continue    # an input of another tab, not in the page
+            values = [self.props.get(key) for key in inputs]
+            state = [self.props.get("%s.%s" % (item["id"], item["property"])) for item in dependency["state"]]
+            body = request_body(dependency, dependency["output"], values, state)
+            body["changedPropIds"] = [key for key in inputs if key in changed]
+            answer = request(self.url + "/_dash-update-component", self.recorder, action, body)
+            if answer and dependency["output"] == "tab-content.children":
+                self.show_tab(answer["response"]["tab-content"]["children"])
+
+    def show_tab(self, children):
+        """
+        Take the components of a newly rendered tab, and fire their initial callbacks
+        """
+        self.layout = components(children)
+        self.props = {key: value for key, value in self.props.items() if key.startswith("tabs.")}
+        for componentId, props in self.layout.items():
+            for name in TRACKED_PROPS:
+                if name in props:
+                    self.props["%s.%s" % (componentId, name)] = props[name]
+        initial = ["%s.%s" % (componentId, name) for componentId in self.layout for name in TRACKED_PROPS + ["relayoutData", "selectedData"]]
+        self.fire("tab", initial)
+
+    def set(self, action, values):
+        """
+        :param values: dict of "component id.property" -> new value
+        """
+        self.props.update(values)
+        self.fire(action, list(values))
+
+    #--------------------------------------------Actions--------------------------------------------------------------
+
+    def load_page(self):
+        request(self.url + "/", self.recorder, "page")
+        request(self.url + "/_dash-layout", self.recorder, "page")
+        self.switch_tab("email")
+
+    def switch_tab(self, tab=None):
+        self.tab = tab or self.rng.choice([name for name in ACTIONS if name != self.tab])
+        self.set("tab", {"tabs.value": self.tab})
+
+    def drag_slider(self):
+        """
+        Drag the geo slider over 5 to 30 steps, one request per step
+        """
+        slider = self.layout.get("web-traffic-slider")
+        if slider is None:
+            return
+        position = self.props.get("web-traffic-slider.value", 0)
+        steps = self.rng.randint(5, 30) * self.rng.choice([-1, 1])
+        for _ in range(abs(steps)):
+            position = min(max(position + (1 if steps > 0 else -1), slider["min"]), slider["max"])
+            self.set("slider", {"web-traffic-slider.value": position})
+            time.sleep(self.dragInterval)
+
+    def random_range(self, picker):
+        """
+        :return: (start, end) "YYYY-MM-DD" dates inside the allowed dates of a date picker
+        """
+        props = self.layout[picker]
+        first = datetime.date.fromisoformat(props["min_date_allowed"][:10])
+        last = datetime.date.fromisoformat(props["max_date_allowed"][:10])
+        days = max((last - first).days - 1, 1)
+        start, end = sorted(self.rng.randint(0, days) for _ in range(2))
+        return (str(first + datetime.timedelta(days=start)),
+                str(first + datetime.timedelta(days=max(end, start + 1))))
+
+    def change_dates(self):
+        picker = self.rng.choice(DATE_PICKERS[self.tab])
+        start, end = self.random_range(picker)
+        # the picker sends a change when the start date is picked, then when the end date is picked
+        self.set("dates", {picker + ".start_date": start})
+        self.set("dates", {picker + ".end_date": end})
+
+    def lasso(self):
+        """
+        Select 5 to 60 consecutive days of the WeChat article chart
+        """
+        start, _ = self.random_range("wechat-article-date-picker")
+        first = datetime.date.fromisoformat(start)
+        points = [{"x": str(first + datetime.timedelta(days=day))} for day in range(self.rng.randint(5, 60))]
+        self.set("lasso", {"wechat-article-chart.selectedData": {"points": points}})
+
+    def session(self, deadline, think):
+        """
+        Act until the deadline
+        :param think: mean seconds between 2 actions
+        """
+        self.load_page()
+        while time.time() < deadline:
+            time.sleep(min(self.rng.expovariate(1 / think), max(deadline - time.time(), 0)) if think else 0)
+            if time.time() >= deadline:
+                break
+            weights = ACTIONS[self.tab]
+            action = self.rng.choices(list(weights), list(weights.values()))[0]
+            {"tab": self.switch_tab, "slider": self.drag_slider, "dates": self.change_dates, "lasso": self.lasso}[action]()
+
+#--------------------------------------------Load steps-------------------------------------------------------------
+
+def percentile(values, fraction):
+    """
+    :param values: sorted list
+    :return: value at that fraction of the list (nearest rank)
+    """
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def summary(latencies, errors, seconds):
+    """
+    :param latencies: list of the seconds of the answered requests
+    :param errors: number of failed requests
+    :param seconds: duration of the step
+    :return: dict with the throughput, percentiles in milliseconds and error rate
+    """
+    latencies = sorted(latencies)
+    requests = len(latencies) + errors
+    milliseconds = lambda value: None if value is None else round(value * 1000, 1)
+    return {
+        "requests": requests,
+        "throughput": round(requests / seconds, 2),
+        "p50_ms": milliseconds(percentile(latencies, 0.50)),
+        "p95_ms": milliseconds(percentile(latencies, 0.95)),
+        "p99_ms": milliseconds(percentile(latencies, 0.99)),
+        "error_rate": round(errors / requests, 4) if requests else 0,
+    }
+
+
+def run_step(url, users, duration, think, dragInterval, seed):
+    """
+    Run `users` concurrent viewers for `duration` seconds
+    :return: dict with the summary of all the requests, and of each action
+    """
+    dependencies = json.loads(urllib.request.urlopen(url.rstrip("/") + "/_dash-dependencies").read().decode("utf-8"))
+    recorder = Recorder()
+    deadline = time.time() + duration
+    viewers = [Viewer(url, dependencies, recorder, random.Random(seed * 1000 + i), dragInterval) for i in range(users)]
+    threads = [threading.Thread(target=viewer.session, args=(deadline, think), daemon=True) for viewer in viewers]
+    started = time.time()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    seconds = time.time() - started
+
+    allLatencies = [value for values in recorder.latencies.values() for value in values]
+    result = summary(allLatencies, sum(recorder.errors.values()), seconds)
+    result["users"] = users
+    result["actions"] = {action: summary(recorder.latencies[action], recorder.errors[action], seconds)
+                         for action in sorted(set(recorder.latencies) | set(recorder.errors))}
+    return result
+
+#--------------------------------------------Local server-----------------------------------------------------------
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_server(dataFolder, workers, threads):
+    """
+    Start gunicorn with gunicorn.conf.py and wait until /ready answers
+    :param dataFolder: CAS_DATA_PATH, or None for the default data folder
+    :return: (subprocess.Popen, base url)
+    """
+    port = free_port()
+    env = dict(os.environ, PORT=str(port), CAS_RELOAD_INTERVAL="0")
+    if dataFolder is not None:
+        env["CAS_DATA_PATH"] = str(dataFolder)
+    if workers:
+        env["CAS_WORKERS"] = str(workers)
+    if threads:
+        env["CAS_THREADS"] = str(threads)
+    server = subprocess.Popen([sys.executable, "-m", "gunicorn", "--config", "gunicorn.conf.py", "application:application"],
+                              cwd=str(ROOT), env=env, stdout=subprocess.DEVNULL)   # no access log on the report
+    url = "http://127.0.0.1:%d" % port
+    deadline = time.time() + 300
+    while time.time() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError("gunicorn exited with code %d" % server.returncode)
+        try:
+            urllib.request.urlopen(url + "/ready", timeout=5).read()
+            return server, url
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.5)
+    server.terminate()
+    raise RuntimeError("the server was not ready after 300s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate concurrent dashboard viewers")
+    parser.add_argument("--url", help="base url of a running app. Default: start gunicorn on a free port")
+    parser.add_argument("--users", default="1,2,4,8,16", help="comma separated numbers of concurrent viewers (default 1,2,4,8,16)")
+    parser.add_argument("--duration", type=float, default=30, help="seconds per step (default 30)")
+    parser.add_argument("--think", type=float, default=1.0, help="mean seconds between 2 actions of a viewer (default 1)")
+    parser.add_argument("--drag-interval", type=float, default=0.05, help="seconds between 2 slider steps (default 0.05)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--years", type=float, help="start the server on synthetic data of this many years")
+    parser.add_argument("--countries", type=int, default=150, help="countries of the synthetic data (default 150)")
+    parser.add_argument("--workers", type=int, help="CAS_WORKERS of the started server")
+    parser.add_argument("--threads", type=int, help="CAS_THREADS of the started server")
+    parser.add_argument("--output", help="write the results to this json file")
+    args = parser.parse_args()
+
+    server, dataFolder = None, None
+    url = args.url
+    try:
+        if url is None:
+            if args.years:
+                dataFolder = synthetic.generate(tempfile.mkdtemp(prefix="cas-load-"), args.years, args.countries)
+            server, url = start_server(dataFolder, args.workers, args.threads)
+
+        results = []
+        print("%6s %9s %9s %9s %9s %9s %8s" % ("users", "requests", "req/s", "p50 ms", "p95 ms", "p99 ms", "errors"))
+        for users in [int(value) for value in args.users.split(",") if value.strip()]:
+            result = run_step(url, users, args.duration, args.think, args.drag_interval, args.seed)
+            results.append(result)
+            print("%6d %9d %9.1f %9s %9s %9s %7.2f%%" % (users, result["requests"], result["throughput"], result["p50_ms"],
+                                                         result["p95_ms"], result["p99_ms"], result["error_rate"] * 100))
+            sys.stdout.flush()
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if dataFolder is not None:
+            shutil.rmtree(str(dataFolder), ignore_errors=True)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"url": url, "duration": args.duration, "think": args.think, "steps": results}, f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
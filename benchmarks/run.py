@@ -0,0 +1,295 @@
+# -*- coding: utf-8 -*-
+
+"""
+Benchmarks of the startup and of the server callbacks, on synthetic data of growing size.
+For every scale (years of daily rows x number of countries) the data files are generated in a temporary folder, then
+- the startup is timed twice in a new process: cold (no npz / simplified geo json caches yet) and warm
+- every benchmarked callback is called through the Dash endpoint, with the figure cache off, and timed
+
+    python benchmarks/run.py --years 1,5,10 --countries 50,250 --output benchmarks/baseline.json
+    python benchmarks/run.py --years 1,5,10 --countries 50,250 --baseline benchmarks/baseline.json
+
+With --baseline, the results are compared with an earlier run and the command fails (exit code 1) when a timing got
+slower than the tolerance.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import argparse
+import datetime
+import itertools
+import json
+import os
+import pathlib
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS = pathlib.Path(__file__).resolve().parent
+ROOT = BENCHMARKS.parent
+sys.path.insert(0, str(BENCHMARKS))
+
+import synthetic
+
+#--------------------------------------------Settings---------------------------------------------------------------
+
+#timings below this many milliseconds are noise: their changes are never reported as regressions
+NOISE_FLOOR_MS = 2.0
+
+#--------------------------------------------Callback cases---------------------------------------------------------
+
+def callback_cases(store):
+    """
+    The benchmarked calls, with inputs like the ones the browser sends
+    :param store: datastore.DataStore with every dataset loaded
+    :return: list of (case name, output id of the callback, calls). Each call is (input values, state values)
+    """
+    web, wechat = store.get("web"), store.get("wechat")
+    webFirst, webLast = str(web.webSeries.dates[0]), str(web.webSeries.dates[-1])
+    wechatFirst, wechatLast = str(wechat.articleSeries.dates[0]), str(wechat.articleSeries.dates[-1])
+    lastQuarter = str(web.webSeries.dates[max(0, len(web.webSeries) - 90)])
+    zoom = {"xaxis.range[0]": lastQuarter + " 00:00", "xaxis.range[1]": webLast + " 00:00"}
+    allWebStats = ['requests_all', 'threats_all', 'pageviews_all', 'unique_visitors', 'pageview_per_visitor']
+    cumStats = ['requests_all', 'threats_all', 'pageviews_all', 'unique_visitors']
+    lasso = {"points": [{"x": str(date)} for date in wechat.articleSeries.dates[-30:]]}
+
+    cases = [
+        ("render_tab[email]", "tab-content.children", [(["email"], [])]),
+        ("render_tab[web]", "tab-content.children", [(["web"], [])]),
+        ("render_tab[wechat]", "tab-content.children", [(["wechat"], [])]),
+        ("update_graph[newsletter,opens,Percent]", "email-trend-plot.figure", [(["newsletter", "unique_opens", "Percent"], [])]),
+        ("update_graph[event,clicks,Total]", "email-trend-plot.figure", [(["event", "unique_clicks", "Total"], [])]),
+        ("update_webstat_graph[day]", "web-trend-plot.figure", [([allWebStats, "day", None], [])]),
+        ("update_webstat_graph[week]", "web-trend-plot.figure", [([allWebStats, "week", None], [])]),
+        ("update_webstat_graph[day,zoom 90 days]", "web-trend-plot.figure", [([allWebStats, "day", zoom], [])]),
+        ("webCumStats[all dates]", "web-cumstats-chart.figure", [([webFirst, webLast, cumStats, None], [])]),
+        ("wechatFollwer[day]", "wechat-follower-chart.figure", [([wechatFirst, wechatLast, ["net_increase", "total"], "day", None], [])]),
+        ("wechatFollwer[month]", "wechat-follower-chart.figure", [([wechatFirst, wechatLast, ["net_increase", "total"], "month", None], [])]),
+        ("wechatArticle[day]", "wechat-article-chart.figure", [([wechatFirst, wechatLast, ["reads", "shares"], "day", None], [])]),
+        ("wechatArticle[month]", "wechat-article-chart.figure", [([wechatFirst, wechatLast, ["reads", "shares"], "month", None], [])]),
+        ("wechatArticleSource[all]", "wechatSource.figure", [([None], ["day"])]),
+        ("wechatArticleSource[lasso 30 days]", "wechatSource.figure", [([lasso], ["day"])]),
+    ]
+    # dragging the slider: one call per position, spread over the whole series
+    positions = [web.numEntries * i // 20 for i in range(20)]
+    cases.append(("updateWebTrafficGeo[slider drag]", "..web-traffic-frame.data...web-traffic-legend.children..",
+                  [([position], []) for position in positions]))
+    return cases
+
+
+def request_body(dependency, output, inputs, state):
+    """
+    :return: json body of a POST to /_dash-update-component, like the one dash-renderer sends
+    """
+    outputs = [{"id": item.split(".")[0], "property": item.split(".")[1]} for item in output.strip(".").split("...")]
+    inputs = [dict(id=item["id"], property=item["property"], value=value) for item, value in zip(dependency["inputs"], inputs)]
+    state = [dict(id=item["id"], property=item["property"], value=value) for item, value in zip(dependency["state"], state)]
+    return {
+        "output": output,
+        "outputs": outputs if len(outputs) > 1 else outputs[0],
+        "inputs": inputs,
+        "state": state,
+        "changedPropIds": ["%s.%s" % (item["id"], item["property"]) for item in inputs],
+    }
+
+
+def run_worker(repeat):
+    """
+    Time the callbacks of the app in this process. The data folder and settings come from the environment
+    :param repeat: number of timed calls per case
+    :return: dict of case name -> timings
+    """
+    sys.path.insert(0, str(ROOT))
+    import application
+
+    client = application.app.server.test_client()
+    dependencies = {item["output"]: item for item in client.get("/_dash-dependencies").get_json()}
+    results = {}
+    for name, output, calls in callback_cases(application.store):
+        bodies = [request_body(dependencies[output], output, inputs, state) for inputs, state in calls]
+        seconds, size = [], 0
+        for i in range(repeat + 1):
+            for body in bodies:
+                start = time.perf_counter()
+                response = client.post("/_dash-update-component", json=body)
+                elapsed = time.perf_counter() - start
+                if response.status_code != 200:
+                    raise RuntimeError("%s answered %d: %s" % (name, response.status_code, response.data[:300]))
+                if i:   # the first round warms up
+                    seconds.append(elapsed)
+                size = len(response.data)
+        results[name] = {
+            "median_ms": round(statistics.median(seconds) * 1000, 3),
+            "min_ms": round(min(seconds) * 1000, 3),
+            "max_ms": round(max(seconds) * 1000, 3),
+            "bytes": size,
+        }
+    return results
+
+#--------------------------------------------Runs-------------------------------------------------------------------
+
+def environment(dataFolder):
+    """
+    :return: environment variables of the benchmarked processes
+    """
+    env = dict(os.environ)
+    env.update({
+        "CAS_DATA_PATH": str(dataFolder),
+        "CAS_PRELOAD_DATA": "1",
+        "CAS_RELOAD_INTERVAL": "0",
+        "CAS_FIGURE_CACHE": "off",    # time the callbacks, not the cache
+        "CAS_METRICS": "0",
+        "CAS_STARTUP_BUDGET": "",
+    })
+    return env
+
+
+def time_startup(dataFolder):
+    """
+    :return: total seconds, memory, and seconds of the top level phases of a startup in a new process
+    """
+    with tempfile.NamedTemporaryFile(suffix=".json") as reportFile:
+        env = environment(dataFolder)
+        env["CAS_STARTUP_REPORT"] = reportFile.name
+        subprocess.run([sys.executable, "-m", "startup_profile"], cwd=str(ROOT), env=env, check=True)
+        report = json.load(open(reportFile.name))
+    return {
+        "total_seconds": report["total_seconds"],
+        "rss_mb": report["rss_mb"],
+        "phases": {phase["name"]: phase["seconds"] for phase in report["phases"] if phase["depth"] == 0},
+    }
+
+
+def run_scale(years, countries, vertices, repeat, keep=None):
+    """
+    Generate the data of one scale and benchmark it
+    :param keep: folder where the generated data is kept, or None for a temporary folder
+    :return: dict with the startup and callback timings
+    """
+    dataFolder = pathlib.Path(keep or tempfile.mkdtemp(prefix="cas-bench-"))
+    try:
+        started = time.perf_counter()
+        synthetic.generate(dataFolder, years, countries, vertices)
+        print("  data generated in %.1fs" % (time.perf_counter() - started), file=sys.stderr)
+
+        cold = time_startup(dataFolder)
+        warm = time_startup(dataFolder)
+        print("  startup %.2fs cold, %.2fs warm" % (cold["total_seconds"], warm["total_seconds"]), file=sys.stderr)
+
+        worker = subprocess.run([sys.executable, str(pathlib.Path(__file__).resolve()), "--worker", "--repeat", str(repeat)],
+                                cwd=str(ROOT), env=environment(dataFolder), check=True, stdout=subprocess.PIPE)
+        return {
+            "years": years,
+            "countries": countries,
+            "vertices": vertices,
+            "startup": {"cold": cold, "warm": warm},
+            "callbacks": json.loads(worker.stdout.decode()),
+        }
+    finally:
+        if keep is None:
+            shutil.rmtree(str(dataFolder), ignore_errors=True)
+
+#--------------------------------------------Comparison-------------------------------------------------------------
+
+def timings(run):
+    """
+    :param run: result of run_scale()
+    :return: dict of timing name -> milliseconds
+    """
+    values = {}
+    for kind in ["cold", "warm"]:
+        values["startup %s" % kind] = run["startup"][kind]["total_seconds"] * 1000
+        for name, seconds in run["startup"][kind]["phases"].items():
+            values["startup %s: %s" % (kind, name)] = seconds * 1000
+    for name, timing in run["callbacks"].items():
+        values[name] = timing["median_ms"]
+    return values
+
+
+def compare(results, baseline, tolerance):
+    """
+    Print the changes from the baseline
+    :param results: dict of scale name -> result of run_scale()
+    :param baseline: same dict, from an earlier run
+    :param tolerance: allowed slowdown, e.g. 0.2 for 20%
+    :return: list of (scale, timing name, baseline ms, ms) of the regressions
+    """
+    regressions = []
+    for scale, run in results.items():
+        if scale not in baseline["scales"]:
+            print("%s: not in the baseline" % scale)
+            continue
+        before, after = timings(baseline["scales"][scale]), timings(run)
+        print("%s" % scale)
+        for name in sorted(set(before) & set(after)):
+            ratio = after[name] / before[name] if before[name] else float("inf")
+            regression = ratio > 1 + tolerance and after[name] - before[name] > NOISE_FLOOR_MS
+            print("  %-48s %10.1f ms %10.1f ms %7.2fx%s" % (name, before[name], after[name], ratio,
+                                                          "  REGRESSION" if regression else ""))
+            if regression:
+                regressions.append((scale, name, before[name], after[name]))
+    return regressions
+
+
+def scale_name(years, countries):
+    return "%gy-%dc" % (years, countries)
+
+
+def numbers(text, kind):
+    return [kind(value) for value in text.split(",") if value.strip()]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the startup and the callbacks on synthetic data")
+    parser.add_argument("--years", default="1,5,10", help="comma separated years of daily rows (default 1,5,10)")
+    parser.add_argument("--countries", default="50,250", help="comma separated numbers of countries (default 50,250)")
+    parser.add_argument("--vertices", type=int, default=200, help="points per country polygon (default 200)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed calls per callback case (default 5)")
+    parser.add_argument("--output", help="write the results to this json file")
+    parser.add_argument("--baseline", help="compare with the results of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed slowdown before a regression (default 0.2)")
+    parser.add_argument("--keep-data", help="generate the data in this folder (one sub folder per scale) and keep it")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        json.dump(run_worker(args.repeat), sys.stdout)
+        return 0
+
+    results = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.platform(),
+        "repeat": args.repeat,
+        "scales": {},
+    }
+    for years, countries in itertools.product(numbers(args.years, float), numbers(args.countries, int)):
+        scale = scale_name(years, countries)
+        print("%s" % scale, file=sys.stderr)
+        keep = pathlib.Path(args.keep_data).joinpath(scale) if args.keep_data else None
+        results["scales"][scale] = run_scale(years, countries, args.vertices, args.repeat, keep)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results["scales"], json.load(f), args.tolerance)
+        if regressions:
+            print("%d timings are more than %d%% slower than the baseline" % (len(regressions), args.tolerance * 100))
+            return 1
+    else:
+        for scale, run in results["scales"].items():
+            print("%s" % scale)
+            for name, milliseconds in sorted(timings(run).items()):
+                print("  %-48s %10.1f ms" % (name, milliseconds))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""
+Synthetic data files for the benchmarks, in the formats of the real `data/` folder:
+emailStat.csv, webStat.csv (with `requests_country` dicts), wechatFollower.csv, wechatTotalReads.csv,
+wechatArticleSource.csv, country_codes.csv and world_geo_json.json.
+
+    python benchmarks/synthetic.py /tmp/cas-data --years 5 --countries 150
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import argparse
+import datetime
+import itertools
+import json
+import math
+import pathlib
+import random
+import string
+
+#--------------------------------------------Settings---------------------------------------------------------------
+
+#last date of the generated series. The series go back `years` from here
+END_DATE = datetime.date(2020, 9, 21)
+
+#WeChat article source channels, see datastore.wechatSourceChannelsList
+CHANNELS = ['公众号消息', '其它', '历史消息', '搜一搜', '朋友圈', '朋友在看', '看一看精选', '聊天会话']
+
+EMAIL_TYPES = ["newsletter", "event", "job"]
+
+#--------------------------------------------Generators-------------------------------------------------------------
+
+def country_codes(count):
+    """
+    :param count: number of countries
+    :return: list of (name, 2 letter code, 3 letter code)
+    """
+    letters = ["".join(pair) for pair in itertools.product(string.ascii_uppercase, repeat=2)]
+    return [("Country %s" % code, code, code + "X") for code in letters[:count]]
+
+
+def write_country_codes(folder, codes):
+    with open(folder.joinpath("country_codes.csv"), "w") as f:
+        f.write("country,2_letter,3_letter\n")
+        for name, code2, code3 in codes:
+            f.write("%s,%s,%s\n" % (name, code2, code3))
+
+
+def write_geo_json(folder, codes, vertices, rng):
+    """
+    One polygon per country on a grid, with `vertices` points on a noisy circle and full precision coordinates,
+    like a detailed world map
+    """
+    columns = int(math.ceil(math.sqrt(len(codes))))
+    features = []
+    for i, (name, code2, code3) in enumerate(codes):
+        centerX = -170 + 340 * (i % columns + 0.5) / columns
+        centerY = -80 + 160 * (i // columns + 0.5) / columns
+        radius = 150 / columns
+        ring = []
+        for k in range(vertices):
+            angle = 2 * math.pi * k / vertices
+            r = radius * (0.7 + 0.3 * rng.random())
+            ring.append([centerX + r * math.cos(angle), centerY + r * math.sin(angle)])
+        ring.append(ring[0])
+        features.append({"type": "Feature", "id": code3, "properties": {"name": name},
+                         "geometry": {"type": "Polygon", "coordinates": [ring]}})
+    with open(folder.joinpath("world_geo_json.json"), "w") as f:
+        json.dump({"type": "FeatureCollection", "features": features}, f)
+
+
+def daily_dates(years):
+    start = END_DATE - datetime.timedelta(days=int(365.25 * years) - 1)
+    return [start + datetime.timedelta(days=i) for i in range((END_DATE - start).days + 1)]
+
+
+def write_web_stats(folder, dates, codes, rng):
+    """
+    Daily website stats. The requests per country follow a power law: a few countries send most of the requests,
+    and most countries show up only on some days
+    """
+    weights = [1 / (rank + 1) ** 1.2 for rank in range(len(codes))]
+    with open(folder.joinpath("webStat.csv"), "w") as f:
+        f.write("date,requests_all,threats_all,pageviews_all,unique_visitors,pageview_per_visitor,requests_country\n")
+        for date in dates:
+            requests = rng.randint(2000, 20000)
+            countries = {}
+            for (name, code2, code3), weight in zip(codes, weights):
+                expected = requests * weight / 4
+                if rng.random() < min(1, expected / 5 + 0.05):
+                    countries[code2] = max(1, int(rng.expovariate(1 / max(expected, 1))))
+            pageviews = rng.randint(200, 3000)
+            visitors = rng.randint(50, 600)
+            f.write('%s,%d,%d,%d,%d,%.3f,"%s"\n' % (date, requests, rng.randint(0, 50), pageviews, visitors,
+                                                    pageviews / visitors, countries))
+
+
+def write_wechat_stats(folder, dates, rng):
+    total = 0
+    with open(folder.joinpath("wechatFollower.csv"), "w") as follower, \
+            open(folder.joinpath("wechatTotalReads.csv"), "w") as reads, \
+            open(folder.joinpath("wechatArticleSource.csv"), "w") as source:
+        follower.write("date,new,unfollowed,net_increase,total\n")
+        reads.write("date,reads,shares,jump_to_original,saves\n")
+        source.write("date,title,全部," + ",".join(CHANNELS) + "\n")
+        article = 0
+        for date in dates:
+            new, unfollowed = rng.randint(0, 80), rng.randint(0, 30)
+            total += new - unfollowed
+            follower.write("%s,%d,%d,%d,%d\n" % (date, new, unfollowed, new - unfollowed, total))
+            reads.write("%s,%d,%d,%d,%d\n" % (date, rng.randint(0, 3000), rng.randint(0, 300), rng.randint(0, 50),
+                                              rng.randint(0, 80)))
+            for _ in range(rng.choice([0, 1, 1, 1, 2])):   # about 1 article a day
+                channels = [rng.randint(0, 400) for _ in CHANNELS]
+                source.write("%s,article %d,%d,%s\n" % (date, article, sum(channels), ",".join(map(str, channels))))
+                article += 1
+
+
+def write_email_stats(folder, dates, rng):
+    with open(folder.joinpath("emailStat.csv"), "w") as f:
+        f.write("article_type,send_time_date,delivered,unique_opens,unique_clicks,ind_open_rate,ind_click_rate\n")
+        for date in dates[::2]:   # a campaign every other day
+            delivered = rng.randint(500, 5000)
+            f.write("%s,%s,%d,%d,%d,0.21,0.027\n" % (rng.choice(EMAIL_TYPES), date, delivered,
+                                                    rng.randint(50, delivered // 2), rng.randint(5, delivered // 10)))
+
+
+def generate(folder, years=1, countries=50, vertices=200, seed=1):
+    """
+    Write a full data folder
+    :param folder: path of the folder, created if needed
+    :param years: length of the daily series, in years
+    :param countries: number of countries in the web stats and the geo json
+    :param vertices: number of points of each country polygon
+    :param seed: random seed. The same arguments always write the same files
+    :return: pathlib path of the folder
+    """
+    folder = pathlib.Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    codes = country_codes(countries)
+    dates = daily_dates(years)
+    write_country_codes(folder, codes)
+    write_geo_json(folder, codes, vertices, rng)
+    write_web_stats(folder, dates, codes, rng)
+    write_wechat_stats(folder, dates, rng)
+    write_email_stats(folder, dates, rng)
+    return folder
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic dashboard data files")
+    parser.add_argument("folder")
+    parser.add_argument("--years", type=float, default=1)
+    parser.add_argument("--countries", type=int, default=50)
+    parser.add_argument("--vertices", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    generate(args.folder, args.years, args.countries, args.vertices, args.seed)
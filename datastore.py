@@ -0,0 +1,1278 @@
+# -*- coding: utf-8 -*-
+
+"""
+Data access layer for the dashboard.
+The source files are grouped in datasets (one per tab). Each dataset is loaded into an immutable Snapshot, together
+with the values derived from its files. A background watcher checks the file signatures and swaps in a new snapshot
+when a file changes, recomputing only the values that depend on the changed files.
+At startup the datasets are loaded at the same time, and the files of a dataset are read in a thread pool: every value
+is built as soon as the files and values it depends on are ready, so the start takes about as long as the slowest file
+and what depends on it, instead of the sum of all of them.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import pandas as pd
+import numpy as np
+from datetime import datetime as dt
+import pathlib
+import ast
+import concurrent.futures
+import contextlib
+import hashlib
+import io
+import json
+import os
+import sys
+import threading
+import time
+import logging
+
+from timeseries import TimeSeries, Rollups, bucket_starts
+import startup_profile
+
+logger = logging.getLogger(__name__)
+
+#--------------------------------------------File path and settings-------------------------------------------------
+
+PATH = pathlib.Path(__file__).parent
+
+DATA_PATH = pathlib.Path(os.environ.get("CAS_DATA_PATH", PATH.joinpath("data"))).resolve()
+
+#number of decimals kept in the coordinates of the geo json. 1 decimal (~10km) is finer than a pixel at mapbox_zoom=1.
+#set to "full" to draw world_geo_json.json at full resolution
+GEO_PRECISION = os.environ.get("CAS_GEO_PRECISION", "1")
+
+#seconds between 2 checks of the source files. 0 turns the background reload off
+RELOAD_INTERVAL = float(os.environ.get("CAS_RELOAD_INTERVAL", "60"))
+
+#threads that read the files and build the values of the datasets at the same time on a full load. 1 reads them one
+#after the other
+INGEST_WORKERS = int(os.environ.get("CAS_INGEST_WORKERS", "8"))
+
+# Email - the arrays kept for each article type
+emailSeriesList = ["delivered", "unique_opens", "unique_clicks", "unique_opens_rate", "unique_clicks_rate",
+                   "ind_open_rate", "ind_click_rate"]
+
+# Website - get a list of webstats.
+# daily stats
+webStatsList= ['requests_all', 'threats_all', 'pageviews_all','unique_visitors', 'pageview_per_visitor']
+# cumulative stats
+webCumStatsList= ['requests_all', 'threats_all', 'pageviews_all','unique_visitors']
+
+# weekly/monthly rollups of the daily web stats. The page views per visitor are recomputed from the sums
+webRollupRules = {
+    'requests_all': "sum",
+    'threats_all': "sum",
+    'pageviews_all': "sum",
+    'unique_visitors': "sum",
+    'pageview_per_visitor': ("ratio", 'pageviews_all', 'unique_visitors'),
+}
+
+# WeChat - get a list of wechat follower stats
+wechatFollowerStatsList=["new","unfollowed","net_increase","total"]
+
+# weekly/monthly rollups of the follower stats. `total` is a running total: the last day of the bucket
+wechatFollowerRollupRules = {"new": "sum", "unfollowed": "sum", "net_increase": "sum", "total": "last"}
+
+# WeChat - get a list of wechat article stats
+wechatArticleStatsList=["reads","shares","jump_to_original","saves"]
+
+# weekly/monthly rollups of the article stats
+wechatArticleRollupRules = {stat: "sum" for stat in wechatArticleStatsList}
+
+# WeChat - the total reads of an article, then the reads from each channel
+wechatSourceTotal = '全部'
+wechatSourceChannelsList = ['公众号消息', '其它', '历史消息', '搜一搜', '朋友圈', '朋友在看', '看一看精选', '聊天会话']
+
+#--------------------------------------------Snapshots and data store-----------------------------------------------
+
+def file_signature(path):
+    """
+    Cheap signature of a source file, used to find out if it changed
+    :param path: pathlib path of the file
+    :return: (mtime in ns, size in bytes), or None if the file does not exist
+    """
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def signatures_key(signatures):
+    """
+    Short key that identifies a version of the source files. Unlike Snapshot.version, it is the same in every
+    process that reads the same files, so it can key caches shared between server workers
+    :param signatures: dict of file name -> file_signature()
+    :return: hex string
+    """
+    return hashlib.sha1(repr(sorted(signatures.items())).encode()).hexdigest()[:16]
+
+
+class Snapshot(object):
+    """
+    Immutable values of one dataset at one point in time. Values are read as attributes, e.g. `snapshot.df2`.
+    A callback should get the snapshot once and read everything from it, so it never mixes 2 versions of the data
+    """
+
+    def __init__(self, name, version, signatures, ingest, values):
+        object.__setattr__(self, "name", name)
+        object.__setattr__(self, "version", version)        # unique across all datasets and reloads
+        object.__setattr__(self, "signatures", signatures)  # file name -> file_signature() when it was read
+        object.__setattr__(self, "ingest", ingest)          # file name -> IngestState of the source tables
+        object.__setattr__(self, "values", values)          # field name -> value
+        object.__setattr__(self, "dataKey", signatures_key(signatures))
+        self.__dict__.update(values)
+
+    def __setattr__(self, key, value):
+        raise AttributeError("snapshots are immutable, can't set %s" % key)
+
+
+class Field(object):
+    """
+    One value of a dataset, see Dataset.field() and Dataset.table()
+    """
+
+    def __init__(self, name, deps, build, table=None, shared=True):
+        self.name = name
+        self.deps = tuple(deps)
+        self.build = build      # function(values) -> value
+        self.extend = None      # function(previous value, values, appended) -> value, see Dataset.extends()
+        self.table = table      # (file name, date column, unique dates, columns) for the source tables
+        self.shared = shared    # False: not published to the shared generations, see DataStore._shared_snapshot()
+
+
+class Dataset(object):
+    """
+    A group of source files and the values (fields) derived from them.
+    Fields are registered in order and list what they depend on: file names or earlier fields. On a reload, a field
+    is only rebuilt if something it depends on changed, otherwise the value of the previous snapshot is reused.
+    When the only change is new rows at the end of the daily csv files, the source tables read only those rows and
+    the fields with an `extends` function are extended instead of rebuilt
+    """
+
+    def __init__(self, name, files):
+        self.name = name
+        self.files = list(files)
+        self.fields = []
+
+    def _register(self, field):
+        names = [registered.name for registered in self.fields]
+        if field.name in names:
+            self.fields[names.index(field.name)] = field  # registering a name again replaces the field, in place
+        else:
+            self.fields.append(field)
+
+    def field(self, name, deps, shared=True):
+        """
+        Register a derived value. The build function gets a dict with the fields built so far, and the pathlib path
+        of every source file under its file name
+        :param name: field name, read as `snapshot.<name>`
+        :param deps: list of file names and field names the value is computed from
+        :param shared: False for a value that is only read to build other fields. It is then not published to the
+                       shared generations, and the server processes that attach to them don't have it
+        :return: decorator
+        """
+        def register(build):
+            self._register(Field(name, deps, build, shared=shared))
+            return build
+        return register
+
+    def extends(self, name):
+        """
+        Register how to extend a field when its dependencies only got new rows. The function gets the previous value,
+        the dict of fields built so far, and a dict of table name -> DataFrame with the new rows. It must not modify
+        the previous value. Returning the previous value itself means nothing changed
+        :param name: name of a registered field
+        :return: decorator
+        """
+        def register(extend):
+            [field] = [field for field in self.fields if field.name == name]
+            field.extend = extend
+            return extend
+        return register
+
+    def table(self, name, fileName, dateColumn="date", uniqueDates=True, columns=None):
+        """
+        Register a source table read from a csv file. The rows are sorted by date. New rows appended at the end of
+        the file are read on their own
+        :param name: field name of the DataFrame, e.g. "df2"
+        :param fileName: csv file name
+        :param dateColumn: column with the YYYY-MM-DD dates
+        :param uniqueDates: True if there is one row per date
+        :param columns: dict of column name -> dtype of the columns to read, so pandas doesn't guess the types and
+                        skips the other columns. None reads every column and guesses
+        """
+        self._register(Field(name, [fileName], None, table=(fileName, dateColumn, uniqueDates, columns), shared=False))
+
+    def code_key(self):
+        """
+        Key of the code the fields are built with, so a shared generation built by an older version of the app is
+        not used, see generations.py
+        :return: hex string made of the signatures of the modules that define the build functions
+        """
+        modules = {__name__, TimeSeries.__module__}
+        modules.update(function.__module__ for field in self.fields for function in (field.build, field.extend)
+                       if function is not None)
+        files = {name: file_signature(pathlib.Path(sys.modules[name].__file__)) for name in modules}
+        return signatures_key(files)
+
+    def signatures(self, dataPath):
+        """
+        :param dataPath: pathlib path of the data folder
+        :return: dict of file name -> file_signature()
+        """
+        return {fileName: file_signature(dataPath.joinpath(fileName)) for fileName in self.files}
+
+    def build(self, dataPath, version, signatures, previous=None, executor=None):
+        """
+        Build a snapshot, reusing (or extending) the fields of `previous` that don't depend on a rewritten file
+        :param dataPath: pathlib path of the data folder
+        :param version: version number of the new snapshot
+        :param signatures: signatures of the files, taken before reading them
+        :param previous: previous Snapshot of this dataset, or None to build everything
+        :param executor: concurrent.futures.Executor to build everything in, see build_concurrently(). None builds the
+                         fields one after the other
+        :return: Snapshot
+        """
+        values = {fileName: dataPath.joinpath(fileName) for fileName in self.files}
+        if previous is None and executor is not None:
+            ingest = {}
+            self.build_concurrently(values, ingest, executor)
+            return Snapshot(self.name, version, signatures, ingest, {field.name: values[field.name] for field in self.fields})
+
+        if previous is None:
+            changed = set(self.files)
+            ingest = {}
+        else:
+            changed = {fileName for fileName in self.files if previous.signatures.get(fileName) != signatures[fileName]}
+            ingest = dict(previous.ingest)
+
+        extended = set()   # changed files and fields that only got new rows
+        appended = {}      # table name -> DataFrame with the new rows
+
+        for field in self.fields:
+            name = field.name
+            hasPrevious = previous is not None and name in previous.values
+            if hasPrevious and not changed.intersection(field.deps):
+                values[name] = previous.values[name]
+                continue
+
+            if field.table is not None:
+                fileName, dateColumn, uniqueDates, columns = field.table
+                tail = None
+                if hasPrevious and fileName in ingest:
+                    tail = read_appended_rows(values[fileName], ingest[fileName], previous.values[name], dateColumn, uniqueDates)
+                if tail is None:
+                    with startup_profile.phase("%s.%s" % (self.name, name)):
+                        values[name], ingest[fileName] = read_table(values[fileName], dateColumn, columns)
+                else:
+                    rows, ingest[fileName] = tail
+                    extended.add(fileName)
+                    if rows.empty:
+                        values[name] = previous.values[name]
+                        changed.discard(fileName)  # e.g. the file was only touched. Nothing depends on it changed
+                        continue
+                    values[name] = pd.concat([previous.values[name], rows], ignore_index=True)
+                    appended[name] = rows
+                    extended.add(name)
+
+            elif hasPrevious and field.extend is not None and changed.intersection(field.deps) <= extended:
+                values[name] = field.extend(previous.values[name], values, appended)
+                if values[name] is previous.values[name]:
+                    continue
+                extended.add(name)
+
+            else:
+                with startup_profile.phase("%s.%s" % (self.name, name)):
+                    values[name] = field.build(values)
+
+            changed.add(name)
+
+        fields = {field.name: values[field.name] for field in self.fields}
+        return Snapshot(self.name, version, signatures, ingest, fields)
+
+    def build_concurrently(self, values, ingest, executor):
+        """
+        Build every field in a thread pool, each one as soon as what it depends on is built: the source tables are read
+        at the same time, and the values of a small table are built while a large one is still being read
+        :param values: dict of file name -> pathlib path. The fields are added to it
+        :param ingest: dict the IngestState of the source tables is added to
+        :param executor: concurrent.futures.Executor
+        """
+        waiting = list(self.fields)
+        running = {}   # future -> field
+        try:
+            while waiting or running:
+                for field in [field for field in waiting if all(dep in values for dep in field.deps)]:
+                    waiting.remove(field)
+                    # a copy of the values: this thread adds to them while the field is built
+                    future = executor.submit(startup_profile.nested(self.build_field), field, dict(values))
+                    running[future] = field
+                if not running:
+                    raise ValueError("fields of %s depend on unknown values: %s" % (self.name, [field.name for field in waiting]))
+                finished, _ = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in finished:
+                    field = running.pop(future)
+                    values[field.name], state = future.result()
+                    if field.table is not None:
+                        ingest[field.table[0]] = state
+        finally:
+            for future in running:
+                future.cancel()
+
+    def build_field(self, field, values):
+        """
+        :param field: Field to build from scratch
+        :param values: dict with the fields it depends on and the paths of the files
+        :return: (value, IngestState of a source table or None)
+        """
+        with startup_profile.phase("%s.%s" % (self.name, field.name)):
+            if field.table is not None:
+                fileName, dateColumn, uniqueDates, columns = field.table
+                return read_table(values[fileName], dateColumn, columns)
+            return field.build(values), None
+
+
+#--------------------------------------------Incremental csv ingestion----------------------------------------------
+
+# number of bytes before the ingested offset that must be unchanged for a file to count as "appended to"
+FINGERPRINT_SIZE = 256
+
+class IngestState(object):
+    """
+    How far a source table was read: the byte offset in the csv, the bytes just before it, and the last date
+    """
+
+    def __init__(self, offset, fingerprint, lastDate):
+        self.offset = offset
+        self.fingerprint = fingerprint
+        self.lastDate = lastDate
+
+
+def read_csv(raw, columns, path):
+    """
+    :param raw: bytes of a csv file, with its header line
+    :param columns: dict of column name -> dtype of the columns to read, or None for every column with guessed types
+    :param path: pathlib path of the csv, for the warning
+    :return: DataFrame. The columns are in the order of the file
+    """
+    if columns is None:
+        return pd.read_csv(io.BytesIO(raw))
+    try:
+        return pd.read_csv(io.BytesIO(raw), usecols=list(columns), dtype=columns)
+    except (ValueError, TypeError):
+        # e.g. an empty cell in an integer column. Guess the types like before
+        logger.warning("%s doesn't match the declared dtypes, guessing them", path.name, exc_info=True)
+        return pd.read_csv(io.BytesIO(raw), usecols=list(columns))
+
+
+def read_table(path, dateColumn, columns=None):
+    """
+    Read a whole csv file
+    :param path: pathlib path of the csv
+    :param dateColumn: column with the YYYY-MM-DD dates
+    :param columns: dict of column name -> dtype of the columns to read, see Dataset.table()
+    :return: (DataFrame, IngestState)
+    """
+    raw = path.read_bytes()
+    frame = read_csv(raw, columns, path)
+    if not frame[dateColumn].is_monotonic_increasing:
+        frame = frame.sort_values(dateColumn, kind="stable", ignore_index=True)  # the date indexes need sorted rows
+    lastDate = max(frame[dateColumn]) if len(frame) else ""
+    return frame, IngestState(len(raw), raw[-FINGERPRINT_SIZE:], lastDate)
+
+
+def read_appended_rows(path, state, frame, dateColumn, uniqueDates):
+    """
+    Read only the rows appended to a csv file since it was last read. Only complete lines are read, the last line may
+    still be being written
+    :param path: pathlib path of the csv
+    :param state: IngestState of the last read
+    :param frame: DataFrame of the last read. The new rows get its columns and dtypes
+    :param dateColumn: column with the YYYY-MM-DD dates
+    :param uniqueDates: True if there is one row per date
+    :return: (DataFrame with the new rows, new IngestState), or None if the file changed in any other way than new
+             rows at the end (it must then be read again as a whole)
+    """
+    fingerprintStart = max(0, state.offset - len(state.fingerprint))
+    with open(path, "rb") as f:
+        header = f.readline()   # the new rows are read with the header, so only the columns of `frame` are kept
+        f.seek(fingerprintStart)
+        if f.read(state.offset - fingerprintStart) != state.fingerprint:
+            return None  # the file was rewritten or truncated
+        tail = f.read()
+
+    tail = tail[:tail.rfind(b"\n") + 1]
+    newState = IngestState(state.offset + len(tail), (state.fingerprint + tail)[-FINGERPRINT_SIZE:], state.lastDate)
+    if not tail.strip():
+        return frame.iloc[0:0], newState
+
+    try:
+        rows = pd.read_csv(io.BytesIO(header + tail), usecols=list(frame.columns))
+        rows = rows[list(frame.columns)].astype(frame.dtypes.to_dict())
+    except (ValueError, TypeError, pd.errors.ParserError):
+        return None  # not the same columns or types as the file we read before
+
+    dates = rows[dateColumn]
+    if not dates.is_monotonic_increasing or dates.iloc[0] < state.lastDate:
+        return None  # rows were corrected or inserted, not appended
+    if uniqueDates and (dates.iloc[0] == state.lastDate or dates.duplicated().any()):
+        return None
+
+    newState.lastDate = dates.iloc[-1]
+    return rows, newState
+
+
+class DataStore(object):
+    """
+    Holds the current snapshot of every dataset.
+    Readers call get() and never block on a reload: a new snapshot is built aside and swapped in with a single
+    assignment. The builds of a dataset are serialized by a lock that readers don't take, different datasets are built
+    at the same time.
+    With shared generations, a snapshot built by one server process is published to memory mapped files, and the
+    other processes attach to it instead of building their own copy
+    """
+
+    def __init__(self, datasets, dataPath=DATA_PATH, generations=None, ingestWorkers=INGEST_WORKERS):
+        """
+        :param datasets: list of Dataset
+        :param dataPath: pathlib path of the data folder
+        :param generations: generations.Generations shared by the server processes, or None to keep the data in
+                            this process only
+        :param ingestWorkers: threads that read the files of a full load at the same time. 1 reads them in order
+        """
+        self.datasets = {dataset.name: dataset for dataset in datasets}
+        self.dataPath = dataPath
+        self.generations = generations
+        self.ingestWorkers = ingestWorkers
+        self._snapshots = {}
+        self._version = 0
+        self._lock = threading.Lock()                                   # versions and publishing
+        self._buildLocks = {name: threading.Lock() for name in self.datasets}
+        self._watcher = None
+        self._listeners = []
+
+    def get(self, name):
+        """
+        :param name: dataset name, e.g. "web"
+        :return: current Snapshot of the dataset. It is loaded first if needed
+        """
+        snapshot = self._snapshots.get(name)
+        if snapshot is None:
+            snapshot = self.load(name)
+        return snapshot
+
+    def load(self, name, executor=None):
+        """
+        Load a dataset, unless another thread did it already
+        :param name: dataset name
+        :param executor: thread pool to read its files in, see Dataset.build_concurrently(). None makes one
+        :return: current Snapshot of the dataset
+        """
+        with self._buildLocks[name]:
+            snapshot = self._snapshots.get(name)
+            if snapshot is None:
+                dataset = self.datasets[name]
+                with startup_profile.phase("load %s" % name):
+                    with self._ingest_executor(executor) as executor:
+                        snapshot = self._publish(dataset, dataset.signatures(self.dataPath), None, executor)
+        return snapshot
+
+    def load_all(self):
+        """
+        Load every dataset, at the same time
+        """
+        names = [name for name in self.datasets if name not in self._snapshots]
+        if self.ingestWorkers <= 1 or len(names) < 2:
+            for name in names:
+                self.get(name)
+            return
+        # one thread per dataset, whose files are read in the shared pool. A dataset waits for its own files only
+        with self._ingest_executor() as executor, \
+                concurrent.futures.ThreadPoolExecutor(len(names), thread_name_prefix="cas-load") as loaders:
+            loads = [loaders.submit(startup_profile.nested(self.load), name, executor) for name in names]
+            for load in loads:
+                load.result()
+
+    def _ingest_executor(self, executor=None):
+        """
+        :param executor: thread pool of the caller, used as is
+        :return: context manager of the thread pool of a full load, or of None to read the files in order
+        """
+        if executor is not None or self.ingestWorkers <= 1:
+            return contextlib.nullcontext(executor)
+        return concurrent.futures.ThreadPoolExecutor(self.ingestWorkers, thread_name_prefix="cas-ingest")
+
+    def status(self):
+        """
+        :return: dict of dataset name -> {"loaded", "version", "dataKey"} of its current snapshot
+        """
+        status = {}
+        for name in self.datasets:
+            snapshot = self._snapshots.get(name)
+            status[name] = {
+                "loaded": snapshot is not None,
+                "version": snapshot.version if snapshot is not None else None,
+                "dataKey": snapshot.dataKey if snapshot is not None else None,
+            }
+        return status
+
+    def refresh(self):
+        """
+        Reload the loaded datasets whose source files changed. A failed reload (e.g. a file that is still being
+        written) keeps the current snapshot and is tried again on the next call
+        :return: list of the reloaded dataset names
+        """
+        refreshed = []
+        for name, previous in list(self._snapshots.items()):
+            dataset = self.datasets[name]
+            signatures = dataset.signatures(self.dataPath)
+            if signatures == previous.signatures:
+                continue
+            with self._buildLocks[name]:
+                try:
+                    self._publish(dataset, signatures, previous)
+                except Exception:
+                    logger.exception("reloading the %s dataset failed, keeping the current data", name)
+                    continue
+            refreshed.append(name)
+        return refreshed
+
+    def subscribe(self, listener):
+        """
+        Call `listener(snapshot)` every time a new snapshot is published, e.g. to drop cached figures
+        :param listener: function of the new Snapshot
+        """
+        self._listeners.append(listener)
+
+    def _publish(self, dataset, signatures, previous, executor=None):
+        # the caller holds the build lock of the dataset
+        with self._lock:
+            self._version += 1
+            version = self._version
+        if self.generations is None:
+            snapshot = dataset.build(self.dataPath, version, signatures, previous, executor)
+        else:
+            snapshot = self._shared_snapshot(dataset, version, signatures, previous, executor)
+        with self._lock:   # the listeners see one new snapshot at a time
+            self._snapshots[dataset.name] = snapshot  # the atomic swap. Readers see the old or the new snapshot
+            for listener in self._listeners:
+                try:
+                    listener(snapshot)
+                except Exception:
+                    logger.exception("snapshot listener %r failed", listener)
+        return snapshot
+
+    def _shared_snapshot(self, dataset, version, signatures, previous, executor=None):
+        """
+        Attach the generation of these source files published by another server process, or build and publish it
+        :return: Snapshot whose arrays are memory maps of the generation. The fields that are not shared (e.g. the
+                 source tables, to read the rows appended next) are only kept by the process that built it. A
+                 process without them builds them again if they are needed for a reload
+        """
+        dataKey, codeKey = signatures_key(signatures), dataset.code_key()
+        fieldNames = [field.name for field in dataset.fields if field.shared]
+        with self.generations.lock(dataset.name):
+            with startup_profile.phase("%s.attach" % dataset.name):
+                values = self.generations.attach(dataset.name, dataKey, codeKey, fieldNames)
+            if values is not None:
+                return Snapshot(dataset.name, version, signatures, {}, values)
+
+            snapshot = dataset.build(self.dataPath, version, signatures, previous, executor)
+            with startup_profile.phase("%s.publish" % dataset.name):
+                values = self.generations.publish(dataset.name, dataKey, codeKey,
+                                                  {name: snapshot.values[name] for name in fieldNames})
+        if values is None:
+            return snapshot   # could not be published (logged), this process keeps its own copy
+        values.update((field.name, snapshot.values[field.name]) for field in dataset.fields if not field.shared)
+        return Snapshot(dataset.name, version, signatures, snapshot.ingest, values)
+
+    def drop_unshared(self):
+        """
+        Keep only the shared fields (the memory maps of the generations) in the current snapshots. The gunicorn master
+        calls it before forking the workers, so they don't inherit copies of the source tables that each of them would
+        copy again when it frees them. The next reload of a dataset then reads its files as a whole
+        """
+        if self.generations is None:
+            return
+        for name in list(self._snapshots):
+            with self._buildLocks[name]:
+                snapshot = self._snapshots[name]
+                fieldNames = [field.name for field in self.datasets[name].fields if field.shared]
+                if len(fieldNames) < len(snapshot.values):
+                    values = {fieldName: snapshot.values[fieldName] for fieldName in fieldNames}
+                    self._snapshots[name] = Snapshot(name, snapshot.version, snapshot.signatures, {}, values)
+
+    def start_watcher(self, interval=RELOAD_INTERVAL):
+        """
+        Start the background thread that calls refresh() every `interval` seconds
+        :param interval: seconds between 2 checks. 0 (or less) does nothing
+        """
+        if interval <= 0 or (self._watcher is not None and self._watcher.is_alive()):
+            return
+        self._watcher = threading.Thread(target=self._watch, args=(interval,), name="cas-data-watcher", daemon=True)
+        self._watcher.start()
+
+    def _watch(self, interval):
+        while True:
+            time.sleep(interval)
+            self.refresh()
+
+#--------------------------------------------data processing----------------------------------------------------------
+
+# General - function to get max date in the dataframe for date range picker
+def get_max_date(dateCol):
+    """
+    Get the max date in the data set
+    :param dateCol: A single pandas dataframe column containing the date information in YYYY-MM-DD format
+    :return: maxDate in python datetime format
+    """
+    maxYear, maxMonth, maxDate = [int(x) for x in max(dateCol).split('-')]  # we read from csv so the date is actually string!
+    maxDate=dt(maxYear, maxMonth, maxDate)  # use the max dates to set the date picker. Min date is 2020-05-15
+    return maxDate
+
+
+# General - prefix sums of the columns of a matrix, for constant time range sums
+def prefix_sums(matrix):
+    """
+    :param matrix: 2-D numpy array, one row per date
+    :return: array with one more row. Row i is the sum of the first i rows of `matrix`, so row 0 is all zeros
+    """
+    sums = np.zeros((matrix.shape[0] + 1, matrix.shape[1]), dtype=matrix.dtype)
+    np.cumsum(matrix, axis=0, out=sums[1:])
+    return sums
+
+def running_sums(cumSums, rows, visible):
+    """
+    Running totals from the first row of a range, read from its prefix sums without adding the rows up
+    :param cumSums: prefix_sums() result
+    :param rows: slice of the rows the totals start from, e.g. the date range of the date picker
+    :param visible: slice of the rows to return, that starts in `rows`, e.g. the zoomed x range of the chart
+    :return: array with one row per visible row: the sum of the rows from `rows.start` to that row, included
+    """
+    return cumSums[visible.start + 1:visible.stop + 1] - cumSums[rows.start]
+
+# Email - split the campaigns by article type
+def group_email_series(frame):
+    """
+    :param frame: emailStat.csv rows, sorted by send_time_date
+    :return: dict of article type -> TimeSeries of the columns in emailSeriesList. The counts are stored in the
+             smallest integer type that holds them, and the open/click rates are computed once
+    """
+    columns = {
+        "delivered": pd.to_numeric(frame["delivered"], downcast="integer"),
+        "unique_opens": pd.to_numeric(frame["unique_opens"], downcast="integer"),
+        "unique_clicks": pd.to_numeric(frame["unique_clicks"], downcast="integer"),
+        "unique_opens_rate": frame["unique_opens"] / frame["delivered"],
+        "unique_clicks_rate": frame["unique_clicks"] / frame["delivered"],
+        "ind_open_rate": frame["ind_open_rate"],
+        "ind_click_rate": frame["ind_click_rate"],
+    }
+    compact = pd.DataFrame(columns).assign(send_time_date=frame["send_time_date"], article_type=frame["article_type"])
+    return {
+        articleType: TimeSeries.from_frame(group, emailSeriesList, "send_time_date")
+        for articleType, group in compact.groupby("article_type", sort=False)
+    }
+
+# Email - the series of an article type without campaigns
+def empty_email_series():
+    """
+    :return: TimeSeries of the columns in emailSeriesList, without dates. Drawn as empty lines, e.g. when the article
+             type dropdown is cleared
+    """
+    return TimeSeries(np.array([], dtype="datetime64[D]"), {name: np.array([]) for name in emailSeriesList})
+
+# WeChat - sum the article source reads per date
+def aggregate_channels(frame):
+    """
+    :param frame: df5 rows, sorted by date. One row per article
+    :return: dict with
+        dates: sorted distinct dates, datetime64[D]
+        matrix: one row per date, columns `全部` then the channels of wechatSourceChannelsList, summed over the articles
+    """
+    dates, starts = np.unique(np.asarray(frame.date, dtype="datetime64[D]"), return_index=True)
+    values = frame[[wechatSourceTotal] + wechatSourceChannelsList].to_numpy()
+    matrix = np.add.reduceat(values, starts, axis=0) if len(values) else values
+    return {"dates": dates, "matrix": matrix}
+
+def extend_channels(previous, frame):
+    """
+    :param previous: aggregate_channels result
+    :param frame: df5 rows appended after the previous rows
+    :return: aggregate_channels result of all the rows. The arrays of `previous` are not modified
+    """
+    tail = aggregate_channels(frame)
+    if not len(tail["dates"]):
+        return previous
+    dates, matrix = previous["dates"], previous["matrix"]
+    if len(dates) and tail["dates"][0] == dates[-1]:
+        # more articles on the last date: add them to its row
+        tail["matrix"][0] += matrix[-1]
+        dates, matrix = dates[:-1], matrix[:-1]
+    return {"dates": np.concatenate([dates, tail["dates"]]), "matrix": np.concatenate([matrix, tail["matrix"]])}
+
+def channel_shares(channels, selectedDates=None, level="day"):
+    """
+    Share of the reads of each channel, in one reduction over the date matrix
+    :param channels: aggregate_channels result
+    :param selectedDates: dates to sum over (strings or dates, duplicates and unknown dates are ignored). None means
+                          all the dates
+    :param level: granularity of the selected dates. For "week" and "month", they are the first days of the buckets
+                  and every day of these buckets is summed
+    :return: numpy array of the share of each channel of wechatSourceChannelsList, rounded to 4 digits
+    """
+    if selectedDates is None:
+        sums = channels["matrix"].sum(axis=0)
+    else:
+        dates = channels["dates"]
+        wanted = np.asarray([str(date)[:10] for date in selectedDates], dtype="datetime64[D]")
+        if level != "day":
+            rows = np.flatnonzero(np.isin(bucket_starts(dates, level), wanted))
+        else:
+            rows = np.searchsorted(dates, wanted)
+            found = rows < len(dates)
+            rows = np.unique(rows[found][dates[rows[found]] == wanted[found]])
+        sums = channels["matrix"][rows].sum(axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):  # no reads: the shares are NaN, like pandas
+        return np.round(sums[1:] / sums[0], 4)
+
+# Website - parse the `requests_country` column ONCE into a long-format (date, country, requests) table
+def parse_requests_country(dateCol, requestsCountryCol, countries=()):
+    """
+    Parse the `requests_country` strings (e.g. "{'US': 12, 'CN': 3}") into a long-format table with integer codes
+    :param dateCol: pandas column with the dates in YYYY-MM-DD format, one per row of webStat.csv
+    :param requestsCountryCol: pandas column with the `requests_country` dict strings, one per row of webStat.csv
+    :param countries: countries that already have a code, in code order. New countries get the next codes
+    :return: dict of numpy arrays. `date_idx` is the row number in webStat.csv (which is also the slider value),
+             `country_idx` points into `countries`, and rows of date i live in `requests[row_ptr[i]:row_ptr[i+1]]`
+    """
+    countries = {country: i for i, country in enumerate(countries)}  # 2 letter country code -> integer code
+    date_idx, country_idx, requests = [], [], []
+    row_ptr = [0]
+    for i, countryDict in enumerate(requestsCountryCol):
+        for country, req in ast.literal_eval(countryDict).items():
+            date_idx.append(i)
+            country_idx.append(countries.setdefault(country, len(countries)))
+            requests.append(req)
+        row_ptr.append(len(requests))
+
+    return {
+        "dates": np.asarray(dateCol, dtype=str),
+        "countries": np.asarray(list(countries), dtype=str),
+        "date_idx": np.asarray(date_idx, dtype=np.int32),
+        "country_idx": np.asarray(country_idx, dtype=np.int32),
+        "requests": np.asarray(requests, dtype=np.int64),
+        "row_ptr": np.asarray(row_ptr, dtype=np.int64),
+    }
+
+def load_requests_country(csvPath, webDf):
+    """
+    Load the parsed `requests_country` table from the binary cache beside the csv, or build (and save) it if the
+    cache is missing or older than the csv. The cache is `webStat.requests_country.npz`
+    :param csvPath: pathlib path of webStat.csv
+    :param webDf: the dataframe read from webStat.csv
+    :return: dict of numpy arrays, see parse_requests_country()
+    """
+    cachePath = csvPath.with_suffix(".requests_country.npz")
+    stat = csvPath.stat()
+    sourceSig = np.asarray([stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+
+    try:
+        with np.load(cachePath, allow_pickle=False) as cache:
+            table = {key: cache[key] for key in cache.files}
+        # the cache is only valid for the exact same csv, with the same rows
+        if np.array_equal(table.pop("source_sig"), sourceSig) and np.array_equal(table["dates"], np.asarray(webDf.date, dtype=str)):
+            return table
+    except Exception:
+        pass  # no cache yet, or an unreadable cache (e.g. truncated: zipfile.BadZipFile). Rebuild below
+
+    table = parse_requests_country(webDf.date, webDf.requests_country)
+    save_requests_country(csvPath, table)
+    return table
+
+def save_requests_country(csvPath, table):
+    """
+    Save the parsed `requests_country` table as the binary cache beside the csv, see load_requests_country()
+    :param csvPath: pathlib path of webStat.csv. The cache is valid for its current mtime and size
+    :param table: dict of numpy arrays, see parse_requests_country()
+    """
+    cachePath = csvPath.with_suffix(".requests_country.npz")
+    stat = csvPath.stat()
+    sourceSig = np.asarray([stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+    tmpPath = cachePath.with_name("%s.%d.tmp" % (cachePath.name, os.getpid()))
+    try:
+        with open(tmpPath, "wb") as f:
+            np.savez(f, source_sig=sourceSig, **table)
+        os.replace(tmpPath, cachePath)   # readers (and a crash) never see a half written cache
+    except OSError:
+        # read-only deployment. We still have the parsed table in memory
+        with contextlib.suppress(OSError):
+            os.remove(tmpPath)
+
+def extend_requests_country(table, dateCol, requestsCountryCol):
+    """
+    Add the rows of new dates to a parsed `requests_country` table. The known countries keep their codes
+    :param table: dict of numpy arrays, see parse_requests_country(). It is not modified
+    :param dateCol: pandas column with the new dates
+    :param requestsCountryCol: pandas column with the `requests_country` dict strings of the new dates
+    :return: new dict of numpy arrays
+    """
+    new = parse_requests_country(dateCol, requestsCountryCol, table["countries"])
+    return {
+        "dates": np.concatenate([table["dates"], new["dates"]]),
+        "countries": new["countries"],
+        "date_idx": np.concatenate([table["date_idx"], new["date_idx"] + len(table["dates"])]),
+        "country_idx": np.concatenate([table["country_idx"], new["country_idx"]]),
+        "requests": np.concatenate([table["requests"], new["requests"]]),
+        "row_ptr": np.concatenate([table["row_ptr"], new["row_ptr"][1:] + table["row_ptr"][-1]]),
+    }
+
+
+# Website - map 2 letter country codes to 3 letter codes
+def map_country_codes(countries, countryCodeDf):
+    """
+    Map 2 letter country codes to the 3 letter codes used by the geo json
+    :param countries: list or array of 2 letter country codes
+    :param countryCodeDf: dataframe read from country_codes.csv, with `2_letter` and `3_letter` columns
+    :return: numpy object array with the 3 letter code of each country, None if the country is not in the table
+    """
+    codes = countryCodeDf.drop_duplicates("2_letter")
+    toThreeLetter = dict(zip(codes["2_letter"], codes["3_letter"]))
+    return np.asarray([toThreeLetter.get(country) for country in countries], dtype=object)
+
+# Website - the choropleth frame (3 letter `locations` and `z` requests) of every slider position
+class GeoFrames(object):
+    """
+    Choropleth frames read from the parsed country requests. The 2 letter -> 3 letter join is done ONCE per country,
+    so the geo callback does no pandas merge, and a frame is sliced out of the arrays when the slider asks for it:
+    no lists are kept per date, and the arrays can be memory mapped, see generations.py
+
+        geoFrames[sliderValue]  # {"locations": [...], "z": [...]}
+    """
+
+    def __init__(self, countryRequests, countryCodeDf):
+        """
+        :param countryRequests: dict of numpy arrays, see parse_requests_country()
+        :param countryCodeDf: dataframe read from country_codes.csv, with `2_letter` and `3_letter` columns
+        """
+        # the 3 letter code of every distinct 2 letter country. Countries without a code are dropped, like an inner merge
+        self.countryLocations = map_country_codes(countryRequests["countries"], countryCodeDf)
+        self.country_idx = countryRequests["country_idx"]
+        self.requests = countryRequests["requests"]
+        self.row_ptr = countryRequests["row_ptr"]
+
+    def __getitem__(self, position):
+        """
+        :param position: slider value, the row number in webStat.csv
+        :return: dict with the `locations` and `z` lists of that date
+        """
+        rows = slice(self.row_ptr[position], self.row_ptr[position + 1])
+        locations = self.countryLocations[self.country_idx[rows]]
+        known = locations != None  # noqa: E711 - elementwise comparison on an object array
+        return {"locations": locations[known].tolist(), "z": self.requests[rows][known].tolist()}
+
+    def __len__(self):
+        return len(self.row_ptr) - 1
+
+# Website - simplified geo json. Coordinates are rounded to a grid, so a border shared by 2 countries is rounded the
+# same way in both and no gaps or overlaps appear between neighbours
+def quantize_ring(ring, precision):
+    """
+    Round the coordinates of a linear ring, drop the points that become duplicates and the spikes (A, B, A) that
+    rounding leaves where a thin part of the ring collapses to a line
+    :param ring: list of [lon, lat] points. The first and the last point are the same
+    :param precision: number of decimals to keep
+    :return: the quantized ring, or None if it collapsed to less than a triangle
+    """
+    points = []  # without the closing point
+    for point in ring:
+        point = [round(point[0], precision), round(point[1], precision)]
+        if points and point == points[-1]:
+            continue
+        if len(points) >= 2 and point == points[-2]:
+            points.pop()  # A, B, A: back to A, without B
+            continue
+        points.append(point)
+
+    # the same around the first point, where the ring closes
+    while len(points) >= 3:
+        if points[-1] == points[0] or points[-2] == points[0]:
+            points.pop()
+        elif points[-1] == points[1]:
+            points = points[1:-1]
+        else:
+            break
+    if len(points) < 3:
+        return None
+    return points + [points[0]]  # rings must stay closed
+
+def quantize_polygon(polygon, precision):
+    """
+    Quantize the rings of a polygon
+    :param polygon: list of rings. The first is the exterior ring, the others are holes
+    :param precision: number of decimals to keep
+    :return: the quantized polygon, or None if its exterior ring is smaller than one grid cell
+    """
+    rings = [quantize_ring(ring, precision) for ring in polygon]
+    if rings[0] is None:
+        return None
+    return [ring for ring in rings if ring is not None]
+
+def simplify_geo_json(geoJson, keepIds, precision):
+    """
+    Build a smaller copy of the geo json: only the countries in `keepIds`, with quantized coordinates and no properties
+    :param geoJson: geo json FeatureCollection. The feature `id` is the 3 letter country code
+    :param keepIds: set of 3 letter country codes to keep
+    :param precision: number of decimals to keep in the coordinates
+    :return: simplified geo json FeatureCollection
+    """
+    features = []
+    for feature in geoJson["features"]:
+        if feature.get("id") not in keepIds:
+            continue
+
+        geometry = feature["geometry"]
+        if geometry["type"] == "Polygon":
+            polygons = [geometry["coordinates"]]
+        elif geometry["type"] == "MultiPolygon":
+            polygons = geometry["coordinates"]
+        else:
+            features.append(feature)  # not an area, keep as is
+            continue
+
+        polygons = [polygon for polygon in (quantize_polygon(polygon, precision) for polygon in polygons) if polygon is not None]
+        if not polygons:
+            continue  # the whole country is smaller than one grid cell
+
+        if len(polygons) == 1:
+            geometry = {"type": "Polygon", "coordinates": polygons[0]}
+        else:
+            geometry = {"type": "MultiPolygon", "coordinates": polygons}
+        features.append({"type": "Feature", "id": feature["id"], "properties": {}, "geometry": geometry})
+
+    return {"type": "FeatureCollection", "features": features}
+
+def load_geo_json(geoPath, keepIds, precision):
+    """
+    Load the geo json for the Choropleth map. Unless precision is "full", this is the simplified copy cached beside
+    the original (e.g. `world_geo_json.simplified-p1.json`), rebuilt when the original, the precision or the set of
+    countries changes. A valid cache means the full resolution file is never parsed
+    :param geoPath: pathlib path of world_geo_json.json
+    :param keepIds: set of 3 letter country codes that appear in the data
+    :param precision: number of decimals to keep, or "full"
+    :return: geo json FeatureCollection
+    """
+    if precision == "full":
+        with open(geoPath) as f:
+            return json.load(f)
+
+    precision = int(precision)
+    cachePath = geoPath.with_name("%s.simplified-p%d.json" % (geoPath.stem, precision))
+    stat = geoPath.stat()
+    cacheKey = {"source_sig": [stat.st_mtime_ns, stat.st_size], "precision": precision, "ids": sorted(keepIds),
+                "format": 2}  # format: changed with simplify_geo_json(), so older caches are rebuilt
+
+    try:
+        with open(cachePath) as f:
+            cached = json.load(f)
+        if cached.pop("cas_cache", None) == cacheKey:  # `cas_cache` is a foreign member, ignored by geo json readers
+            return cached
+    except (OSError, ValueError):
+        pass  # no cache yet, or unreadable cache. Rebuild below
+
+    with open(geoPath) as f:
+        geoJson = simplify_geo_json(json.load(f), keepIds, precision)
+
+    try:
+        tmpPath = cachePath.with_name(cachePath.name + ".tmp")
+        with open(tmpPath, "w") as f:
+            json.dump(dict(geoJson, cas_cache=cacheKey), f, separators=(",", ":"))
+        os.replace(tmpPath, cachePath)   # other processes never see a half written cache
+    except OSError:
+        pass  # read-only deployment. We still have the simplified geo json in memory
+    return geoJson
+
+
+class GeoShapes(object):
+    """
+    The polygons of a geo json FeatureCollection as flat arrays: the points of all the rings, and the offsets where
+    each ring, polygon and feature starts. The arrays can be memory mapped, so the server processes share one copy of
+    the geometry (see generations.py), and each process builds the geo json of the Choropleth map from it
+
+        GeoShapes(geoJson).to_geo_json()
+    """
+
+    def __init__(self, geoJson):
+        """
+        :param geoJson: geo json FeatureCollection. Features that are not areas are dropped: the map can't fill them
+        """
+        ids, points, ringPtr, polygonPtr, featurePtr = [], [], [0], [0], [0]
+        for feature in geoJson["features"]:
+            geometry = feature["geometry"]
+            if geometry["type"] == "Polygon":
+                polygons = [geometry["coordinates"]]
+            elif geometry["type"] == "MultiPolygon":
+                polygons = geometry["coordinates"]
+            else:
+                continue
+
+            for polygon in polygons:
+                for ring in polygon:
+                    points.extend(point[:2] for point in ring)  # an altitude is not drawn
+                    ringPtr.append(len(points))
+                polygonPtr.append(len(ringPtr) - 1)
+            featurePtr.append(len(polygonPtr) - 1)
+            ids.append(feature.get("id"))
+
+        self.ids = np.array(ids, dtype=object)
+        self.points = np.array(points, dtype="float64").reshape(-1, 2)
+        self.ring_ptr = np.array(ringPtr, dtype="int64")
+        self.polygon_ptr = np.array(polygonPtr, dtype="int64")
+        self.feature_ptr = np.array(featurePtr, dtype="int64")
+
+    def to_geo_json(self):
+        """
+        :return: geo json FeatureCollection, with the feature `id`s and no properties
+        """
+        points = self.points.tolist()
+        ringPtr, polygonPtr, featurePtr = self.ring_ptr.tolist(), self.polygon_ptr.tolist(), self.feature_ptr.tolist()
+        rings = [points[start:stop] for start, stop in zip(ringPtr[:-1], ringPtr[1:])]
+        polygons = [rings[start:stop] for start, stop in zip(polygonPtr[:-1], polygonPtr[1:])]
+
+        features = []
+        for featureId, start, stop in zip(self.ids.tolist(), featurePtr[:-1], featurePtr[1:]):
+            if stop - start == 1:
+                geometry = {"type": "Polygon", "coordinates": polygons[start]}
+            else:
+                geometry = {"type": "MultiPolygon", "coordinates": polygons[start:stop]}
+            features.append({"type": "Feature", "id": featureId, "properties": {}, "geometry": geometry})
+        return {"type": "FeatureCollection", "features": features}
+
+    def __len__(self):
+        return len(self.ids)
+
+#--------------------------------------------Datasets-----------------------------------------------------------------
+
+# Email - emailStat.csv
+EMAIL = Dataset("email", ["emailStat.csv"])
+
+EMAIL.table("df", "emailStat.csv", dateColumn="send_time_date", uniqueDates=False, columns={  # one row per campaign
+    "article_type": str, "send_time_date": str, "delivered": "int64", "unique_opens": "int64", "unique_clicks": "int64",
+    "ind_open_rate": "float64", "ind_click_rate": "float64",
+})
+
+@EMAIL.field("article_types", ["df"])
+def email_article_types(values):
+    # Email - get a list of email article types for the dropdown box
+    return values["df"]['article_type'].unique()
+
+@EMAIL.field("emailSeries", ["df"])
+def email_series(values):
+    # Email - the campaigns of each article type, as compact date indexed arrays
+    return group_email_series(values["df"])
+
+@EMAIL.extends("emailSeries")
+def extend_email_series(previous, values, appended):
+    emailSeries = dict(previous)
+    for articleType, series in group_email_series(appended["df"]).items():
+        emailSeries[articleType] = previous[articleType].extend_series(series) if articleType in previous else series
+    return emailSeries
+
+
+# Website - webStat.csv, the country codes and the geo json for the Choropleth map
+WEB = Dataset("web", ["webStat.csv", "country_codes.csv", "world_geo_json.json"])
+
+WEB.table("df2", "webStat.csv", columns=dict(
+    {"date": str}, **{stat: "int64" for stat in webCumStatsList}, pageview_per_visitor="float64", requests_country=str,
+))
+
+@WEB.field("country_code", ["country_codes.csv"])
+def read_country_codes(values):
+    # Website - table for all country codes. Only the codes are read
+    return pd.read_csv(values["country_codes.csv"], usecols=["2_letter", "3_letter"], dtype=str)
+
+@WEB.field("numEntries", ["df2"])
+def web_num_entries(values):
+    # Website - numEtries will be used for the sliderbar
+    return values["df2"].shape[0]
+
+@WEB.field("markDict", ["df2"])
+def web_mark_dict(values):
+    # Website - slider value -> date
+    return {key: str(value) for (key, value) in enumerate(values["df2"].date)}
+
+@WEB.extends("markDict")
+def extend_web_mark_dict(previous, values, appended):
+    markDict = dict(previous)
+    markDict.update((key, str(value)) for (key, value) in enumerate(appended["df2"].date, len(previous)))
+    return markDict
+
+@WEB.field("webMaxDate", ["df2"])
+def web_max_date(values):
+    # Website - get max date for date range picker
+    return get_max_date(values["df2"].date)
+
+@WEB.extends("webMaxDate")
+def extend_web_max_date(previous, values, appended):
+    return max(previous, get_max_date(appended["df2"].date))
+
+@WEB.field("webSeries", ["df2"])
+def web_series(values):
+    # Website - daily stats indexed by date, for the date range callbacks
+    return TimeSeries.from_frame(values["df2"], webStatsList)
+
+@WEB.extends("webSeries")
+def extend_web_series(previous, values, appended):
+    return previous.extend(appended["df2"])
+
+@WEB.field("webRollups", ["webSeries"])
+def web_rollups(values):
+    # Website - daily, weekly and monthly stats, for the granularity selector
+    return Rollups.build(values["webSeries"], webRollupRules)
+
+@WEB.extends("webRollups")
+def extend_web_rollups(previous, values, appended):
+    return previous.extend(values["webSeries"])
+
+@WEB.field("webCumSums", ["df2"])
+def web_cum_sums(values):
+    # Website - prefix sums of the cumulative stats: row i is the sum of the first i rows of df2, one column per stat in
+    # webCumStatsList. The sum over rows start..stop-1 is webCumSums[stop] - webCumSums[start]
+    return prefix_sums(values["df2"][webCumStatsList].to_numpy())
+
+@WEB.extends("webCumSums")
+def extend_web_cum_sums(previous, values, appended):
+    newSums = prefix_sums(appended["df2"][webCumStatsList].to_numpy())[1:] + previous[-1]
+    return np.concatenate([previous, newSums])
+
+@WEB.field("countryRequests", ["webStat.csv", "df2"])
+def web_country_requests(values):
+    return load_requests_country(values["webStat.csv"], values["df2"])
+
+@WEB.extends("countryRequests")
+def extend_web_country_requests(previous, values, appended):
+    # only the new rows are parsed. The cache is saved again so a restart doesn't parse them either
+    table = extend_requests_country(previous, appended["df2"].date, appended["df2"].requests_country)
+    save_requests_country(values["webStat.csv"], table)
+    return table
+
+@WEB.field("geoFrames", ["countryRequests", "country_code"])
+def web_geo_frames(values):
+    # Website - cheap to build again when rows are appended: only the distinct countries are joined
+    return GeoFrames(values["countryRequests"], values["country_code"])
+
+@WEB.field("geoCountries", ["countryRequests", "country_code"])
+def web_geo_countries(values):
+    # Website - the 3 letter codes of the countries that appear in the data
+    locations = map_country_codes(values["countryRequests"]["countries"], values["country_code"])
+    return {location for location in locations if location is not None}
+
+@WEB.extends("geoCountries")
+def extend_web_geo_countries(previous, values, appended):
+    # same set of countries: keep the previous set, so the geo json is not reloaded
+    geoCountries = web_geo_countries(values)
+    return previous if geoCountries == previous else geoCountries
+
+@WEB.field("geoShapes", ["world_geo_json.json", "geoCountries"])
+def web_geo_shapes(values):
+    # Website - the countries of the geo json for plotting the Choropleth map. Only the countries in the data are kept.
+    # Arrays, not json, so the server processes share them. See geo_figure() in application.py
+    return GeoShapes(load_geo_json(values["world_geo_json.json"], values["geoCountries"], GEO_PRECISION))
+
+@WEB.field("maxReq", ["countryRequests"])
+def web_max_requests(values):
+    # Website - get the max and min requests for country. Use these 2 numbers to set the range of the gradient bar in Geo chart
+    return int(values["countryRequests"]["requests"].max())
+
+def appended_requests(values, appended):
+    # the requests of the appended dates
+    countryRequests = values["countryRequests"]
+    return countryRequests["requests"][countryRequests["row_ptr"][-len(appended["df2"]) - 1]:]
+
+@WEB.extends("maxReq")
+def extend_web_max_requests(previous, values, appended):
+    requests = appended_requests(values, appended)
+    return max(previous, int(requests.max())) if len(requests) else previous
+
+@WEB.field("minReq", ["countryRequests"])
+def web_min_requests(values):
+    return int(values["countryRequests"]["requests"].min())
+
+@WEB.extends("minReq")
+def extend_web_min_requests(previous, values, appended):
+    requests = appended_requests(values, appended)
+    return min(previous, int(requests.min())) if len(requests) else previous
+
+
+# WeChat - follower, article reads and article source stats
+WECHAT = Dataset("wechat", ["wechatFollower.csv", "wechatTotalReads.csv", "wechatArticleSource.csv"])
+
+WECHAT.table("df3", "wechatFollower.csv", columns=dict({"date": str}, **{stat: "int64" for stat in wechatFollowerStatsList}))
+WECHAT.table("df4", "wechatTotalReads.csv", columns=dict({"date": str}, **{stat: "int64" for stat in wechatArticleStatsList}))
+WECHAT.table("df5", "wechatArticleSource.csv", uniqueDates=False, columns=dict(  # one row per article. The title is not read
+    {"date": str}, **{channel: "int64" for channel in [wechatSourceTotal] + wechatSourceChannelsList},
+))
+
+@WECHAT.field("followerSeries", ["df3"])
+def wechat_follower_series(values):
+    # WeChat - follower stats indexed by date, for the date range callbacks
+    return TimeSeries.from_frame(values["df3"], wechatFollowerStatsList)
+
+@WECHAT.extends("followerSeries")
+def extend_wechat_follower_series(previous, values, appended):
+    return previous.extend(appended["df3"])
+
+@WECHAT.field("followerRollups", ["followerSeries"])
+def wechat_follower_rollups(values):
+    # WeChat - daily, weekly and monthly follower stats, for the granularity selector
+    return Rollups.build(values["followerSeries"], wechatFollowerRollupRules)
+
+@WECHAT.extends("followerRollups")
+def extend_wechat_follower_rollups(previous, values, appended):
+    return previous.extend(values["followerSeries"])
+
+@WECHAT.field("articleSeries", ["df4"])
+def wechat_article_series(values):
+    # WeChat - article stats indexed by date, for the date range callbacks
+    return TimeSeries.from_frame(values["df4"], wechatArticleStatsList)
+
+@WECHAT.extends("articleSeries")
+def extend_wechat_article_series(previous, values, appended):
+    return previous.extend(appended["df4"])
+
+@WECHAT.field("articleRollups", ["articleSeries"])
+def wechat_article_rollups(values):
+    # WeChat - daily, weekly and monthly article stats, for the granularity selector
+    return Rollups.build(values["articleSeries"], wechatArticleRollupRules)
+
+@WECHAT.extends("articleRollups")
+def extend_wechat_article_rollups(previous, values, appended):
+    return previous.extend(values["articleSeries"])
+
+@WECHAT.field("articleChannels", ["df5"])
+def wechat_article_channels(values):
+    # WeChat - article source reads summed per date, for the lasso selections
+    return aggregate_channels(values["df5"])
+
+@WECHAT.extends("articleChannels")
+def extend_wechat_article_channels(previous, values, appended):
+    return extend_channels(previous, appended["df5"])
+
+@WECHAT.field("allChannelShares", ["articleChannels"])
+def wechat_all_channel_shares(values):
+    # WeChat - channel shares over all the dates, shown when nothing is selected
+    return channel_shares(values["articleChannels"])
+
+@WECHAT.field("wechatMaxDate", ["df3"])
+def wechat_max_date(values):
+    # WeChat - get max date for the date range picker
+    return get_max_date(values["df3"].date)
+
+@WECHAT.extends("wechatMaxDate")
+def extend_wechat_max_date(previous, values, appended):
+    return max(previous, get_max_date(appended["df3"].date))
+
+
+DATASETS = [EMAIL, WEB, WECHAT]
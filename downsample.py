@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+
+"""
+Downsampling of the daily time series charts.
+Only the points in the visible x range are sent, and at most CHART_POINTS of them per line, picked with the
+Largest-Triangle-Three-Buckets algorithm so the shape of the line is kept.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import os
+
+import numpy as np
+
+#--------------------------------------------Settings---------------------------------------------------------------
+
+#max number of points sent per line. About the width of a chart in pixels divided by the marker size. 0 sends all
+CHART_POINTS = int(os.environ.get("CAS_CHART_POINTS", "500"))
+
+#--------------------------------------------Visible range----------------------------------------------------------
+
+def parse_axis_value(value):
+    """
+    :param value: date of a plotly date axis, e.g. "2020-03-04 12:33:20.1234"
+    :return: numpy datetime64 in milliseconds, or None if it is not a date
+    """
+    try:
+        return np.datetime64(str(value).strip().replace(" ", "T"), "ms")
+    except ValueError:
+        return None
+
+
+def visible_range(relayoutData):
+    """
+    Days shown on the x axis after the user zoomed or panned
+    :param relayoutData: `relayoutData` of a dcc.Graph, e.g. {"xaxis.range[0]": "2020-03-04 12:33", "xaxis.range[1]": ...}
+    :return: (first day, last day) strings of the days fully inside the x range, or None for the whole series
+    """
+    if not relayoutData:
+        return None
+    if "xaxis.range" in relayoutData:
+        bounds = relayoutData["xaxis.range"]
+    else:
+        bounds = [relayoutData.get("xaxis.range[0]"), relayoutData.get("xaxis.range[1]")]
+    if len(bounds) != 2 or None in bounds:
+        return None  # autorange, autosize, or a zoom of the y axis only
+
+    values = [parse_axis_value(bound) for bound in bounds]
+    if None in values:
+        return None
+    start, end = sorted(values)
+    firstDay = start.astype("datetime64[D]")
+    if firstDay < start:
+        firstDay += np.timedelta64(1, "D")  # the range starts during that day, so its point is not visible
+    return str(firstDay), str(end.astype("datetime64[D]"))
+
+#--------------------------------------------Downsampling-----------------------------------------------------------
+
+def lttb(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: pick the points that keep the visual shape of a line
+    :param x: numpy array of the x values, sorted. Dates are used as their number of days
+    :param y: numpy array of the y values
+    :param threshold: number of points to keep
+    :return: numpy array of the positions of the kept points, sorted
+    """
+    n = len(x)
+    if threshold <= 0 or n <= threshold or threshold < 3:
+        return np.arange(n)
+
+    if np.issubdtype(x.dtype, np.datetime64):
+        x = x.astype("datetime64[D]")
+    x = x.astype("float64")
+    y = y.astype("float64")
+
+    # the first and last points are always kept, the points between are split in threshold - 2 buckets
+    edges = np.linspace(1, n - 1, threshold - 1).astype(int)
+    kept = np.empty(threshold, dtype=int)
+    kept[0], kept[-1] = 0, n - 1
+
+    previous = 0
+    for bucket in range(threshold - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+
+        # the third corner of the triangle is the average point of the next bucket
+        nextStop = edges[bucket + 2] if bucket + 2 < len(edges) else n
+        nextX = x[stop:nextStop].mean() if nextStop > stop else x[-1]
+        nextY = y[stop:nextStop].mean() if nextStop > stop else y[-1]
+
+        # keep the point of the bucket that makes the largest triangle with the previous kept point
+        area = np.abs((x[previous] - nextX) * (y[start:stop] - y[previous])
+                      - (x[previous] - x[start:stop]) * (nextY - y[previous]))
+        previous = start + int(np.nanargmax(area)) if not np.isnan(area).all() else start
+        kept[bucket + 1] = previous
+
+    return kept
+
+
+def downsample(x, y, threshold=CHART_POINTS, labels=None):
+    """
+    :param x: numpy array of the x values, sorted
+    :param y: numpy array of the y values
+    :param threshold: max number of points. 0 keeps all of them
+    :param labels: optional array of the same length as x, returned instead of x (e.g. the date labels of a series)
+    :return: (x, y) with at most `threshold` points
+    """
+    kept = lttb(x, y, threshold)
+    if labels is not None:
+        x = labels
+    if len(kept) == len(x):
+        return x, y
+    return x[kept], y[kept]
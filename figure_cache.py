@@ -0,0 +1,269 @@
+# -*- coding: utf-8 -*-
+
+"""
+Figure cache for the dashboard callbacks.
+A cached figure is keyed on the callback name, its (normalized) inputs and the data key of the snapshots it was
+computed from. Entries of a dataset are dropped when a new snapshot of that dataset is published.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import collections
+import functools
+import hashlib
+import json
+import os
+import pathlib
+import threading
+
+import plotly
+
+#--------------------------------------------Settings---------------------------------------------------------------
+
+#"memory" (per process), "file" (a folder shared by all server workers) or "off"
+FIGURE_CACHE = os.environ.get("CAS_FIGURE_CACHE", "memory")
+
+#max number of cached figures
+FIGURE_CACHE_SIZE = int(os.environ.get("CAS_FIGURE_CACHE_SIZE", "256"))
+
+#folder of the "file" cache. Default is `.figure_cache` in the data folder
+FIGURE_CACHE_DIR = os.environ.get("CAS_FIGURE_CACHE_DIR")
+
+#--------------------------------------------Backends---------------------------------------------------------------
+
+class MemoryBackend(object):
+    """
+    LRU cache in the memory of this process
+    """
+
+    def __init__(self, maxSize):
+        self.maxSize = maxSize
+        self._entries = collections.OrderedDict()   # key -> (tags, value), least recently used first
+        self._lock = threading.Lock()
+
+    def get(self, key, tags):
+        """
+        :param key: string key
+        :param tags: set of (dataset name, data key) the value was computed from
+        :return: the cached value, or None
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, tags, value):
+        """
+        :param key: string key
+        :param tags: set of (dataset name, data key) the value was computed from
+        :param value: the figure
+        """
+        with self._lock:
+            self._entries[key] = (tags, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxSize:
+                self._entries.popitem(last=False)
+
+    def drop_stale(self, datasetName, dataKey):
+        """
+        Drop the entries computed from another version of a dataset
+        """
+        with self._lock:
+            for key, (tags, value) in list(self._entries.items()):
+                if any(name == datasetName and tagKey != dataKey for name, tagKey in tags):
+                    del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileBackend(object):
+    """
+    LRU cache in a folder, shared by all the server workers. Figures are stored as plotly json, one file per entry.
+    The file name holds the data keys, so stale entries are found without reading the files
+    """
+
+    def __init__(self, folder, maxSize):
+        self.folder = pathlib.Path(folder)
+        self.folder.mkdir(parents=True, exist_ok=True)
+        self.maxSize = maxSize
+
+    def _path(self, key, tags):
+        tagPart = "-".join("%s_%s" % tag for tag in sorted(tags))
+        return self.folder.joinpath("%s--%s.json" % (tagPart, hashlib.sha1(key.encode()).hexdigest()))
+
+    def get(self, key, tags):
+        path = self._path(key, tags)
+        try:
+            with open(path) as f:
+                value = json.load(f)
+            os.utime(path)   # the modification time is the "last used" time
+        except (OSError, ValueError):
+            return None
+        return value
+
+    def set(self, key, tags, value):
+        path = self._path(key, tags)
+        tmpPath = path.with_name("%s.%d.tmp" % (path.name, os.getpid()))
+        try:
+            with open(tmpPath, "w") as f:
+                json.dump(value, f, cls=plotly.utils.PlotlyJSONEncoder)
+            os.replace(tmpPath, path)   # other workers never read a half written file
+        except OSError:
+            return
+        self._evict()
+
+    def _evict(self):
+        paths = list(self.folder.glob("*.json"))
+        if len(paths) <= self.maxSize:
+            return
+        def lastUsed(path):
+            try:
+                return path.stat().st_mtime
+            except OSError:
+                return 0
+        for path in sorted(paths, key=lastUsed)[:len(paths) - self.maxSize]:
+            try:
+                path.unlink()
+            except OSError:
+                pass  # another worker removed it first
+
+    def drop_stale(self, datasetName, dataKey):
+        prefix = datasetName + "_"
+        for path in self.folder.glob("*.json"):
+            tags = path.name.split("--")[0].split("-")
+            if any(tag.startswith(prefix) and tag != prefix + dataKey for tag in tags):
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+    def clear(self):
+        for path in self.folder.glob("*.json"):
+            try:
+                path.unlink()
+            except OSError:
+                pass
+
+    def __len__(self):
+        return len(list(self.folder.glob("*.json")))
+
+#--------------------------------------------Figure cache-----------------------------------------------------------
+
+class FigureCache(object):
+    """
+    Memoizes callbacks that return figures. Use `memoize` between @app.callback and the function:
+
+        @app.callback(Output(...), [Input(...)])
+        @figureCache.memoize("update_graph", ["email"])
+        def update_graph(...):
+    """
+
+    def __init__(self, store, backend=None):
+        """
+        :param store: datastore.DataStore the callbacks read from
+        :param backend: MemoryBackend, FileBackend, or None to turn caching off
+        """
+        self.store = store
+        self.backend = backend
+        self.hits = collections.Counter()     # callback name -> number of cache hits
+        self.misses = collections.Counter()   # callback name -> number of cache misses
+        store.subscribe(self._on_publish)
+
+    def _on_publish(self, snapshot):
+        if self.backend is not None:
+            self.backend.drop_stale(snapshot.name, snapshot.dataKey)
+
+    def key(self, name, datasets, args, normalize=None):
+        """
+        Cache key and tags of a call
+        :param name: callback name
+        :param datasets: names of the datasets the callback reads
+        :param args: the callback arguments
+        :param normalize: optional function of the arguments that returns an equivalent, more canonical value
+        :return: (string key, set of (dataset name, data key) tags)
+        """
+        tags = {(datasetName, self.store.get(datasetName).dataKey) for datasetName in datasets}
+        if normalize is not None:
+            args = normalize(*args)
+        key = json.dumps([name, sorted(tags), args], sort_keys=True, separators=(",", ":"), default=str)
+        return key, tags
+
+    def memoize(self, name, datasets, normalize=None):
+        """
+        Decorator that caches the figures returned by a callback
+        :param name: callback name, used in the key and the hit/miss counters
+        :param datasets: names of the datasets the callback reads, e.g. ["web"]
+        :param normalize: optional function of the callback arguments that returns an equivalent, more canonical
+                          value (e.g. only the dates of a lasso selection), so more calls share an entry
+        :return: decorator
+        """
+        def decorate(func):
+            @functools.wraps(func)
+            def cached(*args):
+                if self.backend is None:
+                    return func(*args)
+                key, tags = self.key(name, datasets, args, normalize)
+                value = self.backend.get(key, tags)
+                if value is not None:
+                    self.hits[name] += 1
+                    return value
+                self.misses[name] += 1
+                value = func(*args)
+                self.backend.set(key, tags, value)
+                return value
+            cached.uncached = func
+            cached.cacheName, cached.datasets, cached.normalize = name, datasets, normalize
+            return cached
+        return decorate
+
+    def warm(self, cached, args):
+        """
+        Compute and cache the figure of a call, unless it is cached already. Not counted as a hit or a miss
+        :param cached: function decorated with memoize()
+        :param args: the callback arguments
+        :return: True if the figure was computed
+        """
+        if self.backend is None:
+            return False
+        key, tags = self.key(cached.cacheName, cached.datasets, args, cached.normalize)
+        if self.backend.get(key, tags) is not None:
+            return False
+        self.backend.set(key, tags, cached.uncached(*args))
+        return True
+
+    def stats(self):
+        """
+        :return: dict with the number of entries, and the hits and misses of every callback
+        """
+        names = sorted(set(self.hits) | set(self.misses))
+        return {
+            "backend": type(self.backend).__name__ if self.backend is not None else None,
+            "entries": len(self.backend) if self.backend is not None else 0,
+            "callbacks": {name: {"hits": self.hits[name], "misses": self.misses[name]} for name in names},
+        }
+
+
+def make_figure_cache(store, kind=FIGURE_CACHE, maxSize=FIGURE_CACHE_SIZE, folder=FIGURE_CACHE_DIR):
+    """
+    Build the figure cache from the settings
+    :param store: datastore.DataStore the callbacks read from
+    :param kind: "memory", "file" or "off"
+    :param maxSize: max number of cached figures
+    :param folder: folder of the "file" cache. None means `.figure_cache` in the data folder
+    :return: FigureCache
+    """
+    if kind == "off":
+        return FigureCache(store, None)
+    if kind == "file":
+        try:
+            return FigureCache(store, FileBackend(folder or store.dataPath.joinpath(".figure_cache"), maxSize))
+        except OSError:
+            pass  # can't create the folder (read-only deployment). Fall back to the memory of this process
+    return FigureCache(store, MemoryBackend(maxSize))
@@ -0,0 +1,289 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shared data generations.
+A dataset snapshot is published once into a folder of numpy files (a generation), and every server process attaches
+to it with memory maps instead of keeping its own copy: the arrays are read from the page cache, which all the
+processes share, so the memory no longer grows with the number of workers. Each dataset has a CURRENT pointer to its
+newest generation, moved with an atomic rename when a reload publishes a new one. A file lock makes sure only one
+process builds a generation; the others wait and attach to it.
+
+    folder/web.CURRENT                   -> "web-<dataKey>-<id>"
+    folder/web-<dataKey>-<id>/manifest.json, 0.npy, 1.npy, ...
+
+The source tables (the DataFrames read from the csv files) are not shared: only the process that built the
+generation keeps them, to read the next appended rows.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import contextlib
+import datetime
+import importlib
+import json
+import logging
+import os
+import pathlib
+import shutil
+import uuid
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows. The generations need the file lock
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+#--------------------------------------------Settings---------------------------------------------------------------
+
+#"1" publishes the loaded datasets to shared memory mapped files. gunicorn.conf.py turns it on
+SHARED_DATA = os.environ.get("CAS_SHARED_DATA", "0") == "1"
+
+#folder of the generations. Default is `.generations` in the data folder. A folder in /dev/shm keeps them in memory
+SHARED_DATA_DIR = os.environ.get("CAS_SHARED_DATA_DIR")
+
+#version of the manifest format
+FORMAT = 1
+
+#modules whose classes can be stored in a generation
+MODULES = ["timeseries", "datastore"]
+
+#--------------------------------------------Encoding---------------------------------------------------------------
+
+def is_plain_json(value):
+    """
+    :return: True if the value is made of dicts with string keys, lists, strings, numbers, booleans and None only
+    """
+    stack = [value]
+    while stack:
+        value = stack.pop()
+        if isinstance(value, dict):
+            if not all(isinstance(key, str) for key in value):
+                return False
+            stack.extend(value.values())
+        elif isinstance(value, list):
+            stack.extend(value)
+        elif not (value is None or isinstance(value, (str, bool, int, float))):
+            return False
+    return True
+
+
+class Writer(object):
+    """
+    Encodes the values of a snapshot into json nodes, and the numpy arrays into .npy files of a generation folder
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+        self.arrays = {}   # id of an array -> file name, so an array shared by 2 values is written once
+        self._keep = []    # the written arrays, so their ids are not reused
+
+    def array(self, array):
+        if id(array) not in self.arrays:
+            fileName = "%d.npy" % len(self.arrays)
+            np.save(self.folder.joinpath(fileName), np.ascontiguousarray(array), allow_pickle=False)
+            self.arrays[id(array)] = fileName
+            self._keep.append(array)
+        return self.arrays[id(array)]
+
+    def encode(self, value):
+        """
+        :param value: value of a snapshot field
+        :return: json node
+        :raise TypeError: if the value can't be stored
+        """
+        if isinstance(value, np.ndarray):
+            if value.dtype == object:
+                if value.ndim != 1:
+                    raise TypeError("can't store a %d-D object array in a generation" % value.ndim)
+                return {"objects": self.encode(value.tolist())}
+            if value.size == 0:
+                return {"empty": value.dtype.str, "shape": list(value.shape)}   # an empty file can't be mapped
+            return {"npy": self.array(value)}
+        if isinstance(value, pd.DataFrame):
+            return {"frame": [[name, self.encode(value[name].to_numpy())] for name in value.columns]}
+        if isinstance(value, datetime.datetime):
+            return {"datetime": value.isoformat()}
+        if isinstance(value, np.generic):
+            return {"json": value.item()}
+        if is_plain_json(value):
+            return {"json": value}
+        if isinstance(value, dict):
+            return {"items": [[self.encode(key), self.encode(item)] for key, item in value.items()]}
+        if isinstance(value, (list, tuple, set, frozenset)):
+            kind = {list: "list", tuple: "tuple", set: "set", frozenset: "set"}[type(value)]
+            return {kind: [self.encode(item) for item in value]}
+        module = type(value).__module__
+        if module in MODULES and hasattr(value, "__dict__"):
+            return {"object": [module, type(value).__name__], "state": self.encode(vars(value))}
+        raise TypeError("can't store a %s in a generation" % type(value).__name__)
+
+
+def decode(node, folder):
+    """
+    :param node: json node written by Writer.encode()
+    :param folder: pathlib path of the generation folder
+    :return: the value. Arrays are read-only memory maps of the .npy files
+    """
+    kind, value = next(iter(node.items()))
+    if kind == "npy":
+        return np.load(folder.joinpath(value), mmap_mode="r", allow_pickle=False).view(np.ndarray)
+    if kind == "empty":
+        return np.empty(node["shape"], dtype=np.dtype(value))
+    if kind == "objects":
+        items = decode(value, folder)
+        array = np.empty(len(items), dtype=object)
+        array[:] = items
+        return array
+    if kind == "frame":
+        return pd.DataFrame({name: decode(column, folder) for name, column in value})
+    if kind == "datetime":
+        return datetime.datetime.fromisoformat(value)
+    if kind == "json":
+        return value
+    if kind == "items":
+        return {decode(key, folder): decode(item, folder) for key, item in value}
+    if kind in ("list", "tuple", "set"):
+        return {"list": list, "tuple": tuple, "set": set}[kind](decode(item, folder) for item in value)
+    if kind == "object":
+        module, name = value
+        if module not in MODULES:
+            raise ValueError("can't load a %s.%s from a generation" % (module, name))
+        cls = getattr(importlib.import_module(module), name)
+        instance = cls.__new__(cls)
+        instance.__dict__.update(decode(node["state"], folder))
+        return instance
+    raise ValueError("unknown node %r in a generation" % kind)
+
+#--------------------------------------------Generations------------------------------------------------------------
+
+class Generations(object):
+    """
+    The generations of every dataset, in one folder shared by the server processes
+
+        with generations.lock("web"):
+            values = generations.attach("web", dataKey, codeKey, fieldNames)
+            if values is None:
+                values = generations.publish("web", dataKey, codeKey, builtValues)
+    """
+
+    def __init__(self, folder):
+        """
+        :param folder: pathlib path of the folder. It is created if needed
+        """
+        self.folder = folder
+        self.folder.mkdir(parents=True, exist_ok=True)
+
+    @contextlib.contextmanager
+    def lock(self, name):
+        """
+        Hold the lock of a dataset, across processes. Readers of the current generation don't take it
+        :param name: dataset name
+        """
+        with open(self.folder.joinpath("%s.lock" % name), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def current(self, name):
+        """
+        :param name: dataset name
+        :return: pathlib path of the current generation folder of the dataset, or None
+        """
+        try:
+            return self.folder.joinpath(self.folder.joinpath("%s.CURRENT" % name).read_text().strip())
+        except OSError:
+            return None
+
+    def attach(self, name, dataKey, codeKey, fieldNames):
+        """
+        Map the current generation of a dataset, if it was built from the same files with the same code
+        :param name: dataset name
+        :param dataKey: datastore.signatures_key() of the source files
+        :param codeKey: key of the code that builds the fields, see datastore.Dataset.code_key()
+        :param fieldNames: names of the fields the generation must have
+        :return: dict of field name -> value, or None if there is no such generation
+        """
+        folder = self.current(name)
+        if folder is None:
+            return None
+        try:
+            with open(folder.joinpath("manifest.json")) as f:
+                manifest = json.load(f)
+            if (manifest["format"], manifest["dataKey"], manifest["codeKey"]) != (FORMAT, dataKey, codeKey) \
+                    or sorted(manifest["fields"]) != sorted(fieldNames):
+                return None
+            return {fieldName: decode(node, folder) for fieldName, node in manifest["fields"].items()}
+        except (OSError, ValueError, KeyError, TypeError, AttributeError):
+            logger.exception("can't attach the %s generation %s, building the data again", name, folder)
+            return None
+
+    def publish(self, name, dataKey, codeKey, values):
+        """
+        Write a new generation of a dataset, make it the current one, and map it
+        :param name: dataset name
+        :param dataKey: datastore.signatures_key() of the source files the values were built from
+        :param codeKey: key of the code that built the values
+        :param values: dict of field name -> value
+        :return: dict of field name -> value, read from the new generation. None if it could not be written
+        """
+        folder = self.folder.joinpath("%s-%s-%s" % (name, dataKey, uuid.uuid4().hex[:8]))
+        try:
+            folder.mkdir()
+            writer = Writer(folder)
+            manifest = {
+                "format": FORMAT,
+                "dataset": name,
+                "dataKey": dataKey,
+                "codeKey": codeKey,
+                "fields": {fieldName: writer.encode(value) for fieldName, value in values.items()},
+            }
+            with open(folder.joinpath("manifest.json"), "w") as f:
+                json.dump(manifest, f, separators=(",", ":"))
+
+            previous = self.current(name)
+            pointer = self.folder.joinpath("%s.CURRENT" % name)
+            tmpPath = pointer.with_name(pointer.name + ".tmp")
+            tmpPath.write_text(folder.name)
+            os.replace(tmpPath, pointer)   # readers see the old or the new generation, never a half written one
+        except (OSError, TypeError, ValueError):
+            logger.exception("can't publish the %s generation, keeping the data in this process", name)
+            shutil.rmtree(str(folder), ignore_errors=True)
+            return None
+
+        self.clean(name, [folder, previous])
+        return {fieldName: decode(node, folder) for fieldName, node in manifest["fields"].items()}
+
+    def clean(self, name, keep):
+        """
+        Delete the generations of a dataset that are not in `keep`. A process that still maps the files of a deleted
+        generation keeps reading them until it attaches to a newer one
+        :param name: dataset name
+        :param keep: pathlib paths of the generation folders to keep, e.g. the new and the previous one
+        """
+        for folder in self.folder.glob("%s-*" % name):
+            if folder.is_dir() and folder not in keep:
+                shutil.rmtree(str(folder), ignore_errors=True)
+
+
+def make_generations(dataPath):
+    """
+    :param dataPath: pathlib path of the data folder
+    :return: Generations, or None if CAS_SHARED_DATA is off (or the folder can't be used)
+    """
+    if not SHARED_DATA:
+        return None
+    if fcntl is None:
+        logger.warning("CAS_SHARED_DATA needs file locks, which this platform doesn't have. The data is not shared")
+        return None
+    folder = pathlib.Path(SHARED_DATA_DIR) if SHARED_DATA_DIR else dataPath.joinpath(".generations")
+    try:
+        return Generations(folder)
+    except OSError:
+        logger.exception("can't create the generations folder %s. The data is not shared", folder)
+        return None
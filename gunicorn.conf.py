@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+
+"""
+Production server settings: gunicorn --config gunicorn.conf.py application:application
+The app (and all its data) is loaded once in the master process, before the workers are forked. The workers share
+the loaded data instead of each parsing the csv and geo json files again: copy-on-write, and through the memory mapped
+generations of generations.py, which stay shared after a reload.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import gc
+import multiprocessing
+import os
+
+#--------------------------------------------Settings---------------------------------------------------------------
+
+#load every dataset when application.py is imported (in the master), not when its tab is first opened
+os.environ.setdefault("CAS_PRELOAD_DATA", "1")
+
+#share one memory mapped copy of the data between the workers, also after a reload (see generations.py)
+os.environ.setdefault("CAS_SHARED_DATA", "1")
+
+#the master imports the app but doesn't start its background threads. The workers start them in post_fork
+os.environ["CAS_PREFORK_SERVER"] = "1"
+
+#Elastic Beanstalk sends the requests to port 8000 (or $PORT)
+bind = "0.0.0.0:%s" % os.environ.get("PORT", "8000")
+
+#number of worker processes, and of threads per worker. The callbacks mostly wait on numpy and json encoding
+workers = int(os.environ.get("CAS_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("CAS_THREADS", "4"))
+worker_class = "gthread"
+
+#import application.py (load the data) in the master, then fork
+preload_app = True
+
+timeout = int(os.environ.get("CAS_WORKER_TIMEOUT", "60"))
+accesslog = "-"
+
+#--------------------------------------------Server hooks-----------------------------------------------------------
+
+def pre_fork(server, worker):
+    # with shared data, the workers only inherit the memory maps of the data, not the source tables
+    import application
+    application.store.drop_unshared()
+    # move the loaded objects out of the garbage collector's reach: a collection in a worker would otherwise write to
+    # every object header and copy the shared pages
+    gc.freeze()
+
+
+def post_fork(server, worker):
+    # threads don't survive a fork. Every worker watches the data files itself and swaps in its own new snapshots,
+    # then precomputes the figures of the new snapshots in its own figure cache
+    import application
+    application.store.start_watcher()
+    application.precomputer.start()
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+"""
+HTTP compression and caching of the responses.
+- Responses over a size threshold are compressed with brotli or gzip, whichever the browser accepts (Flask-Compress,
+  which Dash uses for gzip only by default).
+- The callback responses get an ETag made of the request, the data keys of the datasets and the version of the code.
+  A request that sends the ETag back in If-None-Match, while none of them changed, is answered 304 without running the
+  callback. Browsers never revalidate a POST, so assets/callback_cache.js keeps the last responses and sends their
+  ETag itself: switching back to a tab, or dragging the slider over dates already seen, costs a few bytes.
+- The layout, the dependencies and the index page get an ETag of their content and are revalidated.
+- The assets (css, js, images) whose url has the `?m=<modification time>` fingerprint are cached by the browser for a
+  year: a new version of a file has a new url.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import collections
+import hashlib
+import os
+import pathlib
+import threading
+
+import dash
+import flask
+from flask_compress import Compress
+
+import datastore
+
+try:
+    import brotli
+except ImportError:
+    try:
+        import brotlicffi as brotli
+    except ImportError:
+        brotli = None
+
+#--------------------------------------------Settings---------------------------------------------------------------
+
+#compression algorithms, in order of preference: "br,gzip", "gzip" or "off"
+COMPRESS = os.environ.get("CAS_COMPRESS", "br,gzip")
+
+#responses smaller than this (in bytes) are not compressed: it doesn't make them shorter than a network packet
+COMPRESS_MIN_SIZE = int(os.environ.get("CAS_COMPRESS_MIN_SIZE", "1000"))
+
+#"0" turns the ETags of the callback responses off
+CALLBACK_ETAGS = os.environ.get("CAS_CALLBACK_ETAGS", "1") == "1"
+
+#seconds the browser keeps a fingerprinted asset (1 year)
+ASSETS_MAX_AGE = int(os.environ.get("CAS_ASSETS_MAX_AGE", "31536000"))
+
+#settings that change the callback responses. They are part of the ETags, so after a restart with other values the
+#browser doesn't get a 304 for a response rendered with the old ones
+RESPONSE_SETTINGS = ["CAS_CLIENTSIDE_CHARTS", "CAS_GEO_PRECISION", "CAS_CHART_POINTS", "CAS_FAST_JSON"]
+
+#compression levels. Brotli 4 compresses better than gzip 6 at about the same speed
+GZIP_LEVEL = 6
+BROTLI_LEVEL = 4
+
+#--------------------------------------------Compression------------------------------------------------------------
+
+def algorithms(setting=COMPRESS):
+    """
+    :param setting: value of CAS_COMPRESS
+    :return: list of the algorithms to use, without brotli if it is not installed
+    """
+    if setting == "off":
+        return []
+    names = [name.strip() for name in setting.split(",") if name.strip()]
+    if brotli is None and "br" in names:
+        names.remove("br")
+    return names
+
+
+def init_compression(server, setting=COMPRESS, minSize=COMPRESS_MIN_SIZE):
+    """
+    Compress the responses of a Flask server. Create the Dash app with compress=False, so it doesn't set up its own
+    gzip only compression
+    :param server: flask.Flask
+    :param setting: value of CAS_COMPRESS
+    :param minSize: responses smaller than this (in bytes) are sent as is
+    :return: the flask_compress.Compress, or None if the compression is off
+    """
+    names = algorithms(setting)
+    if not names:
+        return None
+    server.config.update(
+        COMPRESS_ALGORITHM=names,
+        COMPRESS_ALGORITHM_STREAMING=names,   # the static files are streamed
+        COMPRESS_MIN_SIZE=minSize,
+        COMPRESS_LEVEL=GZIP_LEVEL,
+        COMPRESS_BR_LEVEL=BROTLI_LEVEL,
+    )
+    return Compress(server)
+
+#--------------------------------------------Caching----------------------------------------------------------------
+
+def code_key():
+    """
+    Key of the code that renders the responses: the modules of the app, the version of Dash and the RESPONSE_SETTINGS.
+    It is the same in every server process, so an ETag from one worker is valid in the others
+    :return: hex string
+    """
+    folder = pathlib.Path(__file__).parent
+    parts = {path.name: datastore.file_signature(path) for path in folder.glob("*.py")}
+    parts["dash"] = dash.__version__
+    parts.update((name, os.environ.get(name)) for name in RESPONSE_SETTINGS)
+    return datastore.signatures_key(parts)
+
+
+def asset_url(app, path):
+    """
+    Url of a file of the assets folder with the `?m=` fingerprint Dash adds to the css and js files, so the browser
+    caches it for ASSETS_MAX_AGE
+    :param app: dash.Dash
+    :param path: path of the file in the assets folder, e.g. "dash-logo-new.png"
+    :return: url
+    """
+    url = app.get_asset_url(path)
+    try:
+        return "%s?m=%s" % (url, os.path.getmtime(os.path.join(app.config.assets_folder, path)))
+    except OSError:
+        return url
+
+
+class HttpCache(object):
+    """
+    ETags and cache policies of the responses of a Dash app
+
+        httpCache = HttpCache(app, store)
+    """
+
+    def __init__(self, app, store, callbackETags=CALLBACK_ETAGS, assetsMaxAge=ASSETS_MAX_AGE):
+        """
+        :param app: dash.Dash
+        :param store: datastore.DataStore the callbacks read from
+        :param callbackETags: give the callback responses an ETag, and answer 304 when it is sent back
+        :param assetsMaxAge: seconds the browser keeps a fingerprinted asset
+        """
+        self.store = store
+        self.callbackETags = callbackETags
+        self.assetsMaxAge = assetsMaxAge
+        self.codeKey = code_key()
+        self.dispatchPath = app.config.routes_pathname_prefix + "_dash-update-component"
+        self.assetsPath = app.config.routes_pathname_prefix + app.config.assets_url_path.lstrip("/") + "/"
+        self.notModified = collections.Counter()   # kind of response ("callback" or "page") -> number of 304s
+        self._lock = threading.Lock()
+        # after Flask-Compress in the list, so these run first and see the uncompressed response
+        app.server.before_request(self.before_request)
+        app.server.after_request(self.after_request)
+
+    def callback_etag(self, body):
+        """
+        :param body: bytes of the callback request
+        :return: weak ETag of the response. Weak, so Flask-Compress leaves it as is for every encoding
+        """
+        status = self.store.status()
+        dataKeys = "|".join("%s=%s" % (name, status[name]["dataKey"]) for name in sorted(status))
+        digest = hashlib.sha1(("%s|%s|" % (self.codeKey, dataKeys)).encode() + body).hexdigest()[:24]
+        return 'W/"%s"' % digest
+
+    def before_request(self):
+        request = flask.request
+        if not self.callbackETags or request.method != "POST" or request.path != self.dispatchPath:
+            return None
+        etag = self.callback_etag(request.get_data())
+        flask.g.callbackETag = etag
+        if etag in [tag.strip() for tag in request.headers.get("If-None-Match", "").split(",")]:
+            self._count("callback")
+            response = flask.Response(status=304)
+            response.headers["ETag"] = etag
+            return response
+        return None
+
+    def after_request(self, response):
+        request = flask.request
+        if request.path.startswith(self.assetsPath):
+            if "m" in request.args and response.status_code in (200, 304):
+                # the url changes with the file, so the browser never needs to ask again
+                response.headers["Cache-Control"] = "public, max-age=%d, immutable" % self.assetsMaxAge
+            return response
+
+        etag = flask.g.pop("callbackETag", None)
+        # the key is taken again after the callback: a dataset loaded (or reloaded) while it ran may be in the response
+        # but not in the key from before, and the response is then sent without an ETag
+        if etag is not None and response.status_code == 200 and etag == self.callback_etag(request.get_data()):
+            response.headers["ETag"] = etag
+            response.headers["Cache-Control"] = "no-cache"
+            return response
+
+        if request.method == "GET" and response.status_code == 200 and not response.direct_passthrough \
+                and response.mimetype in ("application/json", "text/html") and "ETag" not in response.headers:
+            # layout, dependencies, index page and /ready: revalidated with an ETag of their content
+            response.add_etag(weak=True)
+            response.headers["Cache-Control"] = "no-cache"
+            response.make_conditional(request)
+            if response.status_code == 304:
+                self._count("page")
+        return response
+
+    def _count(self, kind):
+        with self._lock:
+            self.notModified[kind] += 1
+
+    def render_metrics(self):
+        """
+        :return: the 304 responses in the Prometheus text format
+        """
+        lines = [
+            "# HELP cas_http_not_modified_total Requests answered 304 Not Modified, by kind of response",
+            "# TYPE cas_http_not_modified_total counter",
+        ]
+        with self._lock:
+            for kind, count in sorted(self.notModified.items()):
+                lines.append('cas_http_not_modified_total{kind="%s"} %d' % (kind, count))
+        return "\n".join(lines) + "\n"
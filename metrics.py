@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+
+"""
+Callback metrics.
+Every server callback of the app is wrapped to record its latency, the size of its json response, the number of
+input values it got, and how the call ended. The metrics (and the hits of the figure cache) are rendered in the
+Prometheus text format. A sample of the calls can also be run under cProfile, to see where the time goes.
+The metrics are per server process.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import bisect
+import collections
+import cProfile
+import functools
+import io
+import os
+import pstats
+import random
+import threading
+import time
+
+from dash.exceptions import PreventUpdate
+
+#--------------------------------------------Settings---------------------------------------------------------------
+
+#"0" turns the callback metrics off
+METRICS = os.environ.get("CAS_METRICS", "1") == "1"
+
+#fraction of the callback calls that are run under the profiler, e.g. "0.05". 0 turns the profiler off
+PROFILE_SAMPLE = float(os.environ.get("CAS_PROFILE_SAMPLE", "0"))
+
+#histogram buckets
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]             # seconds
+SIZE_BUCKETS = [1000, 10000, 100000, 300000, 1000000, 3000000, 10000000]                 # bytes
+CARDINALITY_BUCKETS = [1, 2, 5, 10, 50, 100, 500, 1000]                                   # input values
+
+#--------------------------------------------Metrics----------------------------------------------------------------
+
+class Histogram(object):
+    """
+    Prometheus style histogram: the count of the values below each bucket bound, their sum and their count
+    """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)   # the last one is +Inf
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def lines(self, name, labels):
+        """
+        :param name: metric name
+        :param labels: label string, e.g. 'callback="update_graph"'
+        :return: list of the lines of the Prometheus text format
+        """
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.bounds + ["+Inf"], self.counts):
+            cumulative += count
+            lines.append('%s_bucket{%s,le="%s"} %d' % (name, labels, bound, cumulative))
+        lines.append('%s_sum{%s} %s' % (name, labels, repr(float(self.sum))))
+        lines.append('%s_count{%s} %d' % (name, labels, self.count))
+        return lines
+
+
+def input_cardinality(value):
+    """
+    :param value: a callback argument
+    :return: number of values in it: the length of a list, the number of points of a selection, 1 otherwise
+    """
+    if isinstance(value, (list, tuple)):
+        return len(value)
+    if isinstance(value, dict) and "points" in value:
+        return len(value["points"])
+    return 0 if value is None else 1
+
+
+class CallbackMetrics(object):
+    """
+    Metrics of the server callbacks of a Dash app
+
+        callbackMetrics = CallbackMetrics()
+        callbackMetrics.instrument(app)    # after every callback is registered
+    """
+
+    def __init__(self, figureCache=None, profileSample=PROFILE_SAMPLE):
+        """
+        :param figureCache: figure_cache.FigureCache whose hits and misses are reported, or None
+        :param profileSample: fraction of the calls run under the profiler
+        """
+        self.figureCache = figureCache
+        self.profileSample = profileSample
+        self.latency = collections.defaultdict(lambda: Histogram(LATENCY_BUCKETS))
+        self.size = collections.defaultdict(lambda: Histogram(SIZE_BUCKETS))
+        self.cardinality = collections.defaultdict(lambda: Histogram(CARDINALITY_BUCKETS))
+        self.calls = collections.Counter()   # (callback name, status) -> number of calls
+        self.profile = None                  # pstats.Stats of the profiled calls
+        self.profiledCalls = 0
+        self._lock = threading.Lock()
+
+    def instrument(self, app):
+        """
+        Wrap every server callback registered on the app so far. Clientside callbacks run in the browser and are skipped
+        :param app: dash.Dash
+        """
+        for entry in app.callback_map.values():
+            if "callback" in entry and not getattr(entry["callback"], "instrumented", False):
+                entry["callback"] = self.wrap(entry["callback"])
+
+    def wrap(self, callback):
+        """
+        :param callback: the function Dash calls for a callback. It returns the json response
+        :return: the same function, recording its metrics
+        """
+        name = callback.__name__
+
+        @functools.wraps(callback)
+        def instrumented(*args, **kwargs):
+            profiler = cProfile.Profile() if self.profileSample and random.random() < self.profileSample else None
+            status = "error"
+            response = None
+            start = time.perf_counter()
+            try:
+                if profiler is not None:
+                    response = profiler.runcall(callback, *args, **kwargs)
+                else:
+                    response = callback(*args, **kwargs)
+                status = "ok"
+                return response
+            except PreventUpdate:
+                status = "no_update"
+                raise
+            finally:
+                self.record(name, status, time.perf_counter() - start, response, args, profiler)
+        instrumented.instrumented = True
+        return instrumented
+
+    def record(self, name, status, seconds, response, args, profiler=None):
+        """
+        Record a call of a callback
+        """
+        with self._lock:
+            self.calls[(name, status)] += 1
+            self.latency[name].observe(seconds)
+            self.cardinality[name].observe(sum(input_cardinality(arg) for arg in args))
+            if response is not None:
+                self.size[name].observe(len(response))
+            if profiler is not None:
+                if self.profile is None:
+                    self.profile = pstats.Stats(profiler)
+                else:
+                    self.profile.add(profiler)
+                self.profiledCalls += 1
+
+    def render(self):
+        """
+        :return: the metrics in the Prometheus text format
+        """
+        lines = []
+        with self._lock:
+            lines.append("# HELP cas_callback_calls_total Callback calls, by how they ended (ok, no_update or error)")
+            lines.append("# TYPE cas_callback_calls_total counter")
+            for (name, status), count in sorted(self.calls.items()):
+                lines.append('cas_callback_calls_total{callback="%s",status="%s"} %d' % (name, status, count))
+
+            for metric, histograms, description in [
+                ("cas_callback_duration_seconds", self.latency, "Callback latency in seconds"),
+                ("cas_callback_response_bytes", self.size, "Size of the json response of a callback in bytes"),
+                ("cas_callback_input_cardinality", self.cardinality, "Number of input values of a callback call"),
+            ]:
+                lines.append("# HELP %s %s" % (metric, description))
+                lines.append("# TYPE %s histogram" % metric)
+                for name in sorted(histograms):
+                    lines.extend(histograms[name].lines(metric, 'callback="%s"' % name))
+
+        if self.figureCache is not None:
+            for metric, counter, description in [
+                ("cas_figure_cache_hits_total", self.figureCache.hits, "Figures served from the figure cache"),
+                ("cas_figure_cache_misses_total", self.figureCache.misses, "Figures computed and added to the figure cache"),
+            ]:
+                lines.append("# HELP %s %s" % (metric, description))
+                lines.append("# TYPE %s counter" % metric)
+                for name, count in sorted(counter.items()):
+                    lines.append('%s{callback="%s"} %d' % (metric, name, count))
+        return "\n".join(lines) + "\n"
+
+    def render_profile(self, limit=40):
+        """
+        :param limit: number of functions to list
+        :return: text report of the profiled calls, slowest cumulative time first
+        """
+        with self._lock:
+            if self.profile is None:
+                return "No profiled calls. Set CAS_PROFILE_SAMPLE to a fraction of the calls, e.g. 0.05\n"
+            out = io.StringIO()
+            out.write("%d profiled calls (CAS_PROFILE_SAMPLE=%s)\n" % (self.profiledCalls, self.profileSample))
+            self.profile.stream = out
+            self.profile.sort_stats("cumulative").print_stats(limit)
+            return out.getvalue()
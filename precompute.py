@@ -0,0 +1,195 @@
+# -*- coding: utf-8 -*-
+
+"""
+Precomputed figures.
+The inputs of the charts are few and known: the article types, the stats of the dropdowns, the granularities and the
+default date ranges. After every load (or reload) of a dataset, the figures of its common views are computed in the
+background and stored in the figure cache, so the first viewer after a deploy or a data refresh gets them from the
+cache. The default views of the page come first. The background thread uses at most a share of one CPU
+(CAS_PRECOMPUTE_BUDGET), sleeping between two figures, so it doesn't slow down the requests much.
+
+    precomputer = Precomputer(store, figureCache)
+
+    @precomputer.views("email")
+    def email_views(email):
+        return [(0, update_graph, ("newsletter", "unique_opens", "Percent")), ...]
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import collections
+import heapq
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+
+import plotly
+
+logger = logging.getLogger(__name__)
+
+#--------------------------------------------Settings---------------------------------------------------------------
+
+#"0" turns the precomputed figures off
+PRECOMPUTE = os.environ.get("CAS_PRECOMPUTE", "1") == "1"
+
+#share of one CPU the background thread may use, e.g. "0.5". 1 computes the figures back to back
+PRECOMPUTE_BUDGET = float(os.environ.get("CAS_PRECOMPUTE_BUDGET", "0.5"))
+
+#priorities of the views. Lower first
+DEFAULT_VIEW = 0   # what the page shows when a tab is opened
+NEAR_VIEW = 1      # one click away: another granularity or mode of the default stats
+OTHER_VIEW = 2     # other stats
+
+#--------------------------------------------Helpers----------------------------------------------------------------
+
+def as_sent(value):
+    """
+    :param value: value of a component property in the layout, e.g. the datetime `start_date` of a date picker
+    :return: the value the browser sends back to the callbacks: its json form, e.g. "2020-05-15T00:00:00"
+    """
+    return json.loads(json.dumps(value, cls=plotly.utils.PlotlyJSONEncoder))
+
+
+def stat_lists(default, options):
+    """
+    Common values of a multi-select stats dropdown
+    :param default: the default value, e.g. ["pageviews_all", "unique_visitors"]
+    :param options: all the stats
+    :return: list of (priority, stats): the default, then every stat alone and the default plus one stat
+    """
+    lists = [(DEFAULT_VIEW, list(default))]
+    lists.extend((OTHER_VIEW, [stat]) for stat in options)
+    lists.extend((OTHER_VIEW, list(default) + [stat]) for stat in options if stat not in default)
+    return lists
+
+
+def memoized(function):
+    """
+    :param function: function decorated with FigureCache.memoize(), maybe wrapped again by @app.callback
+    :return: the memoized function
+    """
+    while not hasattr(function, "uncached"):
+        function = function.__wrapped__
+    return function
+
+#--------------------------------------------Precomputer------------------------------------------------------------
+
+class Precomputer(object):
+    """
+    Queue of the figures to precompute, by priority, filled every time a dataset is published
+    """
+
+    def __init__(self, store, figureCache, budget=PRECOMPUTE_BUDGET, enabled=PRECOMPUTE):
+        """
+        :param store: datastore.DataStore
+        :param figureCache: figure_cache.FigureCache the figures are stored in
+        :param budget: share of one CPU the background thread may use
+        :param enabled: False never queues anything
+        """
+        self.store = store
+        self.figureCache = figureCache
+        self.budget = budget
+        self.enabled = enabled and figureCache.backend is not None
+        self.computed = collections.Counter()   # callback name -> number of precomputed figures
+        self._views = collections.defaultdict(list)   # dataset name -> functions of a snapshot that list its views
+        self._queue = []                              # heap of (priority, order, dataset name, data key, function, args)
+        self._order = itertools.count()
+        self._condition = threading.Condition()
+        self._thread = None
+        store.subscribe(self._on_publish)
+
+    def views(self, datasetName):
+        """
+        Decorator that registers the views of a dataset: a function of its snapshot that returns a list of
+        (priority, memoized callback, args)
+        :param datasetName: e.g. "web"
+        """
+        def register(function):
+            self._views[datasetName].append(function)
+            return function
+        return register
+
+    def _on_publish(self, snapshot):
+        if not self.enabled or snapshot.name not in self._views:
+            return
+        tasks = []
+        for listViews in self._views[snapshot.name]:
+            try:
+                tasks.extend(listViews(snapshot))
+            except Exception:
+                logger.exception("listing the views of %s failed", snapshot.name)
+        with self._condition:
+            # the views of an older snapshot of the dataset are out of date
+            self._queue = [task for task in self._queue if task[2] != snapshot.name]
+            heapq.heapify(self._queue)
+            for priority, function, args in tasks:
+                heapq.heappush(self._queue, (priority, next(self._order), snapshot.name, snapshot.dataKey,
+                                             memoized(function), tuple(args)))
+            self._condition.notify()
+
+    def render_metrics(self):
+        """
+        :return: the number of precomputed figures in the Prometheus text format
+        """
+        lines = [
+            "# HELP cas_figure_cache_precomputed_total Figures computed in the background and added to the figure cache",
+            "# TYPE cas_figure_cache_precomputed_total counter",
+        ]
+        for name, count in sorted(self.computed.items()):
+            lines.append('cas_figure_cache_precomputed_total{callback="%s"} %d' % (name, count))
+        return "\n".join(lines) + "\n"
+
+    def __len__(self):
+        return len(self._queue)
+
+    def _next(self, wait):
+        with self._condition:
+            while not self._queue:
+                if not wait:
+                    return None
+                self._condition.wait()
+            return heapq.heappop(self._queue)
+
+    def _run(self, task):
+        """
+        :return: CPU seconds spent
+        """
+        priority, order, datasetName, dataKey, function, args = task
+        if self.store.get(datasetName).dataKey != dataKey:
+            return 0   # the dataset was reloaded just now. Its new views are in the queue
+        start = time.thread_time()
+        try:
+            if self.figureCache.warm(function, args):
+                self.computed[function.cacheName] += 1
+        except Exception:
+            logger.exception("precomputing %s%r failed", function.cacheName, args)
+        return time.thread_time() - start
+
+    def run_pending(self):
+        """
+        Compute every queued figure now, in this thread and without the CPU budget, e.g. before the server starts
+        """
+        while True:
+            task = self._next(wait=False)
+            if task is None:
+                return
+            self._run(task)
+
+    def start(self):
+        """
+        Start the background thread that computes the queued figures. Call it again in every process after a fork
+        """
+        if not self.enabled or (self._thread is not None and self._thread.is_alive()):
+            return
+        self._thread = threading.Thread(target=self._work, name="cas-precompute", daemon=True)
+        self._thread.start()
+
+    def _work(self):
+        while True:
+            seconds = self._run(self._next(wait=True))
+            if 0 < self.budget < 1:
+                # idle long enough that the figure took `budget` of the CPU time of this thread
+                time.sleep(seconds * (1 - self.budget) / self.budget)
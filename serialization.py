@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+"""
+Fast json encoding of the responses.
+Dash and the figure cache encode with plotly.utils.PlotlyJSONEncoder, which copies every figure (to_dict() is a deep
+copy, about 0.3 s for the figure with the world geo json), converts numpy arrays to python lists and their dates one
+by one, and encodes twice when it finds "NaN" in the text. FastJSONEncoder is a drop-in subclass that
+- reads the figures without copying them,
+- encodes with orjson when it is installed: compact separators, utf-8 instead of \\u escapes,
+- writes day dates as "YYYY-MM-DD" in one numpy call. The charts send the date labels of their TimeSeries instead,
+  which are made once per snapshot (see timeseries.py).
+The output is the same json (NaN and infinity become null), only shorter. Numeric arrays stay json lists: the
+plotly.js of dash-core-components (2.2) can't read base64 typed arrays.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import os
+
+import numpy as np
+import plotly
+from plotly.basedatatypes import BaseFigure
+
+import timeseries
+
+try:
+    import orjson
+except ImportError:  # optional, the standard json module is used instead
+    orjson = None
+
+#--------------------------------------------Settings---------------------------------------------------------------
+
+#"0" keeps the plotly encoder
+FAST_JSON = os.environ.get("CAS_FAST_JSON", "1") == "1"
+
+#the plotly encoder, before install() replaces it
+PLOTLY_ENCODER = plotly.utils.PlotlyJSONEncoder
+
+#--------------------------------------------Encoder----------------------------------------------------------------
+
+def figure_dict(figure):
+    """
+    :param figure: plotly figure
+    :return: the dict of figure.to_dict(), without copying the data and the layout. Don't change it
+    """
+    try:
+        data, layout, frameObjs = figure._data, figure._layout, figure._frame_objs
+    except AttributeError:
+        # these are private attributes of plotly 4 and 5. Another version gets the public, copied dict
+        return figure.to_plotly_json()
+    result = {"data": data, "layout": layout}
+    frames = [frame._props for frame in frameObjs]
+    if frames:
+        result["frames"] = frames
+    return result
+
+
+class FastJSONEncoder(PLOTLY_ENCODER):
+    """
+    plotly.utils.PlotlyJSONEncoder, faster. Pass it as `cls` to json.dumps(), or install() it for Dash
+    """
+
+    def encode(self, o):
+        if orjson is None or self.indent is not None or self.sort_keys:
+            return super(FastJSONEncoder, self).encode(o)
+        # no OPT_SERIALIZE_NUMPY: orjson would write datetime64 days as "2020-09-21T00:00:00"
+        return orjson.dumps(o, default=self.default, option=orjson.OPT_NON_STR_KEYS).decode("utf-8")
+
+    def default(self, obj):
+        if isinstance(obj, BaseFigure):
+            return figure_dict(obj)
+        if isinstance(obj, np.ndarray):
+            if obj.dtype.kind == "U":   # e.g. the date labels of a TimeSeries
+                return obj.tolist()
+            if obj.dtype == "datetime64[D]":
+                return timeseries.date_labels(obj).tolist()
+            if obj.dtype.kind in "biuf":
+                return obj.tolist()   # NaN stays a float, written as null
+        if isinstance(obj, np.generic) and obj.dtype.kind in "biuf":
+            return obj.item()
+        return super(FastJSONEncoder, self).default(obj)
+
+
+def install(enabled=FAST_JSON):
+    """
+    Make FastJSONEncoder the plotly.utils.PlotlyJSONEncoder, which Dash looks up on every response
+    :param enabled: False keeps the plotly encoder
+    """
+    plotly.utils.PlotlyJSONEncoder = FastJSONEncoder if enabled else PLOTLY_ENCODER
@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+
+"""
+Startup timing report.
+The costly steps of a cold start (imports, csv reads, geo json, requests_country parsing...) are wrapped in phases
+that record their wall time and the memory of the process. The report is written as json when the app has started,
+and the start can be made to fail when a phase takes longer than its budget.
+Phases can run at the same time in several threads (the data files are read in parallel, see datastore.py): each
+phase has its start time, and the memory growth of phases that overlap is shared between them.
+
+Run `python -m startup_profile` to load the app with every dataset and print the report.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import contextlib
+import importlib
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+#--------------------------------------------Settings---------------------------------------------------------------
+
+#where the report is written when the app has started: "-" for stderr, or a file path. Empty: no report
+STARTUP_REPORT = os.environ.get("CAS_STARTUP_REPORT", "")
+
+#max seconds of the startup, e.g. "8" for the total, or "total=8,web.countryRequests=1.5" for phases too. Empty: no budget
+STARTUP_BUDGET = os.environ.get("CAS_STARTUP_BUDGET", "")
+
+#--------------------------------------------Memory-----------------------------------------------------------------
+
+def rss_bytes():
+    """
+    :return: resident memory of this process in bytes. The peak resident memory where /proc is not available
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, KB on linux
+
+#--------------------------------------------Startup profile--------------------------------------------------------
+
+class StartupBudgetExceeded(RuntimeError):
+    """
+    A startup phase took longer than its budget
+    """
+
+
+def parse_budget(budget):
+    """
+    :param budget: "8" or "total=8,web.countryRequests=1.5"
+    :return: dict of phase name ("total" for the whole startup) -> max seconds
+    """
+    limits = {}
+    for part in filter(None, (part.strip() for part in budget.split(","))):
+        name, _, seconds = part.rpartition("=")
+        limits[name.strip() or "total"] = float(seconds)
+    return limits
+
+
+class StartupProfile(object):
+    """
+    Records the phases of the startup, until finish() is called. Phases can be nested; a phase started after finish()
+    (e.g. a data reload) is not recorded. Phases of other threads are nested in the phase that started the thread's
+    work if it is wrapped with nested()
+
+        with profile.phase("web.df2"):
+            ...
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.startRss = rss_bytes()
+        self.phases = []       # finished phases, in the order they ended
+        self.recording = True
+        self.total = None
+        self._local = threading.local()   # depth of the current phase of each thread
+        self._lock = threading.Lock()
+
+    @property
+    def depth(self):
+        return getattr(self._local, "depth", 0)
+
+    @depth.setter
+    def depth(self, depth):
+        self._local.depth = depth
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        """
+        :param name: phase name, e.g. "import plotly" or "web.countryRequests"
+        """
+        if not self.recording:
+            yield
+            return
+        depth = self.depth
+        self.depth += 1
+        start, startRss = time.perf_counter(), rss_bytes()
+        try:
+            yield
+        finally:
+            self.depth = depth
+            rss = rss_bytes()
+            with self._lock:
+                self.phases.append({
+                    "name": name,
+                    "depth": depth,
+                    "start": round(start - self.started, 4),   # seconds since the profile started
+                    "seconds": round(time.perf_counter() - start, 4),
+                    "rss_mb": round(rss / 2 ** 20, 1),
+                    "rss_delta_mb": round((rss - startRss) / 2 ** 20, 1),
+                })
+
+    def nested(self, function):
+        """
+        Wrap a function that runs in another thread (e.g. in a thread pool), so its phases are nested in the current
+        phase of this thread
+        :param function: function
+        :return: wrapped function
+        """
+        depth = self.depth
+        def run(*args, **kwargs):
+            outer = self.depth
+            self.depth = depth
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.depth = outer
+        return run
+
+    def report(self):
+        """
+        :return: dict with the total seconds, the memory, and the phases
+        """
+        total = self.total if self.total is not None else time.perf_counter() - self.started
+        rss = rss_bytes()
+        return {
+            "total_seconds": round(total, 4),
+            "rss_mb": round(rss / 2 ** 20, 1),
+            "rss_delta_mb": round((rss - self.startRss) / 2 ** 20, 1),
+            "pid": os.getpid(),
+            "phases": list(self.phases),
+        }
+
+    def over_budget(self, limits):
+        """
+        :param limits: dict of phase name -> max seconds, see parse_budget()
+        :return: list of (phase name, seconds, max seconds) of the phases over their budget
+        """
+        seconds = {"total": self.report()["total_seconds"]}
+        for phase in self.phases:
+            seconds[phase["name"]] = seconds.get(phase["name"], 0) + phase["seconds"]
+        return [(name, seconds[name], limit) for name, limit in limits.items() if seconds.get(name, 0) > limit]
+
+    def finish(self, reportTo=None, budget=None):
+        """
+        Stop recording, write the report and check the budget
+        :param reportTo: "-" for stderr, a file path, or "" for no report. Default: CAS_STARTUP_REPORT
+        :param budget: budget string, see parse_budget(). Default: CAS_STARTUP_BUDGET
+        :return: the report dict
+        :raise StartupBudgetExceeded: if a phase (or the total) took longer than its budget
+        """
+        reportTo = STARTUP_REPORT if reportTo is None else reportTo
+        budget = STARTUP_BUDGET if budget is None else budget
+        if self.recording:
+            self.recording = False
+            self.total = time.perf_counter() - self.started
+        report = self.report()
+        if reportTo == "-":
+            sys.stderr.write(json.dumps(report, indent=2) + "\n")
+        elif reportTo:
+            with open(reportTo, "w") as f:
+                json.dump(report, f, indent=2)
+
+        overBudget = self.over_budget(parse_budget(budget))
+        if overBudget:
+            message = ", ".join("%s took %.2fs (budget %.2fs)" % item for item in overBudget)
+            logger.error("startup over budget: %s", message)
+            raise StartupBudgetExceeded(message)
+        return report
+
+
+#the profile of this process. It starts when this module is imported, so import it first
+PROFILE = StartupProfile()
+
+def phase(name):
+    """
+    Record a startup phase of this process, see StartupProfile.phase()
+    """
+    return PROFILE.phase(name)
+
+
+def nested(function):
+    """
+    Nest the phases of a function run in another thread in the current phase, see StartupProfile.nested()
+    """
+    return PROFILE.nested(function)
+
+
+if __name__ == "__main__":
+    os.environ["CAS_PRELOAD_DATA"] = "1"        # load every dataset, like the production server
+    os.environ["CAS_RELOAD_INTERVAL"] = "0"     # no watcher thread
+    STARTUP_REPORT = STARTUP_REPORT or "-"
+    sys.modules["startup_profile"] = sys.modules["__main__"]   # application.py must record into this profile
+    importlib.import_module("application")      # finishes the profile and writes the report
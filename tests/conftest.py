@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+
+"""
+Shared setup of the tests: the modules of the app and of the benchmarks are imported from the repository, and the
+data files are synthetic (see benchmarks/synthetic.py).
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import pathlib
+import sys
+
+import pytest
+
+ROOT = pathlib.Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(ROOT.joinpath("benchmarks")))
+
+import synthetic
+
+#--------------------------------------------Fixtures---------------------------------------------------------------
+
+@pytest.fixture(scope="session")
+def source(tmp_path_factory):
+    """
+    A synthetic data folder. Copy it before loading it: the app writes its caches beside the files
+    """
+    # 2 years, so the rollups have complete and incomplete weeks and months on both sides of a cut
+    return synthetic.generate(tmp_path_factory.mktemp("synthetic"), years=2, countries=30, vertices=20)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+
+"""
+Assertions shared by the tests.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import numpy as np
+import pandas as pd
+
+import datastore
+from timeseries import TimeSeries, Rollups
+
+#--------------------------------------------Assertions-------------------------------------------------------------
+
+def assert_same(actual, expected, path="value"):
+    """
+    Assert that 2 field values are equal: DataFrames, numpy arrays, TimeSeries, Rollups, GeoFrames, GeoShapes, and
+    dicts, lists and sets of them
+    :param path: name of the value in the assertion messages
+    """
+    if isinstance(expected, pd.DataFrame):
+        pd.testing.assert_frame_equal(actual.reset_index(drop=True), expected.reset_index(drop=True), obj=path)
+    elif isinstance(expected, np.ndarray):
+        actual = np.asarray(actual)
+        assert actual.shape == expected.shape, path
+        if expected.dtype.kind == "f":
+            # sums of the appended rows may be added in another order
+            np.testing.assert_allclose(actual, expected, rtol=1e-12, err_msg=path)
+        else:
+            np.testing.assert_array_equal(actual, expected, err_msg=path)
+    elif isinstance(expected, TimeSeries):
+        assert_same(actual.dates, expected.dates, path + ".dates")
+        assert_same(actual.labels, expected.labels, path + ".labels")
+        assert_same(actual.columns, expected.columns, path + ".columns")
+    elif isinstance(expected, Rollups):
+        assert actual.rules == expected.rules, path
+        assert_same(actual.levels, expected.levels, path + ".levels")
+    elif isinstance(expected, datastore.GeoFrames):
+        assert len(actual) == len(expected), path
+        for position in range(len(expected)):
+            assert_same(actual[position], expected[position], "%s[%d]" % (path, position))
+    elif isinstance(expected, datastore.GeoShapes):
+        assert_same(vars(actual), vars(expected), path)
+    elif isinstance(expected, dict):
+        assert sorted(actual, key=str) == sorted(expected, key=str), path
+        for key in expected:
+            assert_same(actual[key], expected[key], "%s[%r]" % (path, key))
+    elif isinstance(expected, (list, tuple)):
+        assert len(actual) == len(expected), path
+        for i, (actualItem, expectedItem) in enumerate(zip(actual, expected)):
+            assert_same(actualItem, expectedItem, "%s[%d]" % (path, i))
+    else:
+        assert actual == expected, path
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the article source channels of the WeChat tab: the per-date matrix and the share of each channel in a
+selection of dates.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import numpy as np
+import pandas as pd
+
+import datastore
+from helpers import assert_same
+
+#--------------------------------------------Helpers----------------------------------------------------------------
+
+def article_frame(rows):
+    """
+    :param rows: list of (date string, {channel position: reads}), one per article
+    :return: DataFrame like df5, whose total is the sum of the channels
+    """
+    channels = datastore.wechatSourceChannelsList
+    matrix = np.zeros((len(rows), len(channels)), dtype="int64")
+    for row, (_, reads) in enumerate(rows):
+        for position, value in reads.items():
+            matrix[row, position] = value
+    frame = pd.DataFrame(matrix, columns=channels)
+    frame.insert(0, datastore.wechatSourceTotal, matrix.sum(axis=1))
+    frame.insert(0, "date", [date for date, _ in rows])
+    return frame
+
+
+ARTICLES = [
+    ("2020-01-06", {0: 1}), ("2020-01-06", {1: 3}),   # a Monday, 2 articles
+    ("2020-01-07", {2: 4}),
+    ("2020-02-03", {7: 8}),
+]
+
+def shares(**channelShares):
+    """
+    :param channelShares: share of the channel at each position, e.g. c2=0.5
+    :return: numpy array of the share of each channel of wechatSourceChannelsList
+    """
+    expected = np.zeros(len(datastore.wechatSourceChannelsList))
+    for name, share in channelShares.items():
+        expected[int(name[1:])] = share
+    return expected
+
+#--------------------------------------------Channels---------------------------------------------------------------
+
+def test_articles_are_summed_per_date():
+    channels = datastore.aggregate_channels(article_frame(ARTICLES))
+    assert channels["dates"].astype(str).tolist() == ["2020-01-06", "2020-01-07", "2020-02-03"]
+    assert channels["matrix"][:, 0].tolist() == [4, 4, 8]   # the total
+    assert channels["matrix"][0, 1:3].tolist() == [1, 3]
+
+
+def test_shares_of_all_the_dates():
+    channels = datastore.aggregate_channels(article_frame(ARTICLES))
+    assert_same(datastore.channel_shares(channels), shares(c0=0.0625, c1=0.1875, c2=0.25, c7=0.5), "shares")
+
+
+def test_shares_of_selected_days():
+    channels = datastore.aggregate_channels(article_frame(ARTICLES))
+    # duplicates and dates without articles are ignored, and the lasso may send dates with a time
+    selected = ["2020-01-07", "2020-01-07T00:00:00", "2020-01-08", "2019-12-31", "2021-01-01"]
+    assert_same(datastore.channel_shares(channels, selected), shares(c2=1.0), "shares")
+    expected = shares(c0=1 / 12, c1=0.25, c7=2 / 3).round(4)
+    assert_same(datastore.channel_shares(channels, ["2020-01-06", "2020-02-03"]), expected, "shares")
+
+
+def test_shares_of_selected_weeks_and_months():
+    channels = datastore.aggregate_channels(article_frame(ARTICLES))
+    january = shares(c0=0.125, c1=0.375, c2=0.5)   # the first week and the first month hold the same articles
+    assert_same(datastore.channel_shares(channels, ["2020-01-06"], "week"), january, "week")
+    assert_same(datastore.channel_shares(channels, ["2020-01-01"], "month"), january, "month")
+    assert_same(datastore.channel_shares(channels, ["2020-02-01"], "month"), shares(c7=1.0), "month")
+
+
+def test_no_reads_is_nan():
+    channels = datastore.aggregate_channels(article_frame(ARTICLES))
+    assert np.isnan(datastore.channel_shares(channels, ["2020-03-02"])).all()
+    assert np.isnan(datastore.channel_shares(channels, [])).all()
+
+
+def test_extended_channels_match_a_fresh_aggregation():
+    frame = article_frame(ARTICLES)
+    for cut in range(len(ARTICLES) + 1):   # including a cut between 2 articles of the same date
+        extended = datastore.extend_channels(datastore.aggregate_channels(frame.iloc[:cut]), frame.iloc[cut:])
+        assert_same(extended, datastore.aggregate_channels(frame), "cut %d" % cut)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the data store: a snapshot extended with the rows appended to its csv files must equal a fresh load of the
+same files.
+
+    python -m pytest tests
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import shutil
+
+import datastore
+from helpers import assert_same
+
+#--------------------------------------------Settings---------------------------------------------------------------
+
+#the daily csv files, whose last rows are appended after the first load
+DAILY_FILES = ["emailStat.csv", "webStat.csv", "wechatFollower.csv", "wechatTotalReads.csv", "wechatArticleSource.csv"]
+
+#share of the rows of each daily file in the first load
+FIRST_SHARE = 0.8
+
+#--------------------------------------------Helpers----------------------------------------------------------------
+
+def split_daily_files(source, folder):
+    """
+    Copy a data folder, keeping only the first rows of the daily csv files
+    :param source: pathlib path of the full data folder
+    :param folder: pathlib path of the copy
+    :return: dict of file name -> bytes of the rows left out, to append later
+    """
+    shutil.copytree(str(source), str(folder))
+    rest = {}
+    for fileName in DAILY_FILES:
+        lines = source.joinpath(fileName).read_bytes().splitlines(keepends=True)
+        cut = 1 + int((len(lines) - 1) * FIRST_SHARE)
+        folder.joinpath(fileName).write_bytes(b"".join(lines[:cut]))
+        rest[fileName] = b"".join(lines[cut:])
+    return rest
+
+#--------------------------------------------Appended rows----------------------------------------------------------
+
+def test_appended_rows_match_a_fresh_load(source, tmp_path, monkeypatch):
+    folder = tmp_path.joinpath("data")
+    rest = split_daily_files(source, folder)
+    store = datastore.DataStore(datastore.DATASETS, folder)
+    store.load_all()
+    before = {name: store.get(name) for name in store.datasets}
+
+    for fileName, rows in rest.items():
+        with open(folder.joinpath(fileName), "ab") as f:
+            f.write(rows)
+
+    # the reload must only read the appended rows
+    def read_table(*args, **kwargs):
+        raise AssertionError("the appended files were read again as a whole")
+    with monkeypatch.context() as patch:
+        patch.setattr(datastore, "read_table", read_table)
+        assert sorted(store.refresh()) == sorted(store.datasets)
+
+    fresh = datastore.DataStore(datastore.DATASETS, folder, ingestWorkers=1)
+    for name in store.datasets:
+        extended, loaded = store.get(name), fresh.get(name)
+        assert extended is not before[name]
+        assert extended.signatures == loaded.signatures
+        assert_same(extended.values, loaded.values, name)
+
+
+def test_partial_last_line_is_read_when_complete(source, tmp_path):
+    folder = tmp_path.joinpath("data")
+    rest = split_daily_files(source, folder)
+    store = datastore.DataStore(datastore.DATASETS, folder)
+    rows = rest["webStat.csv"]
+    half = len(rows) // 2
+    webPath = folder.joinpath("webStat.csv")
+    store.get("web")
+
+    with open(webPath, "ab") as f:
+        f.write(rows[:half])   # ends in the middle of a line, like a file still being written
+    store.refresh()
+    with open(webPath, "ab") as f:
+        f.write(rows[half:])
+    store.refresh()
+
+    fresh = datastore.DataStore(datastore.DATASETS, folder).get("web")
+    assert_same(store.get("web").values, fresh.values, "web")
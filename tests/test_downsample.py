@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the downsampling of the daily charts: the points of the visible x range, at most CHART_POINTS of them,
+picked so the shape of the line is kept.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import numpy as np
+import pytest
+
+import downsample
+
+#--------------------------------------------Visible range----------------------------------------------------------
+
+@pytest.mark.parametrize("relayoutData", [
+    None,
+    {},
+    {"xaxis.autorange": True},
+    {"autosize": True},
+    {"yaxis.range[0]": 0, "yaxis.range[1]": 10},   # a zoom of the y axis only
+    {"xaxis.range[0]": "2020-03-04"},
+    {"xaxis.range[0]": "not a date", "xaxis.range[1]": "2020-03-10"},
+])
+def test_whole_series_is_visible(relayoutData):
+    assert downsample.visible_range(relayoutData) is None
+
+
+def test_visible_range_holds_the_days_fully_inside():
+    zoom = {"xaxis.range[0]": "2020-03-04 12:33:20.1234", "xaxis.range[1]": "2020-03-10 06:00"}
+    assert downsample.visible_range(zoom) == ("2020-03-05", "2020-03-10")
+    zoom = {"xaxis.range": ["2020-03-04", "2020-03-10 23:59:59"]}
+    assert downsample.visible_range(zoom) == ("2020-03-04", "2020-03-10")
+    # a reversed axis
+    assert downsample.visible_range({"xaxis.range": ["2020-03-10", "2020-03-04"]}) == ("2020-03-04", "2020-03-10")
+
+#--------------------------------------------Downsampling-----------------------------------------------------------
+
+@pytest.mark.parametrize("threshold", [3, 10, 99, 500])
+def test_lttb_keeps_threshold_sorted_points(threshold):
+    rng = np.random.default_rng(threshold)
+    x = np.datetime64("2015-01-01") + np.arange(1000)
+    kept = downsample.lttb(x, rng.normal(size=1000).cumsum(), threshold)
+    assert len(kept) == threshold
+    assert kept[0] == 0 and kept[-1] == 999
+    assert (np.diff(kept) > 0).all()   # sorted positions of distinct points of the series
+
+
+def test_lttb_keeps_the_peaks():
+    y = np.zeros(1000)
+    y[[137, 642]] = [50, -80]
+    kept = downsample.lttb(np.arange(1000), y, 20)
+    assert 137 in kept and 642 in kept
+
+
+def test_lttb_with_nan_values():
+    y = np.arange(100, dtype="float64")
+    y[10:40] = np.nan   # days without data
+    kept = downsample.lttb(np.arange(100), y, 10)
+    assert len(kept) == 10 and (np.diff(kept) > 0).all()
+
+
+@pytest.mark.parametrize("points, threshold", [(50, 50), (50, 100), (50, 0), (50, 2)])
+def test_lttb_keeps_every_point(points, threshold):
+    assert downsample.lttb(np.arange(points), np.arange(points), threshold).tolist() == list(range(points))
+
+
+def test_downsample_returns_the_labels_of_the_kept_points():
+    x = np.datetime64("2015-01-01") + np.arange(1000)
+    y = np.sin(np.arange(1000) / 30)
+    labels = x.astype(str)
+    sampledX, sampledY = downsample.downsample(x, y, 100, labels=labels)
+    kept = downsample.lttb(x, y, 100)
+    assert sampledX.tolist() == labels[kept].tolist() and sampledY.tolist() == y[kept].tolist()
+    sampledX, sampledY = downsample.downsample(x[:10], y[:10], 100, labels=labels[:10])   # short enough: all of it
+    assert sampledX.tolist() == labels[:10].tolist() and sampledY.tolist() == y[:10].tolist()
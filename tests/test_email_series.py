@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the email campaigns grouped by article type, which the email chart reads instead of filtering emailStat.csv
+on every call.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import json
+
+import numpy as np
+import pandas as pd
+import plotly
+
+import datastore
+from helpers import assert_same
+
+#--------------------------------------------Helpers----------------------------------------------------------------
+
+def campaign_frame():
+    """
+    :return: DataFrame like emailStat.csv: 5 campaigns of 2 article types, 2 of them on the same day
+    """
+    return pd.DataFrame({
+        "article_type": ["newsletter", "event", "newsletter", "newsletter", "event"],
+        "send_time_date": ["2020-01-02", "2020-01-02", "2020-01-09", "2020-01-09", "2020-02-01"],
+        "delivered": [100, 50, 200, 400, 10],
+        "unique_opens": [25, 10, 50, 100, 0],
+        "unique_clicks": [5, 1, 20, 10, 0],
+        "ind_open_rate": [0.2, 0.21, 0.22, 0.23, 0.24],
+        "ind_click_rate": [0.02, 0.03, 0.04, 0.05, 0.06],
+    })
+
+#--------------------------------------------Email series-----------------------------------------------------------
+
+def test_campaigns_are_grouped_by_article_type():
+    emailSeries = datastore.group_email_series(campaign_frame())
+    assert list(emailSeries) == ["newsletter", "event"]   # in order of first appearance, like the dropdown
+
+    newsletter = emailSeries["newsletter"]
+    assert sorted(newsletter.columns) == sorted(datastore.emailSeriesList)
+    assert newsletter.labels.tolist() == ["2020-01-02", "2020-01-09", "2020-01-09"]   # one point per campaign
+    assert newsletter["delivered"].tolist() == [100, 200, 400]
+    assert_same(newsletter["unique_opens_rate"], np.array([0.25, 0.25, 0.25]), "unique_opens_rate")
+    assert_same(newsletter["unique_clicks_rate"], np.array([0.05, 0.1, 0.025]), "unique_clicks_rate")
+    assert_same(newsletter["ind_open_rate"], np.array([0.2, 0.22, 0.23]), "ind_open_rate")
+    assert newsletter["delivered"].dtype.itemsize < 8   # the counts are downcast
+
+    event = emailSeries["event"]
+    assert event.labels.tolist() == ["2020-01-02", "2020-02-01"]
+    assert event["unique_opens"].tolist() == [10, 0]
+
+
+def test_grouped_series_match_the_filtered_frame(source):
+    frame = pd.read_csv(source.joinpath("emailStat.csv")).sort_values("send_time_date", kind="stable")
+    emailSeries = datastore.group_email_series(frame)
+    assert sorted(emailSeries) == sorted(frame.article_type.unique())
+    for articleType, series in emailSeries.items():
+        rows = frame[frame.article_type == articleType]
+        assert series.labels.tolist() == rows.send_time_date.str[:10].tolist()
+        for column in ["delivered", "unique_opens", "unique_clicks", "ind_open_rate", "ind_click_rate"]:
+            assert_same(series[column].astype(rows[column].dtype), rows[column].to_numpy(), column)
+        assert_same(series["unique_opens_rate"], (rows.unique_opens / rows.delivered).to_numpy(), articleType)
+
+
+def test_empty_series_draws_empty_lines():
+    # a cleared article type dropdown, or a type that is gone after a reload
+    series = datastore.empty_email_series()
+    assert len(series) == 0 and series.labels.tolist() == []
+    assert sorted(series.columns) == sorted(datastore.emailSeriesList)
+    assert len(series.between("2020-01-01", "2020-12-31")) == 0
+    line = {"x": series.labels, "y": series["unique_opens_rate"], "mode": "lines+markers"}
+    encoded = json.loads(json.dumps(line, cls=plotly.utils.PlotlyJSONEncoder))
+    assert encoded == {"x": [], "y": [], "mode": "lines+markers"}
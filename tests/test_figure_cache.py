@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the figure cache: a figure is computed once per inputs and data version, entries of a reloaded dataset are
+dropped, and the least recently used entries are evicted first.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import collections
+import shutil
+
+import pytest
+
+import datastore
+import figure_cache
+
+#--------------------------------------------Helpers----------------------------------------------------------------
+
+def cut_web_stats(source, folder):
+    """
+    Copy a data folder without the last row of webStat.csv
+    :return: bytes of the row left out, to append later
+    """
+    shutil.copytree(str(source), str(folder))
+    lines = source.joinpath("webStat.csv").read_bytes().splitlines(keepends=True)
+    folder.joinpath("webStat.csv").write_bytes(b"".join(lines[:-1]))
+    return lines[-1]
+
+
+def counted_callbacks(figureCache, store):
+    """
+    :return: (dict of name -> memoized callback of one argument, Counter of the calls of each callback)
+    """
+    calls = collections.Counter()
+    def callback(name, datasetName):
+        @figureCache.memoize(name, [datasetName])
+        def figure(value):
+            calls[name, value] += 1
+            return {"data": [{"x": [value], "y": [store.get(datasetName).version]}]}
+        return figure
+    return {"web": callback("web", "web"), "email": callback("email", "email")}, calls
+
+#--------------------------------------------Figure cache-----------------------------------------------------------
+
+@pytest.mark.parametrize("backend", ["memory", "file"])
+def test_reload_drops_the_figures_of_the_dataset(source, tmp_path, backend):
+    folder = tmp_path.joinpath("data")
+    lastRow = cut_web_stats(source, folder)
+    store = datastore.DataStore(datastore.DATASETS, folder)
+    figureCache = figure_cache.make_figure_cache(store, backend, 16, tmp_path.joinpath("figures"))
+    callbacks, calls = counted_callbacks(figureCache, store)
+
+    first = callbacks["web"](1)
+    callbacks["email"](1)
+    assert callbacks["web"](1) == first
+    callbacks["email"](1)
+    assert calls == {("web", 1): 1, ("email", 1): 1}
+    assert len(figureCache.backend) == 2
+
+    with open(folder.joinpath("webStat.csv"), "ab") as f:
+        f.write(lastRow)
+    assert store.refresh() == ["web"]
+    assert len(figureCache.backend) == 1   # only the email figure is left
+
+    assert callbacks["web"](1) != first    # computed again, from the new snapshot
+    callbacks["email"](1)
+    assert calls == {("web", 1): 2, ("email", 1): 1}
+    assert figureCache.stats()["callbacks"] == {"web": {"hits": 1, "misses": 2}, "email": {"hits": 2, "misses": 1}}
+
+
+def test_least_recently_used_figures_are_evicted(source, tmp_path):
+    folder = tmp_path.joinpath("data")
+    shutil.copytree(str(source), str(folder))
+    store = datastore.DataStore(datastore.DATASETS, folder)
+    figureCache = figure_cache.FigureCache(store, figure_cache.MemoryBackend(2))
+    callbacks, calls = counted_callbacks(figureCache, store)
+    web = callbacks["web"]
+
+    web(1)
+    web(2)
+    web(1)   # a hit: 2 is now the least recently used
+    web(3)   # evicts 2
+    assert len(figureCache.backend) == 2
+    web(1)
+    web(3)
+    assert calls == {("web", 1): 1, ("web", 2): 1, ("web", 3): 1}
+    web(2)
+    assert calls[("web", 2)] == 2
+
+
+def test_off_cache_computes_every_call(source, tmp_path):
+    folder = tmp_path.joinpath("data")
+    shutil.copytree(str(source), str(folder))
+    store = datastore.DataStore(datastore.DATASETS, folder)
+    callbacks, calls = counted_callbacks(figure_cache.make_figure_cache(store, "off"), store)
+    callbacks["web"](1)
+    callbacks["web"](1)
+    assert calls == {("web", 1): 2}
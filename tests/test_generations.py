@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the shared generations: the server processes that attach to a generation must read the values the process
+that published it built.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import json
+import shutil
+
+import numpy as np
+
+import datastore
+import generations
+from helpers import assert_same
+
+#--------------------------------------------Generations------------------------------------------------------------
+
+def test_generation_holds_the_published_values(source, tmp_path):
+    folder = tmp_path.joinpath("data")
+    shutil.copytree(str(source), str(folder))
+    shared = generations.Generations(tmp_path.joinpath("generations"))
+    publisher = datastore.DataStore(datastore.DATASETS, folder, generations=shared)
+    built = datastore.DataStore(datastore.DATASETS, folder)
+    attached = datastore.DataStore(datastore.DATASETS, folder, generations=shared)
+
+    for dataset in datastore.DATASETS:
+        name = dataset.name
+        publisher.get(name)
+        fieldNames = [field.name for field in dataset.fields if field.shared]
+        expected, snapshot = built.get(name), attached.get(name)
+        assert sorted(snapshot.values) == sorted(fieldNames)
+        for fieldName in fieldNames:
+            assert_same(snapshot.values[fieldName], expected.values[fieldName], "%s.%s" % (name, fieldName))
+
+
+def test_geo_shapes_are_shared_as_arrays(source, tmp_path):
+    folder = tmp_path.joinpath("data")
+    shutil.copytree(str(source), str(folder))
+    shared = generations.Generations(tmp_path.joinpath("generations"))
+    datastore.DataStore(datastore.DATASETS, folder, generations=shared).get("web")
+    web = datastore.DataStore(datastore.DATASETS, folder, generations=shared).get("web")
+
+    geoJson = datastore.load_geo_json(folder.joinpath("world_geo_json.json"), web.geoCountries, datastore.GEO_PRECISION)
+    assert web.geoShapes.to_geo_json() == geoJson
+    assert isinstance(web.geoShapes.points.base, np.memmap)
+
+    # the manifest only holds small json values: no geo json or figure is copied into every process
+    manifest = shared.current("web").joinpath("manifest.json")
+    assert "coordinates" not in manifest.read_text()
+    assert len(json.dumps(json.load(open(manifest))["fields"]["geoShapes"])) < 1000
+
+
+def test_geo_shapes_keep_polygons_and_multipolygons():
+    geoJson = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "id": "AAA", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [
+            [[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 0.0]]]}},
+        {"type": "Feature", "id": "BBB", "properties": {}, "geometry": {"type": "MultiPolygon", "coordinates": [
+            [[[2.0, 0.0], [3.0, 0.0], [3.0, 1.0], [2.0, 0.0]], [[2.1, 0.1], [2.2, 0.1], [2.2, 0.2], [2.1, 0.1]]],
+            [[[5.0, 5.0], [6.0, 5.0], [6.0, 6.0], [5.0, 5.0]]]]}},
+    ]}
+    shapes = datastore.GeoShapes(geoJson)
+    assert len(shapes) == 2
+    assert shapes.to_geo_json() == geoJson
@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the simplified geo json of the Choropleth map: coordinates rounded to a grid, without the points and the
+rings that collapse.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import json
+import shutil
+
+import pytest
+
+import datastore
+
+#--------------------------------------------Rings------------------------------------------------------------------
+
+SQUARE = [[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]]
+
+def test_points_are_rounded_and_deduplicated():
+    ring = [[0.01, 0.02], [0.04, -0.01], [1.04, 0.0], [0.96, 1.01], [0.0, 1.0], [0.01, 0.02]]
+    assert datastore.quantize_ring(ring, 1) == SQUARE
+
+
+@pytest.mark.parametrize("ring", [
+    [[0.0, 0.0], [1.0, 0.0], [2.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]],   # a spike
+    [[0.0, 0.0], [1.0, 0.0], [2.0, 0.0], [3.0, 0.0], [2.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]],
+    [[0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [-1.0, 1.0], [0.0, 1.0], [0.0, 0.0]],  # ends with a spike
+    [[-1.0, 0.0], [0.0, 0.0], [1.0, 0.0], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0], [-1.0, 0.0]],  # starts with a spike
+])
+def test_spikes_are_removed(ring):
+    quantized = datastore.quantize_ring(ring, 1)
+    assert quantized[0] == quantized[-1]
+    assert sorted(map(tuple, quantized[:-1])) == sorted(map(tuple, SQUARE[:-1]))
+
+
+@pytest.mark.parametrize("ring", [
+    [[0.01, 0.01], [0.02, 0.02], [0.01, 0.03], [0.01, 0.01]],            # smaller than a grid cell
+    [[0.0, 0.0], [1.0, 0.0], [0.0, 0.0], [1.0, 0.0], [0.0, 0.0]],        # a line, back and forth
+    [[0.0, 0.0], [1.0, 0.0], [1.04, 0.01], [0.0, 0.0]],                  # 2 points left after rounding
+])
+def test_degenerate_rings_are_dropped(ring):
+    assert datastore.quantize_ring(ring, 1) is None
+
+#--------------------------------------------Geo json---------------------------------------------------------------
+
+def test_shared_border_stays_the_same():
+    # 2 countries share the border x = 1, drawn in opposite directions with slightly different coordinates
+    left = [[0.0, 0.0], [1.01, 0.0], [0.99, 0.52], [1.0, 1.0], [0.0, 1.0], [0.0, 0.0]]
+    right = [[1.0, 0.0], [2.0, 0.0], [2.0, 1.0], [1.01, 1.02], [1.0, 0.48], [1.0, 0.0]]
+    geoJson = {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "id": "AAA", "properties": {"name": "A"},
+         "geometry": {"type": "Polygon", "coordinates": [left]}},
+        {"type": "Feature", "id": "BBB", "properties": {"name": "B"},
+         "geometry": {"type": "Polygon", "coordinates": [right]}},
+        {"type": "Feature", "id": "CCC", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [SQUARE]}},
+    ]}
+    simplified = datastore.simplify_geo_json(geoJson, {"AAA", "BBB"}, 1)
+    leftRing, rightRing = [feature["geometry"]["coordinates"][0] for feature in simplified["features"]]
+    border = {(1.0, 0.0), (1.0, 0.5), (1.0, 1.0)}
+    assert {tuple(point) for point in leftRing if point[0] == 1.0} == border
+    assert {tuple(point) for point in rightRing if point[0] == 1.0} == border
+    assert all(feature["properties"] == {} for feature in simplified["features"])
+
+
+def test_simplified_copy_is_cached(source, tmp_path, monkeypatch):
+    folder = tmp_path.joinpath("data")
+    shutil.copytree(str(source), str(folder))
+    geoPath = folder.joinpath("world_geo_json.json")
+    keepIds = {feature["id"] for feature in json.loads(geoPath.read_text())["features"][:5]}
+    simplified = datastore.load_geo_json(geoPath, keepIds, "1")
+    assert sorted(feature["id"] for feature in simplified["features"]) == sorted(keepIds)
+    assert folder.joinpath("world_geo_json.simplified-p1.json").exists()
+
+    def simplify_geo_json(*args):
+        raise AssertionError("the geo json was simplified again")
+    with monkeypatch.context() as patch:
+        patch.setattr(datastore, "simplify_geo_json", simplify_geo_json)
+        assert datastore.load_geo_json(geoPath, keepIds, "1") == simplified
+        with pytest.raises(AssertionError):
+            datastore.load_geo_json(geoPath, keepIds - {min(keepIds)}, "1")   # other countries
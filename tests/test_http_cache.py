@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the key of the callback ETags: it must change with everything that changes the responses.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import pytest
+
+import http_cache
+
+#--------------------------------------------ETags------------------------------------------------------------------
+
+@pytest.mark.parametrize("name, value", [
+    ("CAS_CLIENTSIDE_CHARTS", "1"),
+    ("CAS_GEO_PRECISION", "full"),
+    ("CAS_CHART_POINTS", "0"),
+    ("CAS_FAST_JSON", "0"),
+])
+def test_code_key_changes_with_the_response_settings(monkeypatch, name, value):
+    monkeypatch.delenv(name, raising=False)
+    codeKey = http_cache.code_key()
+    assert http_cache.code_key() == codeKey
+    monkeypatch.setenv(name, value)
+    assert http_cache.code_key() != codeKey
+
+
+def test_code_key_ignores_other_settings(monkeypatch):
+    codeKey = http_cache.code_key()
+    monkeypatch.setenv("CAS_RELOAD_INTERVAL", "5")
+    assert http_cache.code_key() == codeKey
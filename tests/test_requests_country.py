@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the parsed `requests_country` table of webStat.csv and of its binary cache.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import datastore
+from helpers import assert_same
+
+#--------------------------------------------Parsing----------------------------------------------------------------
+
+def test_parse_requests_country():
+    dates = pd.Series(["2020-05-15", "2020-05-16", "2020-05-17"])
+    requests = pd.Series(["{'US': 12, 'CN': 3}", "{}", "{'CN': 5, 'DE': 1}"])
+    table = datastore.parse_requests_country(dates, requests)
+
+    assert table["countries"].tolist() == ["US", "CN", "DE"]   # codes in order of first appearance
+    assert table["row_ptr"].tolist() == [0, 2, 2, 4]           # the second date has no requests
+    assert table["date_idx"].tolist() == [0, 0, 2, 2]
+    assert table["country_idx"].tolist() == [0, 1, 1, 2]
+    assert table["requests"].tolist() == [12, 3, 5, 1]
+
+#--------------------------------------------Cache------------------------------------------------------------------
+
+def test_broken_cache_is_rebuilt(source, tmp_path):
+    folder = tmp_path.joinpath("data")
+    shutil.copytree(str(source), str(folder))
+    expected = datastore.DataStore(datastore.DATASETS, folder).get("web").countryRequests
+    cachePath = folder.joinpath("webStat.requests_country.npz")
+    with np.load(cachePath, allow_pickle=False) as cache:
+        cached = {key: cache[key] for key in cache.files}
+    raw = cachePath.read_bytes()
+    cachePath.write_bytes(raw[:len(raw) // 3])   # e.g. a crash while it was written
+
+    web = datastore.DataStore(datastore.DATASETS, folder).get("web")
+    assert_same(web.countryRequests, expected, "countryRequests")
+
+    # written again, whole. Not compared byte for byte: the zip entries are stamped with the time they were written
+    with np.load(cachePath, allow_pickle=False) as cache:
+        assert_same({key: cache[key] for key in cache.files}, cached, "cache")
+    assert not list(folder.glob("*.tmp"))
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the fast json encoding of the responses: the same json as the plotly encoder.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import json
+
+import numpy as np
+import plotly.graph_objects as go
+
+import serialization
+
+#--------------------------------------------Helpers----------------------------------------------------------------
+
+def sample_figure():
+    figure = go.Figure(go.Scatter(x=np.datetime64("2020-01-01") + np.arange(3), y=[1.0, np.nan, 3.0], name="reads"))
+    figure.update_layout(title="reads", margin=dict(t=20))
+    figure.frames = [go.Frame(data=[go.Scatter(y=[3, 2, 1])], name="reversed")]
+    return figure
+
+
+def plotly_json(value):
+    """
+    :return: the value encoded with the plotly encoder, and decoded. The figures hold numpy arrays
+    """
+    return json.loads(json.dumps(value, cls=serialization.PLOTLY_ENCODER))
+
+
+class PublicFigure(object):
+    """
+    A figure with only the public method of plotly figures
+    """
+
+    def __init__(self, figure):
+        self.figure = figure
+
+    def to_plotly_json(self):
+        return self.figure.to_plotly_json()
+
+#--------------------------------------------Figures----------------------------------------------------------------
+
+def test_figure_dict_is_the_plotly_json():
+    figure = sample_figure()
+    assert plotly_json(serialization.figure_dict(figure)) == plotly_json(figure.to_plotly_json())
+    assert serialization.figure_dict(figure)["frames"][0]["name"] == "reversed"
+
+
+def test_figure_dict_without_the_private_attributes():
+    figure = sample_figure()
+    assert plotly_json(serialization.figure_dict(PublicFigure(figure))) == plotly_json(figure.to_plotly_json())
+
+
+def test_fast_encoder_writes_the_same_json():
+    figure = sample_figure()
+    response = {"response": {"chart": {"figure": figure}}, "labels": np.array(["2020-01-01", "2020-01-02"])}
+    fast = json.loads(json.dumps(response, cls=serialization.FastJSONEncoder))
+    assert fast == plotly_json(response)
+    assert fast["response"]["chart"]["figure"]["data"][0]["y"] == [1.0, None, 3.0]
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the date indexed series of timeseries.py and of their weekly and monthly rollups.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import numpy as np
+import pandas as pd
+import pytest
+
+from helpers import assert_same
+from timeseries import TimeSeries, Rollups, bucket_starts, roll_up
+
+#--------------------------------------------Helpers----------------------------------------------------------------
+
+def daily_frame(start, days):
+    """
+    :return: DataFrame with `days` dates from `start` and a `reads` column 0, 1, 2...
+    """
+    return pd.DataFrame({"date": pd.date_range(start, periods=days).strftime("%Y-%m-%d"), "reads": np.arange(days)})
+
+#--------------------------------------------Time series------------------------------------------------------------
+
+def test_between_includes_both_ends():
+    series = TimeSeries.from_frame(daily_frame("2020-01-01", 50), ["reads"])
+    part = series.between("2020-01-15", "2020-01-25T00:00:00")   # the date picker sends both forms
+    assert part.labels.tolist()[0] == "2020-01-15" and part.labels.tolist()[-1] == "2020-01-25"
+    assert part["reads"].tolist() == list(range(14, 25))
+    assert np.shares_memory(part["reads"], series["reads"])      # a view, not a copy
+
+
+def test_between_outside_the_dates_is_empty():
+    series = TimeSeries.from_frame(daily_frame("2020-01-01", 10), ["reads"])
+    assert len(series.between("2019-01-01", "2019-12-31")) == 0
+    assert len(series.between("2020-03-01", "2020-03-31")) == 0
+    assert len(series.between("2020-01-08", "2020-01-03")) == 0   # start after end
+    assert series.range("2019-12-01", "2020-01-03") == slice(0, 3)
+
+
+def test_missing_dates_are_skipped():
+    frame = daily_frame("2020-01-01", 10).drop(index=[3, 4, 5]).reset_index(drop=True)
+    series = TimeSeries.from_frame(frame, ["reads"])
+    assert series.between("2020-01-04", "2020-01-07")["reads"].tolist() == [6]
+
+
+def test_unsorted_dates_are_refused():
+    frame = daily_frame("2020-01-01", 5).iloc[::-1]
+    with pytest.raises(ValueError):
+        TimeSeries.from_frame(frame, ["reads"])
+
+
+def test_extended_series_match_a_fresh_series():
+    frame = daily_frame("2020-01-01", 50)
+    extended = TimeSeries.from_frame(frame.iloc[:20], ["reads"]).extend(frame.iloc[20:])
+    fresh = TimeSeries.from_frame(frame, ["reads"])
+    assert_same(extended, fresh, "series")
+    assert_same(extended.between("2020-01-15", "2020-01-25"), fresh.between("2020-01-15", "2020-01-25"), "between")
+    with pytest.raises(ValueError):
+        fresh.extend(frame.iloc[:5])   # dates before the last date
+
+#--------------------------------------------Rollups----------------------------------------------------------------
+
+def test_weeks_start_on_monday():
+    dates = np.datetime64("2020-02-01") + np.arange(10)   # Saturday 1st to Monday 10th
+    assert bucket_starts(dates, "week").astype(str).tolist() == ["2020-01-27"] * 2 + ["2020-02-03"] * 7 + ["2020-02-10"]
+    assert bucket_starts(np.array(["1969-12-31"], dtype="datetime64[D]"), "week").astype(str).tolist() == ["1969-12-29"]
+    assert set(bucket_starts(dates, "month").astype(str).tolist()) == {"2020-02-01"}
+
+
+def test_roll_up_sums_lasts_and_ratios():
+    dates = np.datetime64("2020-01-29") + np.arange(14)   # Wednesday 29th to Tuesday 11th
+    series = TimeSeries(dates, {"reads": np.arange(14), "total": np.arange(14) * 10, "visitors": np.full(14, 2)})
+    rules = {"reads": "sum", "total": "last", "per_visitor": ("ratio", "reads", "visitors")}
+
+    weeks = roll_up(series, "week", rules)
+    assert weeks.labels.tolist() == ["2020-01-27", "2020-02-03", "2020-02-10"]
+    assert weeks["reads"].tolist() == [10, 56, 25]
+    assert weeks["total"].tolist() == [40, 110, 130]
+    assert weeks["per_visitor"].tolist() == [1.0, 4.0, 6.25]
+
+    months = roll_up(series, "month", rules)
+    assert months.labels.tolist() == ["2020-01-01", "2020-02-01"]
+    assert months["reads"].tolist() == [3, 88]
+    assert months["total"].tolist() == [20, 130]
+    assert roll_up(series, "day", rules) is series
+
+
+def test_ratio_without_denominator_is_nan():
+    series = TimeSeries(np.datetime64("2020-02-03") + np.arange(14), {"reads": np.repeat([0, 1], 7), "visitors": np.repeat([0, 1], 7)})
+    weeks = roll_up(series, "week", {"per_visitor": ("ratio", "reads", "visitors")})
+    assert np.isnan(weeks["per_visitor"][0]) and weeks["per_visitor"][1] == 1.0
+
+
+@pytest.mark.parametrize("cut", [1, 6, 30, 31, 200, 399])
+def test_extended_rollups_match_built_rollups(cut):
+    rng = np.random.default_rng(cut)
+    dates = np.datetime64("2019-01-03") + np.arange(400)
+    pageviews, visitors = rng.integers(1, 500, len(dates)), rng.integers(1, 50, len(dates))
+    series = TimeSeries(dates, {"new": rng.integers(0, 100, len(dates)), "total": rng.integers(0, 1000, len(dates)).cumsum(),
+                                "pageviews": pageviews, "visitors": visitors})
+    rules = {"new": "sum", "total": "last", "pageviews": "sum", "visitors": "sum",
+             "per_visitor": ("ratio", "pageviews", "visitors")}
+    # cut in the middle of a week and of a month, at their ends, and after the first day
+    head = TimeSeries(dates[:cut], {name: column[:cut] for name, column in series.columns.items()})
+    assert_same(Rollups.build(head, rules).extend(series), Rollups.build(series, rules), "rollups")
@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+
+"""
+Tests of the cumulative web stats, read from the prefix sums of the daily stats: the totals of a date range must
+equal the running sums of its rows, whatever part of the range is visible.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import shutil
+
+import numpy as np
+import pytest
+
+import datastore
+from helpers import assert_same
+
+#--------------------------------------------Prefix sums------------------------------------------------------------
+
+def test_prefix_sums_start_with_zeros():
+    matrix = np.array([[1, 10], [2, 20], [3, 30]])
+    assert datastore.prefix_sums(matrix).tolist() == [[0, 0], [1, 10], [3, 30], [6, 60]]
+
+
+@pytest.mark.parametrize("rows, visible", [
+    (slice(0, 6), slice(0, 6)),   # all the rows
+    (slice(2, 6), slice(2, 6)),   # a date range
+    (slice(2, 6), slice(4, 5)),   # zoomed in the date range: the totals still start at the range
+    (slice(2, 6), slice(6, 6)),   # zoomed out of the data
+    (slice(3, 3), slice(3, 3)),   # no dates in the range
+])
+def test_running_sums_of_a_window(rows, visible):
+    matrix = np.arange(24).reshape(6, 4) ** 2
+    expected = matrix[rows].cumsum(axis=0)[visible.start - rows.start:visible.stop - rows.start]
+    assert_same(datastore.running_sums(datastore.prefix_sums(matrix), rows, visible), expected.reshape(-1, 4), "sums")
+
+
+def test_running_sums_of_the_web_stats(source, tmp_path):
+    folder = tmp_path.joinpath("data")
+    shutil.copytree(str(source), str(folder))
+    web = datastore.DataStore(datastore.DATASETS, folder).get("web")
+    labels = web.webSeries.labels
+
+    startDate, endDate = labels[100], labels[400]
+    rows = web.webSeries.range(startDate, endDate)
+    visible = web.webSeries.range(labels[250], labels[300] + "T00:00:00")   # the zoomed x range, as plotly sends it
+    inRange = web.df2[(web.df2.date >= startDate) & (web.df2.date <= endDate)]
+    expected = inRange[datastore.webCumStatsList].cumsum().to_numpy()[150:201]
+    assert_same(datastore.running_sums(web.webCumSums, rows, visible), expected, "cumSums")
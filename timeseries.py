@@ -0,0 +1,233 @@
+# -*- coding: utf-8 -*-
+
+"""
+Date indexed series for the date picker callbacks.
+The dates are parsed once into datetime64 and must be sorted, so a date range is found with 2 binary searches and
+the columns of the range are numpy views, not copies. Rollups keep the same series summed per week and per month.
+The "YYYY-MM-DD" labels of the dates, sent as the x values of the charts, are also made once per series: a range
+slices them like the columns instead of formatting its dates on every call.
+
+"""
+
+#--------------------------------------------Imports----------------------------------------------------------------
+import numpy as np
+
+#--------------------------------------------Time series------------------------------------------------------------
+
+def to_day(value):
+    """
+    :param value: date string like "2020-05-15" or "2020-05-15T00:00:00" (the date picker sends both), or a date
+    :return: numpy datetime64 day
+    """
+    return np.datetime64(str(value)[:10], "D")
+
+
+def date_labels(dates):
+    """
+    :param dates: numpy datetime64[D] array
+    :return: numpy array of the "YYYY-MM-DD" strings of the dates (fixed width, so it can be memory mapped)
+    """
+    return np.datetime_as_string(dates, unit="D").astype("U10")
+
+
+class TimeSeries(object):
+    """
+    Immutable columns that share one sorted date index
+
+        series = TimeSeries.from_frame(df3, ["new", "total"])
+        part = series.between("2020-05-15", "2020-06-20")
+        part.dates, part.labels, part["new"]
+    """
+
+    def __init__(self, dates, columns, labels=None):
+        """
+        :param dates: numpy datetime64[D] array, sorted. Use `from_frame` to parse and check a date column
+        :param columns: dict of column name -> numpy array, same length as `dates`
+        :param labels: date_labels() of the dates, e.g. a slice of the labels of a longer series. None makes them
+        """
+        for name, column in columns.items():
+            if len(column) != len(dates):
+                raise ValueError("column %r has %d values for %d dates" % (name, len(column), len(dates)))
+        self.dates = dates
+        self.columns = columns
+        self.labels = labels if labels is not None else date_labels(dates)
+
+    @classmethod
+    def from_frame(cls, frame, columns, dateColumn="date"):
+        """
+        :param frame: pandas dataframe sorted by `dateColumn`
+        :param columns: names of the columns to keep
+        :param dateColumn: name of the date column
+        :return: TimeSeries
+        """
+        dates = np.asarray(frame[dateColumn], dtype="datetime64[D]")
+        if len(dates) > 1 and not (dates[1:] >= dates[:-1]).all():
+            raise ValueError("the dates of a time series must be sorted")
+        return cls(dates, {name: frame[name].to_numpy() for name in columns})
+
+    def extend(self, frame, dateColumn="date"):
+        """
+        :param frame: pandas dataframe with the rows appended after the last date
+        :param dateColumn: name of the date column
+        :return: new TimeSeries with the rows of `frame` added at the end
+        """
+        return self.extend_series(TimeSeries.from_frame(frame, list(self.columns), dateColumn))
+
+    def extend_series(self, tail):
+        """
+        :param tail: TimeSeries with the same columns and dates after the last date of this series
+        :return: new TimeSeries with the rows of `tail` added at the end
+        """
+        if len(self) and len(tail) and tail.dates[0] < self.dates[-1]:
+            raise ValueError("the appended dates must not be before the last date of the series")
+        return TimeSeries(np.concatenate([self.dates, tail.dates]),
+                          {name: np.concatenate([column, tail.columns[name]]) for name, column in self.columns.items()},
+                          np.concatenate([self.labels, tail.labels]))
+
+    def range(self, startDate, endDate):
+        """
+        :param startDate: first date of the range, included
+        :param endDate: last date of the range, included
+        :return: slice of the positions of the range
+        """
+        start = np.searchsorted(self.dates, to_day(startDate), side="left")
+        stop = np.searchsorted(self.dates, to_day(endDate), side="right")
+        return slice(start, max(start, stop))
+
+    def between(self, startDate, endDate):
+        """
+        :param startDate: first date of the range, included
+        :param endDate: last date of the range, included
+        :return: TimeSeries of the range. Its arrays are views of the arrays of this series
+        """
+        return self.rows(self.range(startDate, endDate))
+
+    def rows(self, positions):
+        """
+        :param positions: slice of row positions
+        :return: TimeSeries of these rows. Its arrays are views of the arrays of this series
+        """
+        return TimeSeries(self.dates[positions], {name: column[positions] for name, column in self.columns.items()},
+                          self.labels[positions])
+
+    def to_dict(self):
+        """
+        :return: dict with the "date" strings and the values of every column, in lists (e.g. for a dcc.Store)
+        """
+        data = {"date": self.labels.tolist()}
+        data.update((name, column.tolist()) for name, column in self.columns.items())
+        return data
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def __len__(self):
+        return len(self.dates)
+
+#--------------------------------------------Rollups----------------------------------------------------------------
+
+#granularity levels of the rollups, finest first
+LEVELS = ["day", "week", "month"]
+
+def bucket_starts(dates, level):
+    """
+    :param dates: numpy datetime64[D] array
+    :param level: one of LEVELS
+    :return: numpy datetime64[D] array with the first day of the bucket of every date. Weeks start on Monday
+    """
+    if level == "week":
+        days = dates.astype("datetime64[D]").astype("int64")
+        return ((days - 4) // 7 * 7 + 4).astype("datetime64[D]")  # 1970-01-05, day 4, is a Monday
+    if level == "month":
+        return dates.astype("datetime64[M]").astype("datetime64[D]")
+    return dates
+
+
+def roll_up(series, level, rules):
+    """
+    Aggregate a daily series per bucket
+    :param series: daily TimeSeries
+    :param level: one of LEVELS
+    :param rules: dict of column name -> how the column is aggregated:
+        "sum": sum of the days
+        "last": value of the last day (e.g. a running total)
+        ("ratio", numerator, denominator): sum of the numerator column divided by the sum of the denominator column
+    :return: TimeSeries with one row per bucket, dated with the first day of the bucket
+    """
+    if level == "day" or not len(series):
+        return series
+    dates, starts = np.unique(bucket_starts(series.dates, level), return_index=True)
+    lasts = np.append(starts[1:], len(series)) - 1
+
+    columns = {}
+    sums = {}
+    def summed(name):
+        if name not in sums:
+            sums[name] = np.add.reduceat(series[name], starts)
+        return sums[name]
+    for name, rule in rules.items():
+        if rule == "sum":
+            columns[name] = summed(name)
+        elif rule == "last":
+            columns[name] = series[name][lasts]
+        else:
+            _, numerator, denominator = rule
+            with np.errstate(divide="ignore", invalid="ignore"):  # no denominator: NaN, like pandas
+                columns[name] = summed(numerator) / summed(denominator)
+    return TimeSeries(dates, columns)
+
+
+class Rollups(object):
+    """
+    A daily series and its weekly and monthly rollups
+
+        rollups = Rollups.build(dailySeries, {"reads": "sum", "total": "last"})
+        rollups.between("week", "2020-05-15", "2020-06-20")
+    """
+
+    def __init__(self, levels, rules):
+        """
+        :param levels: dict of level -> TimeSeries, for every level of LEVELS
+        :param rules: dict of column name -> aggregation, see roll_up()
+        """
+        self.levels = levels
+        self.rules = rules
+
+    @classmethod
+    def build(cls, series, rules):
+        """
+        :param series: daily TimeSeries
+        :param rules: dict of column name -> aggregation, see roll_up()
+        :return: Rollups
+        """
+        return cls({level: roll_up(series, level, rules) for level in LEVELS}, rules)
+
+    def extend(self, series):
+        """
+        :param series: the daily series, with new rows appended after the rows this rollup was built from
+        :return: new Rollups. Only the last bucket of each level and the new buckets are aggregated again
+        """
+        levels = {"day": series}
+        for level in LEVELS[1:]:
+            previous = self.levels[level]
+            if not len(previous):
+                levels[level] = roll_up(series, level, self.rules)
+                continue
+            # the days of the last (maybe incomplete) bucket and the days after it
+            first = np.searchsorted(series.dates, previous.dates[-1], side="left")
+            tail = roll_up(series.rows(slice(first, None)), level, self.rules)
+            levels[level] = previous.rows(slice(0, len(previous) - 1)).extend_series(tail)
+        return Rollups(levels, self.rules)
+
+    def between(self, level, startDate, endDate):
+        """
+        :param level: one of LEVELS
+        :param startDate: first date of the range, included
+        :param endDate: last date of the range, included
+        :return: TimeSeries of the buckets that overlap the range
+        """
+        firstBucket = bucket_starts(np.array([to_day(startDate)]), level)[0]
+        return self.levels[level].between(firstBucket, endDate)
+
+    def __getitem__(self, level):
+        return self.levels[level]